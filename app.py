@@ -2,16 +2,18 @@
 # app.py
 from fastapi import FastAPI
 from db import Base, engine
-from auth_middleware import basic_auth_middleware
+from auth_middleware import BasicAuthMiddleware
 
 import models  
+from migrations import run_migrations
 
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 import controllers  
 
 app = FastAPI()
-app.middleware("http")(basic_auth_middleware())
+app.add_middleware(BasicAuthMiddleware)
 app.include_router(controllers.router)
 
 if __name__ == "__main__":
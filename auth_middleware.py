@@ -1,18 +1,287 @@
 # auth_middleware.py
+import os
+import hmac
 import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Optional
+
 from fastapi import Request
 from fastapi.responses import JSONResponse
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
 from db import SessionLocal
 from models import User
+from auth_tokens import verify_token
+
+# successful verifications kept in memory; 0 disables the cache
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+# failed verifications are remembered only briefly (blunts repeated bad guesses)
+AUTH_NEGATIVE_TTL = float(os.getenv("AUTH_NEGATIVE_TTL", "5"))
+# failed verifications have their own, smaller LRU so bad guesses cannot evict real users
+AUTH_NEGATIVE_CACHE_SIZE = int(os.getenv("AUTH_NEGATIVE_CACHE_SIZE", "256"))
+# comma-separated usernames allowed to act on other users' predictions (e.g. bulk delete)
+ADMIN_USERS = frozenset(u.strip() for u in os.getenv("ADMIN_USERS", "").split(",") if u.strip())
+
+
+def is_admin(username: Optional[str]) -> bool:
+    return bool(username) and username in ADMIN_USERS
+
+
+class CredentialCache:
+    """
+    Bounded LRU of verify_user results keyed by (username, HMAC of the password).
+    Plain passwords are never stored; the HMAC key is random per process.
+    Failed verifications live in a separate LRU of `max_negative_entries`, so a
+    stream of distinct bad passwords only evicts other failures.
+    Entries for a user are dropped as soon as the users row changes (see the
+    SQLAlchemy listeners below), and `generation` keeps a lookup that raced with
+    such a change from storing its stale result.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0, negative_ttl: float = 5.0,
+                 max_negative_entries: int = 256):
+        self.max_entries = max(0, int(max_entries))
+        self.max_negative_entries = max(0, int(max_negative_entries))
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()     # successful verifications
+        self._negative = OrderedDict()    # failed verifications
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _cache_key(self, username: str, password: str):
+        digest = hmac.new(self._key, f"{username}\0{password}".encode("utf-8"), hashlib.sha256).digest()
+        return username, digest
+
+    def get(self, username: str, password: str) -> Optional[bool]:
+        if not self.enabled:
+            return None
+        key = self._cache_key(username, password)
+        with self._lock:
+            for entries in (self._entries, self._negative):
+                entry = entries.get(key)
+                if entry is None:
+                    continue
+                if entry[1] > monotonic():
+                    entries.move_to_end(key)
+                    if entry[0]:
+                        self._hits += 1
+                    else:
+                        self._negative_hits += 1
+                    return entry[0]
+                del entries[key]
+            self._misses += 1
+        return None
+
+    def put(self, username: str, password: str, ok: bool, generation: int) -> None:
+        ttl, entries, limit = (
+            (self.ttl, self._entries, self.max_entries) if ok
+            else (self.negative_ttl, self._negative, self.max_negative_entries)
+        )
+        if not self.enabled or ttl <= 0 or limit <= 0:
+            return
+        key = self._cache_key(username, password)
+        with self._lock:
+            if generation != self.generation:
+                return
+            entries[key] = (ok, monotonic() + ttl)
+            entries.move_to_end(key)
+            while len(entries) > limit:
+                entries.popitem(last=False)
+
+    def invalidate(self, username: Optional[str] = None) -> None:
+        """Drops the entries of `username` (all entries when None)."""
+        with self._lock:
+            self.generation += 1
+            self._invalidations += 1
+            for entries in (self._entries, self._negative):
+                if username is None:
+                    entries.clear()
+                    continue
+                for key in [k for k in entries if k[0] == username]:
+                    del entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._negative.clear()
+            self._hits = self._negative_hits = self._misses = self._invalidations = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._hits + self._negative_hits
+            lookups = hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "negative_entries": len(self._negative),
+                "max_negative_entries": self.max_negative_entries,
+                "ttl_seconds": self.ttl,
+                "negative_ttl_seconds": self.negative_ttl,
+                "hits": hits,
+                "positive_hits": self._hits,
+                "negative_hits": self._negative_hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+credential_cache = CredentialCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL, AUTH_NEGATIVE_TTL, AUTH_NEGATIVE_CACHE_SIZE)
+
+
+# A users row can only be re-read with its new values once the transaction commits. Invalidating
+# at flush time would let a concurrent verify_user read the old row and cache it under the new
+# generation, so changed usernames are collected per session and dropped in after_commit.
+_ALL_USERS = object()
+
+
+def _mark_changed(session, username) -> None:
+    changed = session.info.setdefault("changed_users", set())
+    changed.add(username)
+
+
+@event.listens_for(Session, "after_flush")
+def _users_flushed(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, User):
+            _mark_changed(session, obj.username)
+            # a renamed user also loses the entries cached under the old name
+            for old in inspect(obj).attrs.username.history.deleted:
+                _mark_changed(session, old)
+
+
+@event.listens_for(Session, "after_bulk_update")
+@event.listens_for(Session, "after_bulk_delete")
+def _users_bulk_changed(context):
+    # query(User).update()/delete() does not say which rows changed
+    if context.mapper.class_ is User:
+        _mark_changed(context.session, _ALL_USERS)
+
+
+@event.listens_for(Session, "after_commit")
+def _users_committed(session):
+    changed = session.info.pop("changed_users", None)
+    if not changed:
+        return
+    if _ALL_USERS in changed:
+        credential_cache.invalidate()
+        return
+    for username in changed:
+        credential_cache.invalidate(username)
+
+
+@event.listens_for(Session, "after_rollback")
+def _users_rolled_back(session):
+    session.info.pop("changed_users", None)
+
 
 def verify_user(username: str, password: str):
+    cached = credential_cache.get(username, password)
+    if cached is not None:
+        return cached
+    generation = credential_cache.generation
     db = SessionLocal()
     try:
         user = db.query(User).filter_by(username=username, password=password).first()
-        return user is not None
+        ok = user is not None
     finally:
         db.close()
+    credential_cache.put(username, password, ok, generation)
+    return ok
+
+OPEN_PATHS = ("/health",)
+
+
+def _parse_basic(auth: str):
+    """Returns (username, password) from a "Basic <base64>" header value; raises on malformed input."""
+    encoded = auth.split(" ")[1]
+    decoded = base64.b64decode(encoded).decode("utf-8")
+    username, password = decoded.split(":", 1)
+    return username, password
+
+
+def authenticate(auth: str):
+    """
+    Checks an Authorization header value. Returns (username, scheme) or None.
+    "Bearer <token>" is verified by signature alone; anything else is treated
+    as Basic credentials and checked with verify_user.
+    """
+    scheme, _, value = auth.partition(" ")
+    if scheme.lower() == "bearer":
+        username = verify_token(value.strip())
+        return (username, "bearer") if username is not None else None
+    try:
+        username, password = _parse_basic(auth)
+    except Exception:
+        return None
+    if not verify_user(username, password):
+        return None
+    return username, "basic"
+
 
+class BasicAuthMiddleware:
+    """
+    Same rules as `basic_auth_middleware`, as a plain ASGI middleware:
+    `/health` is open, POST /predict takes optional credentials, everything else
+    requires them. Allowed requests are passed to the app untouched, so responses
+    (including large FileResponse bodies) stream straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in OPEN_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        auth = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                auth = value.decode("latin-1")
+                break
+
+        optional = scope["path"] == "/predict" and scope["method"] == "POST"
+        if not auth:
+            if not optional:
+                await self._reject(scope, receive, send, "Missing credentials")
+                return
+            username, auth_scheme = None, None
+        else:
+            result = authenticate(auth)
+            if result is None:
+                await self._reject(scope, receive, send, "Invalid credentials")
+                return
+            username, auth_scheme = result
+
+        state = scope.setdefault("state", {})
+        state["username"] = username
+        state["auth_scheme"] = auth_scheme
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(scope, receive, send, detail: str):
+        response = JSONResponse(status_code=401, content={"detail": detail})
+        await response(scope, receive, send)
+
+
+# call_next-based version (BaseHTTPMiddleware); app.py uses BasicAuthMiddleware
 def basic_auth_middleware():
     async def middleware(request: Request, call_next):
         open_paths = ["/health"]
@@ -25,32 +294,23 @@ def basic_auth_middleware():
         if request.url.path == "/predict" and request.method.upper() == "POST":
             auth = request.headers.get("Authorization")
             if auth:
-                try:
-                    encoded = auth.split(" ")[1]
-                    decoded = base64.b64decode(encoded).decode("utf-8")
-                    username, password = decoded.split(":", 1)
-                except Exception:
+                result = authenticate(auth)
+                if result is None:
                     return JSONResponse(status_code=401, content={"detail": "Invalid credentials"})
-                if not verify_user(username, password):
-                    return JSONResponse(status_code=401, content={"detail": "Invalid credentials"})
-                request.state.username = username
+                request.state.username, request.state.auth_scheme = result
             else:
                 request.state.username = None
+                request.state.auth_scheme = None
             return await call_next(request)
 
         # all other routes require auth
         auth = request.headers.get("Authorization")
         if not auth:
             return JSONResponse(status_code=401, content={"detail": "Missing credentials"})
-        try:
-            encoded = auth.split(" ")[1]
-            decoded = base64.b64decode(encoded).decode("utf-8")
-            username, password = decoded.split(":", 1)
-        except Exception:
-            return JSONResponse(status_code=401, content={"detail": "Invalid credentials"})
-        if not verify_user(username, password):
+        result = authenticate(auth)
+        if result is None:
             return JSONResponse(status_code=401, content={"detail": "Invalid credentials"})
-        request.state.username = username
+        request.state.username, request.state.auth_scheme = result
         return await call_next(request)
 
     return middleware
\ No newline at end of file
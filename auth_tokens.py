@@ -0,0 +1,63 @@
+# auth_tokens.py
+"""
+Short-lived HMAC-signed bearer tokens.
+
+A token is `<payload>.<signature>`, both base64url without padding; the payload
+is JSON {"sub": username, "exp": unix seconds}. Checking one is a single
+HMAC-SHA256 over the payload, with no database access.
+"""
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# must be the same on every replica; without it tokens only work on this process until restart
+AUTH_TOKEN_SECRET = os.getenv("AUTH_TOKEN_SECRET", "")
+AUTH_TOKEN_TTL = int(os.getenv("AUTH_TOKEN_TTL", "900"))
+
+if not AUTH_TOKEN_SECRET:
+    logger.warning("AUTH_TOKEN_SECRET is not set; using a random per-process secret")
+_secret = AUTH_TOKEN_SECRET.encode("utf-8") or os.urandom(32)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue_token(username: str, ttl: Optional[int] = None, now: Optional[float] = None) -> Tuple[str, int]:
+    """Returns (token, expires_at) for `username`, valid for `ttl` seconds."""
+    expires_at = int(now if now is not None else time.time()) + (ttl if ttl is not None else AUTH_TOKEN_TTL)
+    payload = _b64encode(json.dumps({"sub": username, "exp": expires_at}, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}", expires_at
+
+
+def verify_token(token: str, now: Optional[float] = None) -> Optional[str]:
+    """Returns the username of a valid, unexpired token, otherwise None."""
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        claims = json.loads(_b64decode(payload))
+        username, expires_at = claims["sub"], claims["exp"]
+    except (ValueError, KeyError, TypeError, UnicodeError):
+        return None
+    if not isinstance(username, str) or not isinstance(expires_at, int):
+        return None
+    if expires_at <= (now if now is not None else time.time()):
+        return None
+    return username
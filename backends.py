@@ -0,0 +1,224 @@
+# backends.py
+import os
+import ast
+import json
+import shutil
+import logging
+from typing import List
+
+import numpy as np
+from PIL import Image
+
+from imaging import load_image
+from inference import LiteResult, load_yolo
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# torch | onnx | openvino
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").strip().lower()
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "models")
+INFERENCE_IMGSZ = int(os.getenv("INFERENCE_IMGSZ", "640"))
+INFERENCE_CONF = float(os.getenv("INFERENCE_CONF", "0.25"))
+INFERENCE_IOU = float(os.getenv("INFERENCE_IOU", "0.7"))
+INFERENCE_MAX_DET = int(os.getenv("INFERENCE_MAX_DET", "300"))
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+
+def _artifact_paths(weights: str, fmt: str, imgsz: int, cache_dir: str):
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    base = os.path.join(cache_dir, f"{stem}-{imgsz}")
+    artifact = base + ".onnx" if fmt == "onnx" else base + "_openvino_model"
+    return artifact, base + ".names.json"
+
+
+def export_model(weights: str, fmt: str, imgsz: int = INFERENCE_IMGSZ, cache_dir: str = MODEL_CACHE_DIR):
+    """
+    Exports `weights` to `fmt` ("onnx" / "openvino") once and caches the artifact
+    (plus the class names) under `cache_dir`. Returns (artifact_path, names).
+    """
+    artifact, names_path = _artifact_paths(weights, fmt, imgsz, cache_dir)
+    if os.path.exists(artifact) and os.path.exists(names_path):
+        with open(names_path) as f:
+            names = {int(k): v for k, v in json.load(f).items()}
+        return artifact, names
+
+    os.makedirs(cache_dir, exist_ok=True)
+    logger.info(f"Exporting {weights} to {fmt} (imgsz={imgsz}) -> {artifact}")
+    yolo = load_yolo(weights)
+    exported = yolo.export(format=fmt, imgsz=imgsz, dynamic=True, half=False, verbose=False)
+    names = {int(k): v for k, v in dict(yolo.names).items()}
+
+    # move into the cache with an atomic rename so concurrent workers never see half an artifact
+    tmp = f"{artifact}.tmp-{os.getpid()}"
+    if os.path.isdir(exported):
+        shutil.copytree(exported, tmp, dirs_exist_ok=True)
+        if os.path.exists(artifact):
+            shutil.rmtree(tmp, ignore_errors=True)
+        else:
+            os.replace(tmp, artifact)
+    else:
+        shutil.copyfile(exported, tmp)
+        os.replace(tmp, artifact)
+
+    tmp_names = f"{names_path}.tmp-{os.getpid()}"
+    with open(tmp_names, "w") as f:
+        json.dump(names, f)
+    os.replace(tmp_names, names_path)
+    return artifact, names
+
+
+def letterbox(img: np.ndarray, size: int):
+    """Resizes keeping aspect ratio and pads to size x size with gray, like ultralytics LetterBox."""
+    h, w = img.shape[:2]
+    gain = min(size / h, size / w)
+    nh, nw = int(round(h * gain)), int(round(w * gain))
+    if (nh, nw) != (h, w):
+        img = np.asarray(Image.fromarray(img).resize((nw, nh), Image.BILINEAR))
+    top = (size - nh) // 2
+    left = (size - nw) // 2
+    out = np.full((size, size, 3), 114, dtype=np.uint8)
+    out[top:top + nh, left:left + nw] = img
+    return out, gain, (left, top)
+
+
+def preprocess(images: List[np.ndarray], size: int):
+    batch, metas = [], []
+    for img in images:
+        boxed, gain, pad = letterbox(img, size)
+        batch.append(boxed[..., ::-1])  # BGR -> RGB
+        metas.append((gain, pad, img.shape[:2]))
+    x = np.stack(batch).transpose(0, 3, 1, 2).astype(np.float32) / 255.0
+    return np.ascontiguousarray(x), metas
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_thres: float) -> np.ndarray:
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(boxes[i, 0], boxes[order[1:], 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[order[1:], 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[order[1:], 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[order[1:], 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / (areas[i] + areas[order[1:]] - inter + 1e-9)
+        order = order[1:][iou <= iou_thres]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def postprocess(pred: np.ndarray, meta, conf_thres: float = INFERENCE_CONF,
+                iou_thres: float = INFERENCE_IOU, max_det: int = INFERENCE_MAX_DET) -> list:
+    """
+    Decodes one YOLOv8 head output of shape (4 + num_classes, num_anchors)
+    into [(xyxy, cls, conf), ...] in original image coordinates.
+    """
+    pred = pred.T
+    scores = pred[:, 4:]
+    cls = scores.argmax(axis=1)
+    conf = scores[np.arange(len(scores)), cls]
+    mask = conf > conf_thres
+    if not mask.any():
+        return []
+    xywh, cls, conf = pred[mask, :4], cls[mask], conf[mask]
+
+    boxes = np.empty_like(xywh)
+    boxes[:, 0] = xywh[:, 0] - xywh[:, 2] / 2
+    boxes[:, 1] = xywh[:, 1] - xywh[:, 3] / 2
+    boxes[:, 2] = xywh[:, 0] + xywh[:, 2] / 2
+    boxes[:, 3] = xywh[:, 1] + xywh[:, 3] / 2
+
+    # class-aware NMS: shift each class into its own coordinate range
+    offsets = cls[:, None].astype(np.float32) * 7680.0
+    keep = nms(boxes + offsets, conf, iou_thres)[:max_det]
+    boxes, cls, conf = boxes[keep], cls[keep], conf[keep]
+
+    gain, (left, top), (h, w) = meta
+    boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - left) / gain).clip(0, w)
+    boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - top) / gain).clip(0, h)
+    return [(b.tolist(), int(c), float(s)) for b, c, s in zip(boxes, cls, conf)]
+
+
+class _ExportedYOLO:
+    """Shared pre/post-processing for exported models; subclasses implement `_forward`."""
+
+    backend = ""
+
+    def __init__(self, weights: str, imgsz: int = INFERENCE_IMGSZ, cache_dir: str = MODEL_CACHE_DIR):
+        self.imgsz = imgsz
+        self.path, self.names = export_model(weights, self.backend, imgsz=imgsz, cache_dir=cache_dir)
+
+    def _forward(self, x: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def __call__(self, sources, device: str = "cpu", imgsz: int | None = None, conf: float = INFERENCE_CONF,
+                 iou: float = INFERENCE_IOU, max_det: int = INFERENCE_MAX_DET, **kwargs):
+        if not isinstance(sources, (list, tuple)):
+            sources = [sources]
+        images = [load_image(s) for s in sources]
+        # the models are exported with dynamic=True, so another input size works without a new export
+        x, metas = preprocess(images, imgsz or self.imgsz)
+        out = self._forward(x)
+        return [
+            LiteResult(img, postprocess(out[i], metas[i], conf_thres=conf, iou_thres=iou, max_det=max_det),
+                       self.names)
+            for i, img in enumerate(images)
+        ]
+
+
+class OnnxYOLO(_ExportedYOLO):
+    backend = "onnx"
+
+    def __init__(self, weights: str, threads: int = 0, **kwargs):
+        super().__init__(weights, **kwargs)
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(self.path, opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        meta_names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        if meta_names:
+            self.names = {int(k): v for k, v in ast.literal_eval(meta_names).items()}
+
+    def _forward(self, x):
+        return self.session.run(None, {self.input_name: x})[0]
+
+
+class OpenVINOYOLO(_ExportedYOLO):
+    backend = "openvino"
+
+    def __init__(self, weights: str, threads: int = 0, **kwargs):
+        super().__init__(weights, **kwargs)
+        import openvino as ov
+
+        xml = next(
+            os.path.join(self.path, f) for f in sorted(os.listdir(self.path)) if f.endswith(".xml")
+        )
+        core = ov.Core()
+        config = {"INFERENCE_NUM_THREADS": threads} if threads else {}
+        self.compiled = core.compile_model(core.read_model(xml), "CPU", config)
+        self.output = self.compiled.output(0)
+
+    def _forward(self, x):
+        return self.compiled(x)[self.output]
+
+
+def load_model(weights: str, backend: str | None = None, threads: int = 0):
+    """
+    Returns a callable model (`model(sources, device=...)` + `.names`) for the given backend.
+    `threads` caps intra-op threads for the exported backends (0 = runtime default).
+    """
+    backend = (backend or INFERENCE_BACKEND).lower()
+    if backend == "torch":
+        return load_yolo(weights)
+    if backend == "onnx":
+        return OnnxYOLO(weights, threads=threads)
+    if backend == "openvino":
+        return OpenVINOYOLO(weights, threads=threads)
+    raise ValueError(f"Unknown INFERENCE_BACKEND '{backend}' (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,108 @@
+# benchmarks/bench_auth.py
+"""
+Requests/sec through the auth middleware: the call_next wrapper
+(`basic_auth_middleware`, BaseHTTPMiddleware) vs. the plain ASGI `BasicAuthMiddleware`.
+
+    python benchmarks/bench_auth.py
+    python benchmarks/bench_auth.py --requests 5000 --concurrency 64
+
+Requests go through httpx's in-process ASGI transport, so the numbers measure
+the app and middleware only (no sockets). /prediction/{uid} reads a seeded
+prediction from a temporary SQLite database.
+"""
+import os
+import sys
+import uuid
+import base64
+import asyncio
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+from time import perf_counter
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth_middleware  # noqa: E402
+import controllers  # noqa: E402
+from db import Base, get_db  # noqa: E402
+from models import User, PredictionSession, DetectionObject  # noqa: E402
+
+
+def build_app(kind: str, Session) -> FastAPI:
+    app = FastAPI()
+    if kind == "call_next":
+        app.middleware("http")(auth_middleware.basic_auth_middleware())
+    else:
+        app.add_middleware(auth_middleware.BasicAuthMiddleware)
+    app.include_router(controllers.router)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return app
+
+
+async def run(app, path: str, headers: dict, total: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(20):
+            (await client.get(path, headers=headers)).raise_for_status()
+
+        remaining = total
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                (await client.get(path, headers=headers)).raise_for_status()
+
+        t0 = perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-auth-'), 'bench.db')}"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    uid = str(uuid.uuid4())
+    with Session() as db:
+        db.add(User(username="bench", password="bench"))
+        db.add(PredictionSession(uid=uid, original_image="o.jpg", predicted_image="p.jpg",
+                                 username="bench", timestamp=datetime.utcnow()))
+        db.add(DetectionObject(prediction_uid=uid, label="person", score=0.9, box="[0, 0, 10, 10]"))
+        db.commit()
+    auth_middleware.SessionLocal = Session
+    # no bucket configured: presigning logs an error per request
+    logging.getLogger("s3_utils").setLevel(logging.CRITICAL)
+
+    headers = {"Authorization": "Basic " + base64.b64encode(b"bench:bench").decode()}
+    header = f"{'endpoint':<22}{'middleware':>12}{'req/s':>10}"
+    print(header)
+    print("-" * len(header))
+    for path, hdrs in (("/health", {}), (f"/prediction/{uid}", headers)):
+        label = "/prediction/{uid}" if hdrs else path
+        for kind in ("call_next", "asgi"):
+            rps = asyncio.run(run(build_app(kind, Session), path, hdrs, args.requests, args.concurrency))
+            print(f"{label:<22}{kind:>12}{rps:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
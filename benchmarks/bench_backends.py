@@ -0,0 +1,89 @@
+# benchmarks/bench_backends.py
+"""
+Latency / throughput comparison of the inference backends on one image.
+
+    python benchmarks/bench_backends.py --image beatles.jpeg --runs 50 --batch 8
+    python benchmarks/bench_backends.py --backends torch onnx
+
+Exported ONNX / OpenVINO artifacts are cached under MODEL_CACHE_DIR, so the
+first run of a backend includes a one-off export that is not timed.
+"""
+import os
+import sys
+import argparse
+import statistics
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import BACKENDS, load_model  # noqa: E402
+from imaging import load_image  # noqa: E402
+
+
+def _available(backend: str) -> bool:
+    module = {"torch": "ultralytics", "onnx": "onnxruntime", "openvino": "openvino"}[backend]
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def bench(backend: str, weights: str, image, runs: int, batch: int, warmup: int = 3) -> dict:
+    model = load_model(weights, backend)
+    for _ in range(warmup):
+        model([image], device="cpu", verbose=False)
+
+    latencies = []
+    for _ in range(runs):
+        t0 = perf_counter()
+        model([image], device="cpu", verbose=False)
+        latencies.append((perf_counter() - t0) * 1000)
+
+    batch_runs = max(1, runs // batch)
+    t0 = perf_counter()
+    for _ in range(batch_runs):
+        model([image] * batch, device="cpu", verbose=False)
+    elapsed = perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "backend": backend,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+        "mean_ms": statistics.fmean(latencies),
+        "single_img_s": 1000 / statistics.fmean(latencies),
+        "batch_img_s": batch_runs * batch / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", default="beatles.jpeg")
+    parser.add_argument("--weights", default="yolov8n.pt")
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    args = parser.parse_args()
+
+    # decode once so every backend is timed on the same in-memory array
+    image = load_image(args.image)
+    rows = []
+    for backend in args.backends:
+        if not _available(backend):
+            print(f"skipping {backend}: runtime not installed")
+            continue
+        rows.append(bench(backend, args.weights, image, args.runs, args.batch))
+
+    header = f"{'backend':<10}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'img/s (1)':>12}{f'img/s ({args.batch})':>12}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(
+            f"{r['backend']:<10}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['mean_ms']:>10.1f}"
+            f"{r['single_img_s']:>12.1f}{r['batch_img_s']:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
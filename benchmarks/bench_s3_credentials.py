@@ -0,0 +1,57 @@
+# benchmarks/bench_s3_credentials.py
+"""
+Per-call overhead of the S3 credential check done before every upload, delete
+and presign: resolving credentials on a fresh boto3 session each time (the old
+has_s3_credentials) vs. the cached has_s3_credentials.
+
+    python benchmarks/bench_s3_credentials.py --calls 200
+
+Uses whatever credentials the environment provides (env vars, profile, or the
+instance metadata service); results differ a lot between them.
+"""
+import os
+import sys
+import argparse
+import statistics
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import s3_utils  # noqa: E402
+
+
+def uncached() -> bool:
+    return s3_utils._check_credentials(s3_utils._make_session())[0]
+
+
+def bench(fn, calls: int) -> dict:
+    latencies = []
+    for _ in range(calls):
+        t0 = perf_counter()
+        fn()
+        latencies.append((perf_counter() - t0) * 1e6)
+    latencies.sort()
+    return {
+        "p50_us": statistics.median(latencies),
+        "p99_us": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "mean_us": statistics.fmean(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"credentials available: {uncached()}")
+    header = f"{'mode':>10}{'p50 us':>12}{'p99 us':>12}{'mean us':>12}"
+    print(header)
+    print("-" * len(header))
+    s3_utils.invalidate_credentials()
+    for mode, fn in (("uncached", uncached), ("cached", s3_utils.has_s3_credentials)):
+        r = bench(fn, args.calls)
+        print(f"{mode:>10}{r['p50_us']:>12.1f}{r['p99_us']:>12.1f}{r['mean_us']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# benchmarks/bench_s3_transfer.py
+"""
+S3 upload/download throughput for different transfer settings, against a local
+S3 stand-in.
+
+    pip install "moto[server]"
+    python benchmarks/bench_s3_transfer.py                                  # starts a moto server
+    python benchmarks/bench_s3_transfer.py --endpoint-url http://localhost:9000   # MinIO
+
+    # MinIO: docker run -p 9000:9000 -e MINIO_ROOT_USER=minio -e MINIO_ROOT_PASSWORD=minio123 \\
+    #          minio/minio server /data
+    # AWS_ACCESS_KEY_ID=minio AWS_SECRET_ACCESS_KEY=minio123 python benchmarks/bench_s3_transfer.py --endpoint-url ...
+
+Each setting uploads and then downloads `--files` objects of `--size-mb` from
+`--threads` threads at once (like concurrent /predict requests and background uploads).
+"""
+import os
+import sys
+import uuid
+import shutil
+import logging
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import boto3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from s3_utils import make_client_config, make_transfer_config  # noqa: E402
+
+# (max_pool_connections, max_concurrency, chunksize_mb)
+SETTINGS = [
+    (10, 10, 8),    # boto3 defaults
+    (50, 10, 8),
+    (50, 4, 16),
+    (100, 20, 8),
+]
+
+
+def start_moto() -> str:
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        sys.exit('moto is not installed: pip install "moto[server]", or pass --endpoint-url')
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    return f"http://{host}:{port}"
+
+
+def bench(endpoint_url, bucket, src, workdir, files, threads, pool, concurrency, chunksize_mb) -> dict:
+    client = boto3.client("s3", endpoint_url=endpoint_url, region_name="us-east-1",
+                          config=make_client_config(max_pool_connections=pool))
+    transfer = make_transfer_config(threshold_mb=chunksize_mb, chunksize_mb=chunksize_mb,
+                                    max_concurrency=concurrency)
+    keys = [f"bench/{uuid.uuid4().hex}" for _ in range(files)]
+    size = os.path.getsize(src) * files / (1024 * 1024)
+
+    with ThreadPoolExecutor(threads) as pool_exec:
+        t0 = perf_counter()
+        list(pool_exec.map(lambda k: client.upload_file(src, bucket, k, Config=transfer), keys))
+        up = perf_counter() - t0
+
+        t0 = perf_counter()
+        list(pool_exec.map(
+            lambda k: client.download_file(bucket, k, os.path.join(workdir, k.replace("/", "_")), Config=transfer),
+            keys,
+        ))
+        down = perf_counter() - t0
+
+    for k in keys:
+        client.delete_object(Bucket=bucket, Key=k)
+    return {"upload_mb_s": size / up, "download_mb_s": size / down}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint-url", default=None, help="S3-compatible endpoint; starts moto when omitted")
+    parser.add_argument("--bucket", default="bench-transfer")
+    parser.add_argument("--size-mb", type=int, default=32)
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    # "Connection pool is full" warnings are what the pool size setting is about; the table shows their cost
+    logging.getLogger("urllib3.connectionpool").setLevel(logging.ERROR)
+    endpoint_url = args.endpoint_url or start_moto()
+    client = boto3.client("s3", endpoint_url=endpoint_url, region_name="us-east-1")
+    try:
+        client.create_bucket(Bucket=args.bucket)
+    except client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+
+    workdir = tempfile.mkdtemp(prefix="bench-s3-")
+    src = os.path.join(workdir, "payload.bin")
+    with open(src, "wb") as f:
+        f.write(os.urandom(args.size_mb * 1024 * 1024))
+
+    print(f"endpoint: {endpoint_url}  {args.files} x {args.size_mb} MB from {args.threads} threads")
+    header = f"{'pool':>6}{'concurrency':>13}{'chunk MB':>10}{'up MB/s':>10}{'down MB/s':>11}"
+    print(header)
+    print("-" * len(header))
+    try:
+        for pool, concurrency, chunksize_mb in SETTINGS:
+            r = bench(endpoint_url, args.bucket, src, workdir, args.files, args.threads,
+                      pool, concurrency, chunksize_mb)
+            print(f"{pool:>6}{concurrency:>13}{chunksize_mb:>10}{r['upload_mb_s']:>10.1f}{r['download_mb_s']:>11.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
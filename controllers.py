@@ -1,30 +1,73 @@
 # controllers.py
-from fastapi import APIRouter, UploadFile, File, Request, Depends, HTTPException, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, Request, Depends, HTTPException, Query, BackgroundTasks, Body
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
 from PIL import Image
 import os
+import json
 import uuid
+import base64
+import asyncio
 import shutil
-from urllib.parse import unquote
-from ultralytics import YOLO
+import hashlib
+import mimetypes
+import numpy as np
+from urllib.parse import unquote, urlparse
+from functools import partial
 import torch
 
 from time import monotonic
+from datetime import datetime, timezone, timedelta
 from urllib.parse import unquote
 
+import logging
 import queries, inspect
-from db import get_db
+from db import get_db, SessionLocal
+from backends import (
+    load_model,
+    INFERENCE_BACKEND,
+    INFERENCE_IMGSZ,
+    INFERENCE_CONF,
+    INFERENCE_IOU,
+    INFERENCE_MAX_DET,
+)
+from imaging import load_image, draw_detections, InvalidImage
+from pipeline import download_stage, decode_stage, render_stage, persist_stage, pipeline_metrics
+from prediction_cache import prediction_cache, make_key
+from image_cache import image_cache
+import http_client
+from auth_middleware import credential_cache, is_admin
+from auth_tokens import issue_token, AUTH_TOKEN_TTL
+from uploader import S3Uploader, UploadNotConfigured
+from inference import (
+    BatchScheduler,
+    WorkerPool,
+    INFERENCE_MAX_BATCH_SIZE,
+    INFERENCE_MAX_WAIT_MS,
+    INFERENCE_THREADS_PER_WORKER,
+    INFERENCE_WORKER_TIMEOUT,
+    resolve_worker_count,
+)
 
 from s3_utils import (
+    s3_configured,
     s3_upload_file,
+    s3_upload_bytes,
     s3_presign_get_url,
+    presign_cache,
     s3_delete_object,
+    s3_delete_objects,
+    s3_download_to_path,
     s3_download_to_temp,
+    s3_open_object,
+    iter_s3_body,
     s3_or_http_download,
+    async_http_download,
 )
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 torch.cuda.is_available = lambda: False 
 
@@ -33,12 +76,293 @@ PREDICTED_DIR = "uploads/predicted"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(PREDICTED_DIR, exist_ok=True)
 
-model = YOLO("yolov8n.pt")
+
+def _upload_to_s3(local_path: str, key: str, extra_args=None) -> bool:
+    # looks s3_upload_file up on every attempt so it can be swapped (tests, refresh_client)
+    if not s3_configured():
+        raise UploadNotConfigured("no AWS_S3_BUCKET or no AWS credentials")
+    return s3_upload_file(local_path, key, extra_args=extra_args)
+
+
+def _mark_predicted_uploaded(local_path: str, key: str, extra_args=None) -> None:
+    # recorded in the DB so replicas without the local file know the predicted key exists
+    uid = ((extra_args or {}).get("Metadata") or {}).get("prediction_uid")
+    if not uid or os.path.splitext(key)[0].split("/")[-2:] != ["predicted", uid]:
+        return
+    db = SessionLocal()
+    try:
+        queries.query_mark_predicted_uploaded(db, uid)
+    finally:
+        db.close()
+
+
+# without a bucket or credentials nothing is journaled: retrying could never succeed
+s3_uploader = S3Uploader(_upload_to_s3, configured=lambda: s3_configured(), on_uploaded=_mark_predicted_uploaded)
+s3_uploader.start()
+
+# decode uploads straight from memory; the original is written to disk/S3 after the response
+PREDICT_IN_MEMORY = os.getenv("PREDICT_IN_MEMORY", "false").lower() in ("1", "true", "yes")
+
+MODEL_WEIGHTS = "yolov8n.pt"
+INFERENCE_WORKERS = resolve_worker_count()
+
+if INFERENCE_WORKERS > 0:
+    model = WorkerPool(
+        MODEL_WEIGHTS,
+        workers=INFERENCE_WORKERS,
+        threads_per_worker=INFERENCE_THREADS_PER_WORKER,
+        model_factory=partial(load_model, backend=INFERENCE_BACKEND, threads=INFERENCE_THREADS_PER_WORKER),
+        timeout=INFERENCE_WORKER_TIMEOUT,
+    )
+else:
+    model = load_model(MODEL_WEIGHTS, INFERENCE_BACKEND)
+
+
+# identity of whatever produces detections; part of the prediction cache key
+MODEL_ID = f"{INFERENCE_BACKEND}:{MODEL_WEIGHTS}"
+# passed as-is to every model call and hashed into the prediction cache key, so the two cannot drift apart
+INFERENCE_PARAMS = {
+    "imgsz": INFERENCE_IMGSZ,
+    "conf": INFERENCE_CONF,
+    "iou": INFERENCE_IOU,
+    "max_det": INFERENCE_MAX_DET,
+}
+
+
+def _run_model(sources):
+    # resolved at call time so the scheduler always uses the current module-level model
+    return model(sources, device="cpu", **INFERENCE_PARAMS)
+
+
+inference_scheduler = BatchScheduler(
+    _run_model,
+    max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=INFERENCE_MAX_WAIT_MS,
+    concurrency=max(1, INFERENCE_WORKERS),
+)
+
+
+def _copy_and_hash(src, dst, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        dst.write(chunk)
+    return digest.hexdigest()
+
+
+def _hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _save_upload(src, original_path: str) -> str:
+    with open(original_path, "wb") as f:
+        return _copy_and_hash(src, f)
+
+
+def _decode_upload(data: bytes):
+    return load_image(data), hashlib.sha256(data).hexdigest()
+
+
+def _extract_detections(result) -> list:
+    return [
+        (model.names[int(box.cls[0].item())], float(box.conf[0]), box.xyxy[0].tolist())
+        for box in result.boxes
+    ]
+
+
+def _render_detections(source, detections, predicted_path: str) -> None:
+    if isinstance(source, np.ndarray):
+        image = Image.fromarray(source[..., ::-1])
+    else:
+        image = Image.open(source)
+    # write next to the target and rename, so concurrent readers never see half a file
+    root, ext = os.path.splitext(predicted_path)
+    tmp_path = f"{root}.{uuid.uuid4().hex}.tmp{ext}"
+    draw_detections(image, detections).save(tmp_path)
+    os.replace(tmp_path, predicted_path)
+
+
+def _numeric_box(obj):
+    if getattr(obj, "x1", None) is not None:
+        return [obj.x1, obj.y1, obj.x2, obj.y2]
+    # rows written before the numeric columns existed and not yet backfilled
+    return queries.parse_box(obj.box)
+
+
+def _detection_to_dict(obj) -> dict:
+    d = to_dict(obj)
+    # None only when `box` cannot be parsed
+    d["bbox"] = _numeric_box(obj)
+    return d
+
+
+def _original_s3_key(session, uid: str) -> str:
+    username = getattr(session, "username", None) or "anonymous"
+    ext = os.path.splitext(session.original_image or "")[1] or ".jpg"
+    return f"{username}/original/{uid}{ext}"
+
+
+def _source_s3_key(session, uid: str) -> str:
+    # ?img= originals stay under the caller's key; only file/url originals are uploaded under ours
+    return getattr(session, "source_s3_key", None) or _original_s3_key(session, uid)
+
+
+def _predicted_s3_key(session, uid: str) -> str:
+    username = getattr(session, "username", None) or "anonymous"
+    ext = os.path.splitext(session.original_image or "")[1] or ".jpg"
+    return f"{username}/predicted/{uid}{ext}"
+
+
+def _predicted_rendered(session) -> bool:
+    # /predict does not draw the annotated image; it exists once rendered here or uploaded by any replica
+    if getattr(session, "predicted_uploaded_at", None) is not None:
+        return True
+    predicted_path = session.predicted_image
+    return bool(predicted_path) and os.path.exists(predicted_path)
+
+
+def _stream_s3_object(key: str, media_type: str | None = None) -> StreamingResponse | None:
+    """Streams a GetObject body to the client chunk by chunk; None if the object cannot be read."""
+    obj = s3_open_object(key)
+    if obj is None:
+        return None
+    headers = {}
+    if obj["content_length"] is not None:
+        headers["Content-Length"] = str(obj["content_length"])
+    if obj["etag"]:
+        headers["ETag"] = obj["etag"]
+    media_type = media_type or obj["content_type"] or mimetypes.guess_type(key)[0] or "application/octet-stream"
+    return StreamingResponse(iter_s3_body(obj["body"]), media_type=media_type, headers=headers)
+
+
+def _checkout_s3_object(key: str) -> str | None:
+    """
+    Private link to an S3 object in the shared image cache (None if disabled or not downloadable).
+    Release it with image_cache.release() once read; until then eviction cannot remove it.
+    """
+    return image_cache.checkout(key, lambda dest_path: s3_download_to_path(key, dest_path))
+
+
+def _s3_image_response(key: str, media_type: str | None = None):
+    """Serves an S3 object from the local image cache, or streams it when it cannot be cached."""
+    path = _checkout_s3_object(key)
+    if path is not None:
+        # the link is dropped after the body has been sent
+        return FileResponse(path, media_type=media_type, background=BackgroundTask(image_cache.release, path))
+    return _stream_s3_object(key, media_type)
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    # a hard link keeps the prediction's original even after the cache evicts its copy
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _fetch_s3_original(key: str, s3_url: str, dest_path: str) -> bool:
+    """?img=<key>: the object comes from the image cache when another prediction already used it."""
+    cached = image_cache.checkout(key, lambda tmp_path: s3_or_http_download(s3_url, tmp_path))
+    if cached is None:
+        return s3_or_http_download(s3_url, dest_path)
+    try:
+        _link_or_copy(cached, dest_path)
+    except OSError as e:
+        logger.error(f"Failed to copy cached {key} to {dest_path}: {e}")
+        return False
+    finally:
+        image_cache.release(cached)
+    return True
+
+
+def _ensure_predicted_image(db: Session, session, uid: str) -> str | None:
+    """
+    Returns a local path to the annotated image of `uid`, drawing the stored
+    DetectionObject boxes onto the original if needed (then it is cached locally
+    and the S3 upload is queued).
+    """
+    predicted_path = session.predicted_image
+    if predicted_path and os.path.exists(predicted_path):
+        return predicted_path
+
+    username = getattr(session, "username", None) or "anonymous"
+    ext = os.path.splitext(session.original_image or "")[1] or ".jpg"
+
+    original_path = session.original_image
+    original_is_temp = False
+    if not (original_path and os.path.exists(original_path)):
+        original_key = _source_s3_key(session, uid)
+        # either a checked-out cache link or a temp download: removed after rendering
+        original_path = _checkout_s3_object(original_key) or s3_download_to_temp(original_key, suffix=ext)
+        original_is_temp = True
+        if not (original_path and os.path.exists(original_path)):
+            return None
+
+    objects = queries.query_get_objects_by_uid(db, uid)
+    detections = [(obj.label, obj.score, _numeric_box(obj)) for obj in objects]
+    predicted_path = predicted_path or os.path.join(PREDICTED_DIR, uid + ext)
+    try:
+        render_stage.submit(_render_detections, original_path, detections, predicted_path).result()
+    finally:
+        if original_is_temp:
+            os.remove(original_path)
+
+    extra = {"Metadata": {"prediction_uid": uid, "user": username}}
+    s3_uploader.enqueue(predicted_path, _predicted_s3_key(session, uid), extra)
+    return predicted_path
+
+
+def _predicted_image_response(db: Session, session, uid: str, media_type=lambda name: None):
+    """
+    Annotated image of `uid`: local file -> S3 (through the image cache) -> rendered on first request.
+    `media_type(name)` picks the Content-Type from a file name or key (None = guess).
+    """
+    predicted_path = session.predicted_image
+    if predicted_path and os.path.exists(predicted_path):
+        return FileResponse(predicted_path, media_type=media_type(predicted_path))
+
+    key = _predicted_s3_key(session, uid)
+    response = _s3_image_response(key, media_type(key))
+    if response is not None:
+        return response
+
+    path = _ensure_predicted_image(db, session, uid)
+    if path:
+        return FileResponse(path, media_type=media_type(path))
+    return None
+
+
+def _persist_original(data: bytes, original_path: str, key: str, extra_args: dict):
+    try:
+        with open(original_path, "wb") as f:
+            f.write(data)
+    except OSError as e:
+        logger.error(f"Failed to write original image {original_path}: {e}")
+        # nothing on disk for the uploader to retry from
+        s3_upload_bytes(data, key, extra_args=extra_args)
+        return
+    s3_uploader.enqueue(original_path, key, extra_args)
+
+
+async def _download(ref: str, dest_path: str) -> bool:
+    # http(s) is read on the event loop (file writes go to a thread); boto3 is blocking, so S3 goes to the download stage
+    if urlparse(ref).scheme.lower() in ("http", "https"):
+        return await async_http_download(ref, dest_path)
+    return await download_stage.run(s3_or_http_download, ref, dest_path)
 
 
 @router.post("/predict")
-def predict(
+async def predict(
     request: Request,
+    background_tasks: BackgroundTasks,
     file: UploadFile | None = File(None),
     db: Session = Depends(get_db),
     img: str | None = Query(None, description="S3 key (e.g., public/beatles.jpeg)"),
@@ -53,6 +377,9 @@ def predict(
     source_type = None  
     key_original: str | None = None
     ext = ".jpg"
+    source = None
+    content_hash = None
+    original_in_background = False
 
     if img_url:
         source_type = "url"
@@ -61,7 +388,7 @@ def predict(
             raise HTTPException(status_code=400, detail="Empty 'img_url' after trimming")
         ext = os.path.splitext(ref.split("?", 1)[0])[1] or ".jpg"
         original_path = os.path.join(UPLOAD_DIR, uid + ext)
-        if not s3_or_http_download(ref, original_path):
+        if not await _download(ref, original_path):
             raise HTTPException(status_code=400, detail=f"Failed to download from URL '{img_url}'")
         key_original = f"{username}/original/{uid}{ext}"
 
@@ -75,7 +402,7 @@ def predict(
 
      
         s3_url = f"s3://{os.getenv('AWS_S3_BUCKET')}/{key}"
-        if not s3_or_http_download(s3_url, original_path):
+        if not await download_stage.run(_fetch_s3_original, key, s3_url, original_path):
             raise HTTPException(
                 status_code=400,
                 detail=(f"Failed to download '{key}' from S3. Make it public or provide 'img_url' (presigned)."),
@@ -91,46 +418,65 @@ def predict(
         source_type = "file"
         ext = os.path.splitext(file.filename)[1] or ".jpg"
         original_path = os.path.join(UPLOAD_DIR, uid + ext)
-        with open(original_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
         key_original = f"{username}/original/{uid}{ext}"
-
-    # הרצת YOLO ושמירת פלט
+        if PREDICT_IN_MEMORY:
+            data = await file.read()
+            try:
+                source, content_hash = await decode_stage.run(_decode_upload, data)
+            except Exception:
+                raise HTTPException(status_code=400, detail="Uploaded file is not a valid image")
+            extra = {"Metadata": {"prediction_uid": uid, "user": username}}
+            background_tasks.add_task(persist_stage.run, _persist_original, data, original_path, key_original, extra)
+            original_in_background = True
+        else:
+            content_hash = await download_stage.run(_save_upload, file.file, original_path)
+
+    if source is None:
+        source = original_path
+    if content_hash is None:
+        content_hash = await decode_stage.run(_hash_file, original_path)
+
+    # הרצת YOLO - או תוצאה מה-cache אם התמונה כבר נבדקה
+    # the annotated image is not drawn here; /prediction/{uid}/image renders it on first request
     predicted_path = os.path.join(PREDICTED_DIR, uid + ext)
-    results = model(original_path, device="cpu")
-    Image.fromarray(results[0].plot()).save(predicted_path)
-    
+    cache_key = make_key(content_hash, MODEL_ID, INFERENCE_PARAMS)
+    detections = await persist_stage.run(prediction_cache.get, cache_key, db)
+    cache_hit = detections is not None
+    if not cache_hit:
+        # inference runs on the scheduler's own threads and batches across requests
+        try:
+            result = await asyncio.wrap_future(inference_scheduler.submit(source))
+        except InvalidImage:
+            raise HTTPException(status_code=400, detail="Uploaded file is not a valid image")
+        detections = _extract_detections(result)
+        await persist_stage.run(prediction_cache.put, cache_key, detections, db)
 
     # DB
-    queries.query_save_prediction_session(db, uid, original_path, predicted_path, username)
-
-    detected_labels = []
-    for box in results[0].boxes:
-        label = model.names[int(box.cls[0].item())]
-        score = float(box.conf[0])
-        bbox = box.xyxy[0].tolist()
-        queries.query_save_detection_object(db, uid, label, score, str(bbox))
-        detected_labels.append(label)
-
-  
-    if source_type in ("file", "url"):
+    await persist_stage.run(
+        queries.query_save_prediction_session,
+        db, uid, original_path, predicted_path, username, detections=detections,
+        source_s3_key=key_original if source_type == "s3key" else None,
+    )
+    detected_labels = [label for label, _, _ in detections]
+
+    # the original is journaled now and uploaded by the background uploader
+    if source_type in ("file", "url") and not original_in_background:
         extra = {"Metadata": {"prediction_uid": uid, "user": username}}
-        _ = s3_upload_file(original_path, key_original, extra_args=extra)
-
-    predicted_s3_key = f"{username}/predicted/{uid}{ext}"  # ← שם השדה שביקשת
-    extra_pred = {"Metadata": {"prediction_uid": uid, "user": username}}
-    _ = s3_upload_file(predicted_path, predicted_s3_key, extra_args=extra_pred)
+        await persist_stage.run(s3_uploader.enqueue, original_path, key_original, extra)
 
     processing_time = round(monotonic() - t0, 3)  # ← זמן ריצה בשניות, מעוגל
 
    
     return {
         "prediction_uid": uid,
-        "detection_count": len(results[0].boxes),
+        "detection_count": len(detections),
         "labels": detected_labels,
         "time_took": processing_time,
         "user_id": user_id,
-        "predicted_s3_key": predicted_s3_key,
+        # the annotated image is rendered (and then uploaded) on the first GET of predicted_image_url
+        "predicted_s3_key": None,
+        "predicted_image_url": f"/prediction/{uid}/image",
+        "cache_hit": cache_hit,
     }
 
 
@@ -235,21 +581,24 @@ def predict(
 
 
 @router.get("/prediction/{uid}")
-def get_prediction_by_uid(uid: str, db: Session = Depends(get_db)):
+def get_prediction_by_uid(
+    uid: str,
+    expires_in: int = Query(3600, ge=60, le=7 * 24 * 3600, description="Lifetime of the presigned URLs in seconds"),
+    db: Session = Depends(get_db),
+):
     session = queries.query_get_prediction_by_uid(db, uid)
     if not session:
         raise HTTPException(status_code=404, detail="Prediction not found")
 
     objects = queries.query_get_objects_by_uid(db, uid)
 
-    username = getattr(session, "username", None) or "anonymous"
-    ext = os.path.splitext(session.original_image or "")[1] or ".jpg"
-    s3_original_key = f"{username}/original/{uid}{ext}"
-    s3_predicted_key = f"{username}/predicted/{uid}{ext}"
+    s3_original_key = _source_s3_key(session, uid)
+    # no key or URL for an annotated image that has not been rendered yet
+    s3_predicted_key = _predicted_s3_key(session, uid) if _predicted_rendered(session) else None
 
     presigned = {
-        "original": s3_presign_get_url(s3_original_key) or None,
-        "predicted": s3_presign_get_url(s3_predicted_key) or None,
+        "original": s3_presign_get_url(s3_original_key, expires_in) or None,
+        "predicted": (s3_presign_get_url(s3_predicted_key, expires_in) or None) if s3_predicted_key else None,
     }
 
     return {
@@ -257,22 +606,84 @@ def get_prediction_by_uid(uid: str, db: Session = Depends(get_db)):
         "timestamp": session.timestamp.isoformat(),
         "original_image": session.original_image,
         "predicted_image": session.predicted_image,
-        "detection_objects": [to_dict(obj) for obj in objects],
+        "detection_objects": [_detection_to_dict(obj) for obj in objects],
         "s3_presigned": presigned,
         "s3_keys": {"original": s3_original_key, "predicted": s3_predicted_key},
+        "predicted_image_url": f"/prediction/{uid}/image",
     }
 
 
+def _encode_cursor(item: dict) -> str:
+    raw = json.dumps([item["timestamp"], item["uid"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, uid = json.loads(raw)
+        return datetime.fromisoformat(ts), str(uid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _page(query_fn, db: Session, arg, limit: int, cursor: str | None) -> dict:
+    after = _decode_cursor(cursor) if cursor else None
+    # one extra row tells whether another page exists
+    items = query_fn(db, arg, limit=limit + 1, after=after)
+    page = {"items": [to_dict(x) for x in items[:limit]]}
+    if len(items) > limit:
+        page["next_cursor"] = _encode_cursor(page["items"][-1])
+    return page
+
+
 @router.get("/predictions/label/{label}")
-def get_predictions_by_label(label: str, db: Session = Depends(get_db)):
-    items = queries.query_get_predictions_by_label(db, label)
-    return {"items": [to_dict(x) for x in items]}
+def get_predictions_by_label(
+    label: str,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    db: Session = Depends(get_db),
+):
+    return _page(queries.query_get_predictions_by_label, db, label, limit, cursor)
 
 
 @router.get("/predictions/score/{min_score}")
-def get_predictions_by_score(min_score: float, db: Session = Depends(get_db)):
-    items = queries.query_get_predictions_by_score(db, min_score)
-    return {"items": [to_dict(x) for x in items]}
+def get_predictions_by_score(
+    min_score: float,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    db: Session = Depends(get_db),
+):
+    return _page(queries.query_get_predictions_by_score, db, min_score, limit, cursor)
+
+
+@router.get("/predictions/box")
+def get_predictions_by_box(
+    min_area: float | None = Query(None, ge=0, description="Minimum box area in pixels"),
+    max_area: float | None = Query(None, ge=0, description="Maximum box area in pixels"),
+    region: str | None = Query(None, description="x1,y1,x2,y2 - box must lie inside this region"),
+    min_aspect: float | None = Query(None, gt=0, description="Minimum width/height"),
+    max_aspect: float | None = Query(None, gt=0, description="Maximum width/height"),
+    label: str | None = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    db: Session = Depends(get_db),
+):
+    bounds = None
+    if region:
+        try:
+            bounds = [float(v) for v in region.split(",")]
+        except ValueError:
+            bounds = []
+        if len(bounds) != 4:
+            raise HTTPException(status_code=400, detail="'region' must be four numbers: x1,y1,x2,y2")
+    filters = {"min_area": min_area, "max_area": max_area, "region": bounds,
+               "min_aspect": min_aspect, "max_aspect": max_aspect, "label": label}
+
+    def query_fn(db, filters, **page):
+        return queries.query_get_predictions_by_box(db, **filters, **page)
+
+    return _page(query_fn, db, filters, limit, cursor)
 
 
 @router.delete("/prediction/{uid}")
@@ -292,6 +703,8 @@ def delete_prediction(uid: str, db: Session = Depends(get_db)):
                 os.remove(path)
         except Exception:
             pass
+    image_cache.discard(s3_original_key)
+    image_cache.discard(s3_predicted_key)
 
     s3_del = {
         "original_deleted": s3_delete_object(s3_original_key),
@@ -308,6 +721,103 @@ def delete_prediction(uid: str, db: Session = Depends(get_db)):
     return {"detail": f"Prediction {uid} deleted successfully", "s3": s3_del}
 
 
+# predictions per bulk-delete step: their two S3 keys each fit in one DeleteObjects request
+BULK_DELETE_CHUNK = 500
+
+
+@router.post("/predictions/delete")
+def bulk_delete_predictions(
+    request: Request,
+    uids: list[str] | None = Body(None),
+    older_than_days: float | None = Body(None, gt=0),
+    username: str | None = Body(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Deletes every prediction matching all given filters: `uids`, `older_than_days`,
+    `username`. Works in steps of BULK_DELETE_CHUNK predictions (local files,
+    one DeleteObjects call, set-based DB deletes) and streams one NDJSON line per
+    step, then a summary line with "done": true.
+    Callers outside ADMIN_USERS only ever delete their own predictions.
+    """
+    if uids is None and older_than_days is None and username is None:
+        raise HTTPException(status_code=400, detail="Provide uids, older_than_days and/or username")
+    caller = getattr(request.state, "username", None)
+    if not is_admin(caller):
+        if not caller:
+            raise HTTPException(status_code=401, detail="Authentication required")
+        if username is not None and username != caller:
+            raise HTTPException(status_code=403, detail="Only admins can delete other users' predictions")
+        # uids of other users are reported as not_found
+        username = caller
+    before = None
+    if older_than_days is not None:
+        before = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=older_than_days)
+
+    def steps():
+        # an explicit uids list, even an empty one, limits the delete to those uids
+        if uids is not None:
+            unique = list(dict.fromkeys(uids))
+            for i in range(0, len(unique), BULK_DELETE_CHUNK):
+                chunk = unique[i:i + BULK_DELETE_CHUNK]
+                yield chunk, queries.query_get_predictions_to_delete(
+                    db, uids=chunk, username=username, before=before, limit=len(chunk))
+        else:
+            while True:
+                sessions = queries.query_get_predictions_to_delete(
+                    db, username=username, before=before, limit=BULK_DELETE_CHUNK)
+                if not sessions:
+                    return
+                yield None, sessions
+
+    def progress():
+        t0 = monotonic()
+        totals = {"deleted": 0, "s3_deleted": 0, "s3_errors": 0, "not_found": 0}
+        try:
+            for step, (requested, sessions) in enumerate(steps(), start=1):
+                keys = []
+                for session in sessions:
+                    for path in (session.original_image, session.predicted_image):
+                        try:
+                            if path and os.path.exists(path):
+                                os.remove(path)
+                        except OSError:
+                            pass
+                    keys += [_original_s3_key(session, session.uid), _predicted_s3_key(session, session.uid)]
+                for key in keys:
+                    image_cache.discard(key)
+
+                # read before the delete commits and expires the loaded sessions
+                found = [session.uid for session in sessions]
+                s3 = s3_delete_objects(keys)
+                deleted = queries.query_delete_predictions(db, found)
+                found_set = set(found)
+                not_found = [uid for uid in requested if uid not in found_set] if requested else []
+
+                totals["deleted"] += deleted
+                totals["s3_deleted"] += len(s3["deleted"])
+                totals["s3_errors"] += len(s3["errors"])
+                totals["not_found"] += len(not_found)
+                yield json.dumps({
+                    "step": step,
+                    "deleted": deleted,
+                    "s3_deleted": len(s3["deleted"]),
+                    "s3_errors": s3["errors"],
+                    "not_found": not_found,
+                    "total_deleted": totals["deleted"],
+                }) + "\n"
+                if requested is None and deleted == 0:
+                    break   # nothing could be deleted; don't pick the same rows again
+        except Exception as e:
+            logger.exception(f"Bulk delete failed: {e}")
+            db.rollback()
+            yield json.dumps({"done": False, "error": str(e), **totals}) + "\n"
+            return
+        yield json.dumps({"done": True, **totals, "time_took": round(monotonic() - t0, 3)}) + "\n"
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+
 @router.get("/predictions/count")
 def get_count(db: Session = Depends(get_db)):
     return {"count": queries.query_get_prediction_count_last_week(db)}
@@ -319,7 +829,12 @@ def get_labels(db: Session = Depends(get_db)):
 
 
 @router.get("/image/{image_type}/{filename}")
-def get_image(image_type: str, filename: str, s3_key: str | None = Query(None)):
+def get_image(
+    image_type: str,
+    filename: str,
+    s3_key: str | None = Query(None),
+    db: Session = Depends(get_db),
+):
     if image_type not in ("original", "predicted"):
         raise HTTPException(status_code=400, detail="Invalid image type")
     base_dir = {"original": UPLOAD_DIR, "predicted": PREDICTED_DIR}[image_type]
@@ -329,50 +844,67 @@ def get_image(image_type: str, filename: str, s3_key: str | None = Query(None)):
         return FileResponse(file_path)
 
     if s3_key:
-        temp_path = s3_download_to_temp(s3_key, suffix=os.path.splitext(filename)[1])
-        if temp_path and os.path.exists(temp_path):
-            return FileResponse(temp_path)
+        response = _s3_image_response(s3_key)
+        if response is not None:
+            return response
+
+    if image_type == "predicted":
+        uid = os.path.splitext(filename)[0]
+        session = queries.query_get_prediction_by_uid(db, uid)
+        if session:
+            response = _predicted_image_response(db, session, uid)
+            if response is not None:
+                return response
 
     raise HTTPException(status_code=404, detail="Image not found")
 
 
 @router.get("/prediction/{uid}/image")
-def get_prediction_image(uid: str, request: Request, db: Session = Depends(get_db)):
+def get_prediction_image(
+    uid: str,
+    request: Request,
+    db: Session = Depends(get_db),
+):
     session = queries.query_get_prediction_by_uid(db, uid)
     if not session:
         raise HTTPException(status_code=404, detail="Prediction not found")
 
-    predicted_path = session.predicted_image
     accept_header = request.headers.get("accept", "").lower()
     prefer_png = ("image/png" in accept_header) or ("image/*" in accept_header)
     prefer_jpg = ("image/jpeg" in accept_header) or ("image/jpg" in accept_header)
 
-    def _serve(path: str):
+    def _media_type(name: str) -> str:
         if prefer_png:
-            return FileResponse(path, media_type="image/png")
+            return "image/png"
         if prefer_jpg:
-            return FileResponse(path, media_type="image/jpeg")
-        ext = os.path.splitext(path)[1].lower()
-        mt = "image/png" if ext == ".png" else "image/jpeg"
-        return FileResponse(path, media_type=mt)
+            return "image/jpeg"
+        ext = os.path.splitext(name)[1].lower()
+        return "image/png" if ext == ".png" else "image/jpeg"
 
-    if os.path.exists(predicted_path):
-        return _serve(predicted_path)
+    response = _predicted_image_response(db, session, uid, _media_type)
+    if response is not None:
+        return response
 
-    username = getattr(session, "username", None) or "anonymous"
-    ext = os.path.splitext(session.original_image or "")[1] or ".jpg"
-    s3_predicted_key = f"{username}/predicted/{uid}{ext}"
+    raise HTTPException(status_code=404, detail="Predicted image file not found")
 
-    temp_path = s3_download_to_temp(s3_predicted_key, suffix=ext)
-    if temp_path and os.path.exists(temp_path):
-        return _serve(temp_path)
 
-    raise HTTPException(status_code=404, detail="Predicted image file not found")
+def _naive_utc(value: datetime | None) -> datetime | None:
+    # timestamps are stored as naive UTC
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 
 @router.get("/stats")
-def get_stats(db: Session = Depends(get_db)):
-    return queries.query_get_prediction_stats(db)
+def get_stats(
+    top_k: int | None = Query(None, ge=1, description="Only the k most common labels"),
+    since: datetime | None = Query(None, description="ISO timestamp (default: 7 days ago)"),
+    until: datetime | None = Query(None, description="ISO timestamp, exclusive"),
+    db: Session = Depends(get_db),
+):
+    return queries.query_get_prediction_stats(
+        db, since=_naive_utc(since), until=_naive_utc(until), top_k=top_k
+    )
 
 
 @router.get("/health")
@@ -380,6 +912,75 @@ def health():
     return {"status": "ok!"}
 
 
+@router.post("/token")
+def create_token(request: Request):
+    """
+    Exchanges Basic credentials for a signed bearer token. Send it as
+    `Authorization: Bearer <token>`; it is checked without a database lookup.
+    """
+    if getattr(request.state, "auth_scheme", None) != "basic":
+        raise HTTPException(status_code=401, detail="Basic credentials required")
+    token, expires_at = issue_token(request.state.username)
+    return {
+        "access_token": token,
+        "token_type": "bearer",
+        "expires_in": AUTH_TOKEN_TTL,
+        "expires_at": expires_at,
+    }
+
+
+@router.get("/metrics/inference")
+def get_inference_metrics():
+    data = inference_scheduler.metrics()
+    data["backend"] = INFERENCE_BACKEND
+    if isinstance(model, WorkerPool):
+        data["worker_pool"] = model.metrics()
+    return data
+
+
+@router.get("/metrics/pipeline")
+def get_pipeline_metrics():
+    data = pipeline_metrics()
+    scheduler = inference_scheduler.metrics()
+    data["inference"] = {
+        "queue_depth": scheduler["queue_depth"],
+        "p50_queue_wait_ms": scheduler["p50_queue_wait_ms"],
+        "p99_queue_wait_ms": scheduler["p99_queue_wait_ms"],
+        "avg_batch_inference_ms": scheduler["avg_batch_inference_ms"],
+    }
+    return data
+
+
+@router.get("/metrics/prediction-cache")
+def get_prediction_cache_metrics():
+    return prediction_cache.stats()
+
+
+@router.get("/metrics/uploads")
+def get_upload_metrics():
+    return s3_uploader.metrics()
+
+
+@router.get("/metrics/image-cache")
+def get_image_cache_metrics():
+    return image_cache.stats()
+
+
+@router.get("/metrics/presign-cache")
+def get_presign_cache_metrics():
+    return presign_cache.stats()
+
+
+@router.get("/metrics/http")
+def get_http_metrics():
+    return http_client.metrics()
+
+
+@router.get("/metrics/auth-cache")
+def get_auth_cache_metrics():
+    return credential_cache.stats()
+
+
 def to_dict(obj):
     if isinstance(obj, dict):
         return obj
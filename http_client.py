@@ -0,0 +1,284 @@
+# http_client.py
+"""
+Shared HTTP clients for `?img_url=` downloads.
+
+One long-lived httpx.Client (threads) and one httpx.AsyncClient per event loop
+keep connections to the same host open between predictions instead of
+connecting again for every URL. HTTP/2 is negotiated when the `h2` package is
+installed. Concurrent requests per host are capped, and downloads are aborted
+once they exceed `HTTP_MAX_DOWNLOAD_MB`.
+"""
+import os
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Optional
+from urllib.parse import urlparse
+
+import httpx
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+# concurrent requests to one host (connections for HTTP/1.1, streams for HTTP/2)
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "20"))
+# idle connections are closed after this many seconds
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_MAX_DOWNLOAD_MB = int(os.getenv("HTTP_MAX_DOWNLOAD_MB", "50"))
+# async downloads hand the file writes to a thread in blocks of this size
+HTTP_WRITE_BUFFER_SIZE = 1024 * 1024
+
+try:
+    import h2  # noqa: F401
+    _h2_installed = True
+except ImportError:
+    _h2_installed = False
+HTTP_HTTP2 = os.getenv("HTTP_HTTP2", "true").lower() in ("1", "true", "yes") and _h2_installed
+
+
+class DownloadTooLarge(Exception):
+    pass
+
+
+class _Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.requests = 0
+        self.new_connections = 0
+        self.http2_responses = 0
+        self.bytes = 0
+        self.too_large = 0
+        self.failed = 0
+
+    def add(self, **counts) -> None:
+        with self._lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "http2_enabled": HTTP_HTTP2,
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_ratio": round(reused / self.requests, 4) if self.requests else 0.0,
+                "http2_responses": self.http2_responses,
+                "bytes_downloaded": self.bytes,
+                "rejected_too_large": self.too_large,
+                "failed": self.failed,
+                "max_connections": HTTP_MAX_CONNECTIONS,
+                "max_connections_per_host": HTTP_MAX_CONNECTIONS_PER_HOST,
+            }
+
+
+_metrics = _Metrics()
+
+
+def metrics() -> dict:
+    return _metrics.snapshot()
+
+
+def _trace(event: str, info: dict) -> None:
+    # httpcore reports every new TCP connection; requests without one reused a pooled connection
+    if event == "connection.connect_tcp.complete":
+        _metrics.add(new_connections=1)
+
+
+async def _atrace(event: str, info: dict) -> None:
+    _trace(event, info)
+
+
+def _host(url: str) -> str:
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}".lower()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+# ---- sync ------------------------------------------------------------------
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+_host_semaphores = {}
+
+
+def get_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(timeout=HTTP_TIMEOUT, limits=_limits(), http2=HTTP_HTTP2)
+    return _client
+
+
+def _host_semaphore(url: str) -> threading.BoundedSemaphore:
+    host = _host(url)
+    with _client_lock:
+        sem = _host_semaphores.get(host)
+        if sem is None:
+            sem = _host_semaphores[host] = threading.BoundedSemaphore(HTTP_MAX_CONNECTIONS_PER_HOST)
+        return sem
+
+
+def _check_length(response: httpx.Response, max_bytes: int) -> None:
+    length = response.headers.get("content-length")
+    if length and length.isdigit() and int(length) > max_bytes:
+        raise DownloadTooLarge(f"Content-Length {length} exceeds {max_bytes} bytes")
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def download(url: str, dest_path: str, client: Optional[httpx.Client] = None,
+             max_bytes: Optional[int] = None) -> bool:
+    """Streams `url` to `dest_path` on the shared client. False on any failure (nothing is left behind)."""
+    client = client or get_client()
+    max_bytes = max_bytes if max_bytes is not None else HTTP_MAX_DOWNLOAD_MB * 1024 * 1024
+    received = 0
+    try:
+        with _host_semaphore(url):
+            _metrics.add(requests=1)
+            with client.stream("GET", url, extensions={"trace": _trace}) as r:
+                if r.http_version == "HTTP/2":
+                    _metrics.add(http2_responses=1)
+                if r.status_code != 200:
+                    logger.error(f"HTTP download failed: {r.status_code} - {url}")
+                    _metrics.add(failed=1)
+                    return False
+                _check_length(r, max_bytes)
+                os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+                with open(dest_path, "wb") as f:
+                    for chunk in r.iter_bytes():
+                        received += len(chunk)
+                        if received > max_bytes:
+                            raise DownloadTooLarge(f"more than {max_bytes} bytes")
+                        f.write(chunk)
+        _metrics.add(bytes=received)
+        return True
+    except DownloadTooLarge as e:
+        logger.error(f"HTTP download rejected for url='{url}': {e}")
+        _metrics.add(too_large=1)
+    except Exception as e:
+        logger.exception(f"HTTP download failed for url='{url}': {e}")
+        _metrics.add(failed=1)
+    _remove(dest_path)
+    return False
+
+
+# ---- async -----------------------------------------------------------------
+
+class _LoopState:
+    """An AsyncClient and its per-host semaphores belong to the event loop they were created on."""
+
+    def __init__(self):
+        self._client = None
+        self.semaphores = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=_limits(), http2=HTTP_HTTP2)
+        return self._client
+
+    def semaphore(self, url: str) -> asyncio.Semaphore:
+        host = _host(url)
+        sem = self.semaphores.get(host)
+        if sem is None:
+            sem = self.semaphores[host] = asyncio.Semaphore(HTTP_MAX_CONNECTIONS_PER_HOST)
+        return sem
+
+
+_loop_states = weakref.WeakKeyDictionary()
+
+
+def _loop_state() -> _LoopState:
+    loop = asyncio.get_running_loop()
+    state = _loop_states.get(loop)
+    if state is None:
+        state = _loop_states[loop] = _LoopState()
+    return state
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """The shared AsyncClient of the running event loop."""
+    return _loop_state().client
+
+
+def _open_for_write(dest_path: str):
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    return open(dest_path, "wb")
+
+
+async def async_download(url: str, dest_path: str, client: Optional[httpx.AsyncClient] = None,
+                         max_bytes: Optional[int] = None) -> bool:
+    """
+    Streams `url` to `dest_path`: the network side runs on the event loop (no thread held
+    while waiting), disk writes go to a worker thread in HTTP_WRITE_BUFFER_SIZE blocks.
+    """
+    state = _loop_state()
+    client = client or state.client
+    max_bytes = max_bytes if max_bytes is not None else HTTP_MAX_DOWNLOAD_MB * 1024 * 1024
+    received = 0
+    try:
+        async with state.semaphore(url):
+            _metrics.add(requests=1)
+            async with client.stream("GET", url, extensions={"trace": _atrace}) as r:
+                if r.http_version == "HTTP/2":
+                    _metrics.add(http2_responses=1)
+                if r.status_code != 200:
+                    logger.error(f"HTTP download failed: {r.status_code} - {url}")
+                    _metrics.add(failed=1)
+                    return False
+                _check_length(r, max_bytes)
+                f = await asyncio.to_thread(_open_for_write, dest_path)
+                try:
+                    pending = bytearray()
+                    async for chunk in r.aiter_bytes():
+                        received += len(chunk)
+                        if received > max_bytes:
+                            raise DownloadTooLarge(f"more than {max_bytes} bytes")
+                        pending += chunk
+                        if len(pending) >= HTTP_WRITE_BUFFER_SIZE:
+                            block, pending = pending, bytearray()
+                            await asyncio.to_thread(f.write, block)
+                    if pending:
+                        await asyncio.to_thread(f.write, pending)
+                finally:
+                    await asyncio.to_thread(f.close)
+        _metrics.add(bytes=received)
+        return True
+    except DownloadTooLarge as e:
+        logger.error(f"HTTP download rejected for url='{url}': {e}")
+        _metrics.add(too_large=1)
+    except Exception as e:
+        logger.exception(f"HTTP download failed for url='{url}': {e}")
+        _metrics.add(failed=1)
+    _remove(dest_path)
+    return False
+
+
+def close() -> None:
+    """Closes the shared sync client (async clients are dropped together with their event loop)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -0,0 +1,315 @@
+# image_cache.py
+"""
+Size-bounded LRU cache of S3 objects on local disk.
+
+Image requests whose local file is missing (the prediction ran on another
+replica, or the pod was restarted) read the object from here instead of going
+back to S3 every time. Files are downloaded to a temporary name and renamed
+into place, and the index (key -> file, size, in LRU order) is rewritten
+atomically after every change, so the cache survives restarts. Concurrent misses
+for the same key share one download.
+
+Eviction can remove a file at any time, so a caller that reads a file after
+`get` returns (e.g. a FileResponse) should use `checkout`: it hands out a
+private hard link that stays readable until `release`.
+"""
+import os
+import uuid
+import shutil
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "uploads/cache")
+# total size of cached files; 0 disables the cache
+IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", "1024"))
+
+INDEX_FILE = "index.json"
+SERVING_DIR = "serving"
+
+
+class _Flight:
+    """One download in progress; later callers for the same key wait on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.path = None
+        self.size = 0
+
+
+class DiskObjectCache:
+    """
+    `get(key, fetch)` returns a local path for `key`, calling `fetch(dest_path) -> bool`
+    to download it on a miss. Returns None when the cache is disabled or the download failed.
+    """
+
+    def __init__(self, cache_dir: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> {"file": name, "size": bytes}, least recently used first
+        self._inflight = {}             # key -> _Flight
+        self._bytes = 0
+        self._reset_counters()
+        if self.enabled:
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _reset_counters(self) -> None:
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._failed = 0
+        self._evictions = 0
+        self._bytes_served = 0
+        self._bytes_fetched = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    @staticmethod
+    def _file_name(key: str) -> str:
+        # the extension is kept so FileResponse can guess the content type
+        ext = os.path.splitext(key)[1][:16]
+        return hashlib.sha256(key.encode("utf-8")).hexdigest() + ext
+
+    # ---- index ---------------------------------------------------------
+
+    def _load(self) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        try:
+            with open(self._path(INDEX_FILE)) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            saved = []
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable image cache index: {e}")
+            saved = []
+
+        for item in saved:
+            try:
+                key, name, size = item["key"], item["file"], int(item["size"])
+                if os.path.getsize(self._path(name)) != size:
+                    continue
+            except (KeyError, TypeError, ValueError, OSError):
+                continue
+            self._entries[key] = {"file": name, "size": size}
+            self._bytes += size
+
+        # files that are not in the index: interrupted downloads, or written after the last index save
+        known = {entry["file"] for entry in self._entries.values()} | {INDEX_FILE, SERVING_DIR}
+        for name in os.listdir(self.cache_dir):
+            if name not in known:
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    pass
+        # links checked out by a previous process
+        shutil.rmtree(self._path(SERVING_DIR), ignore_errors=True)
+
+        evicted = self._evict()
+        self._remove_files(evicted)
+        self._save_index()
+        if self._entries:
+            logger.info(f"Image cache: {len(self._entries)} entries ({self._bytes} bytes) in {self.cache_dir}")
+
+    def _save_index(self) -> None:
+        with self._index_lock:
+            with self._lock:
+                snapshot = [{"key": k, "file": e["file"], "size": e["size"]} for k, e in self._entries.items()]
+            path = self._path(INDEX_FILE)
+            tmp = f"{path}.tmp"
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp, path)
+            except OSError as e:
+                logger.warning(f"Failed to save image cache index: {e}")
+
+    # ---- lookups -------------------------------------------------------
+
+    def get(self, key: str, fetch: Callable[[str], bool]) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                path = self._path(entry["file"])
+                if os.path.exists(path):
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    self._bytes_served += entry["size"]
+                    return path
+                self._bytes -= self._entries.pop(key)["size"]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self._misses += 1
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.path is not None:
+                with self._lock:
+                    self._bytes_served += flight.size
+            return flight.path
+
+        try:
+            flight.path, flight.size = self._fetch(key, fetch)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+        return flight.path
+
+    def checkout(self, key: str, fetch: Callable[[str], bool]) -> Optional[str]:
+        """
+        Like `get`, but returns a hard link of the cached file that eviction cannot remove.
+        The caller must `release(path)` it once the file has been read.
+        """
+        for _ in range(3):
+            path = self.get(key, fetch)
+            if path is None:
+                return None
+            os.makedirs(self._path(SERVING_DIR), exist_ok=True)
+            link = os.path.join(self._path(SERVING_DIR), uuid.uuid4().hex + os.path.splitext(path)[1])
+            with self._lock:
+                try:
+                    os.link(path, link)
+                    return link
+                except FileNotFoundError:
+                    pass                        # evicted since get returned; fetch it again
+                except OSError:
+                    # no hard links on this filesystem: a private copy does the same job
+                    try:
+                        shutil.copyfile(path, link)
+                        return link
+                    except FileNotFoundError:
+                        pass
+        return None
+
+    @staticmethod
+    def release(path: str) -> None:
+        """Removes a link returned by `checkout`."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _fetch(self, key: str, fetch: Callable[[str], bool]):
+        """Downloads `key` into the cache; returns (path, size), or (None, 0) on failure."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        os.close(fd)
+        try:
+            try:
+                ok = fetch(tmp)
+            except Exception as e:
+                logger.exception(f"Image cache fetch failed for {key}: {e}")
+                ok = False
+            size = os.path.getsize(tmp) if ok and os.path.isfile(tmp) else None
+            if size is None:
+                with self._lock:
+                    self._failed += 1
+                return None, 0
+            if size > self.max_bytes:
+                logger.warning(f"Not caching {key}: {size} bytes is more than IMAGE_CACHE_MAX_MB")
+                with self._lock:
+                    self._failed += 1
+                return None, 0
+
+            name = self._file_name(key)
+            path = self._path(name)
+            os.replace(tmp, path)
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._bytes -= old["size"]
+                self._entries[key] = {"file": name, "size": size}
+                self._bytes += size
+                self._bytes_fetched += size
+                evicted = self._evict()
+            self._remove_files(evicted)
+            self._save_index()
+            return path, size
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _evict(self) -> list:
+        """Drops least recently used entries until the cache fits; returns their file names."""
+        evicted = []
+        while self._bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry["size"]
+            self._evictions += 1
+            evicted.append(entry["file"])
+        return evicted
+
+    def _remove_files(self, names) -> None:
+        for name in names:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+
+    def discard(self, key: str) -> None:
+        """Removes `key` (e.g. when the prediction is deleted)."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return
+            self._bytes -= entry["size"]
+        self._remove_files([entry["file"]])
+        self._save_index()
+
+    # ---- inspection ----------------------------------------------------
+
+    def reset(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None) -> None:
+        """Forgets the in-memory state and counters, then loads `cache_dir` (files are kept)."""
+        with self._lock:
+            if cache_dir is not None:
+                self.cache_dir = cache_dir
+            if max_bytes is not None:
+                self.max_bytes = max(0, int(max_bytes))
+            self._entries.clear()
+            self._bytes = 0
+            self._reset_counters()
+        if self.enabled:
+            self._load()
+
+    def stats(self) -> dict:
+        with self._lock:
+            served = self._hits + self._coalesced
+            lookups = served + self._misses
+            return {
+                "enabled": self.enabled,
+                "cache_dir": self.cache_dir,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "failed_fetches": self._failed,
+                "evictions": self._evictions,
+                "hit_ratio": round(served / lookups, 4) if lookups else 0.0,
+                "bytes_served": self._bytes_served,
+                "bytes_fetched": self._bytes_fetched,
+            }
+
+
+image_cache = DiskObjectCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_MB * 1024 * 1024)
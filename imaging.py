@@ -0,0 +1,60 @@
+# imaging.py
+import io
+import zlib
+from typing import Iterable, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# (label, score, [x1, y1, x2, y2])
+Detection = Tuple[str, float, list]
+
+_PALETTE = [
+    (255, 56, 56), (255, 157, 151), (255, 112, 31), (255, 178, 29), (207, 210, 49),
+    (72, 249, 10), (146, 204, 23), (61, 219, 134), (26, 147, 52), (0, 212, 187),
+    (44, 153, 168), (0, 194, 255), (52, 69, 147), (100, 115, 255), (0, 24, 236),
+    (132, 56, 255), (82, 0, 133), (203, 56, 255), (255, 149, 200), (255, 55, 199),
+]
+
+
+class InvalidImage(ValueError):
+    """The source could not be decoded as an image."""
+
+
+def load_image(source) -> np.ndarray:
+    """
+    Returns an HxWx3 uint8 array in BGR order (the layout ultralytics expects for arrays).
+    `source` can be a file path, raw encoded bytes or an already decoded array.
+    Raises InvalidImage when the data is not a readable image.
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    try:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            img = Image.open(io.BytesIO(source))
+        else:
+            img = Image.open(source)
+        rgb = np.asarray(img.convert("RGB"))
+    except FileNotFoundError:
+        raise
+    except (Image.UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise InvalidImage(f"Not a valid image: {e}") from e
+    return np.ascontiguousarray(rgb[..., ::-1])
+
+
+def draw_detections(image: Image.Image, detections: Iterable[Detection]) -> Image.Image:
+    """Draws boxes and `label score` captions on a copy of `image` (RGB)."""
+    out = image.convert("RGB").copy()
+    draw = ImageDraw.Draw(out)
+    line_width = max(2, round(sum(out.size) / 2 * 0.003))
+    for label, score, bbox in detections:
+        x1, y1, x2, y2 = [float(v) for v in bbox]
+        color = _PALETTE[zlib.crc32(str(label).encode()) % len(_PALETTE)]
+        draw.rectangle([x1, y1, x2, y2], outline=color, width=line_width)
+        caption = f"{label} {score:.2f}"
+        left, top, right, bottom = draw.textbbox((0, 0), caption)
+        tw, th = right - left, bottom - top
+        ty = y1 - th - 4 if y1 - th - 4 >= 0 else y1
+        draw.rectangle([x1, ty, x1 + tw + 4, ty + th + 4], fill=color)
+        draw.text((x1 + 2, ty + 2), caption, fill=(255, 255, 255))
+    return out
@@ -0,0 +1,533 @@
+# inference.py
+import os
+import queue
+import itertools
+import logging
+import threading
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from time import monotonic
+from typing import Any, Callable, List
+
+import numpy as np
+from PIL import Image
+
+from imaging import load_image, draw_detections, InvalidImage
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "8"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+# "0" = run the model inside the API process, "auto" = physical cores / threads per worker
+INFERENCE_WORKERS = os.getenv("INFERENCE_WORKERS", "0")
+INFERENCE_THREADS_PER_WORKER = int(os.getenv("INFERENCE_THREADS_PER_WORKER", "1"))
+INFERENCE_WORKER_TIMEOUT = float(os.getenv("INFERENCE_WORKER_TIMEOUT", "120"))
+# how often the pool checks for worker processes that died
+WORKER_POLL_INTERVAL = 0.5
+
+
+def physical_cores() -> int:
+    try:
+        import psutil
+        cores = psutil.cpu_count(logical=False)
+    except Exception:
+        cores = None
+    return cores or os.cpu_count() or 1
+
+
+def resolve_worker_count(value: str | None = None, threads_per_worker: int | None = None) -> int:
+    value = (INFERENCE_WORKERS if value is None else value).strip().lower()
+    threads = max(1, threads_per_worker or INFERENCE_THREADS_PER_WORKER)
+    if value == "auto":
+        return max(1, physical_cores() // threads)
+    try:
+        return max(0, int(value))
+    except ValueError:
+        logger.warning(f"Invalid INFERENCE_WORKERS={value!r}; running inference in-process.")
+        return 0
+
+
+class BatchScheduler:
+    """
+    Collects concurrent inference requests into batches.
+
+    Callers submit one source at a time; a dispatcher thread groups whatever
+    arrives within `max_wait_ms` (up to `max_batch_size` items), runs a single
+    `predict_fn(sources)` call and hands each caller its own result.
+    `concurrency` bounds how many batches may be in flight at once (one per
+    inference worker process when a WorkerPool is behind the scheduler).
+    """
+
+    def __init__(self, predict_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 8, max_wait_ms: float = 5.0, concurrency: int = 1):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.concurrency = max(1, int(concurrency))
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._executor = None
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._errors = 0          # batch calls that raised or returned the wrong number of results
+        self._item_errors = 0     # requests that got an exception
+        self._retried_batches = 0
+        self._batch_sizes = {}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._infer_total = 0.0
+        self._recent_waits = deque(maxlen=1024)
+
+    def _ensure_started(self):
+        # started lazily so forked uvicorn workers each get their own thread
+        if self._thread is None or not self._thread.is_alive():
+            if self.concurrency > 1 and self._executor is None:
+                self._executor = ThreadPoolExecutor(self.concurrency, thread_name_prefix="inference-batch")
+            self._thread = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+            self._thread.start()
+
+    def submit(self, source: Any) -> Future:
+        fut = Future()
+        with self._cond:
+            self._ensure_started()
+            self._queue.append((source, fut, monotonic()))
+            self._cond.notify()
+        return fut
+
+    def predict(self, source: Any, timeout: float | None = None) -> Any:
+        return self.submit(source).result(timeout=timeout)
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = monotonic() + self.max_wait
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _run(self):
+        while True:
+            # wait for a free slot first so the queue keeps filling while all slots are busy
+            self._slots.acquire()
+            batch = self._next_batch()
+            if self._executor is None:
+                self._run_batch(batch)
+            else:
+                self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        try:
+            self._infer(batch)
+        finally:
+            self._slots.release()
+
+    def _call(self, sources):
+        results = list(self.predict_fn(sources))
+        if len(results) == len(sources):
+            return results
+        if len(sources) == 1:
+            # ultralytics skips sources it cannot read instead of raising
+            raise InvalidImage("The model could not read the image")
+        raise RuntimeError(f"Model returned {len(results)} results for a batch of {len(sources)}")
+
+    def _infer(self, batch):
+        started = monotonic()
+        sources = [src for src, _, _ in batch]
+        try:
+            results = self._call(sources)
+        except Exception as e:
+            with self._stats_lock:
+                self._errors += 1
+            if len(batch) == 1:
+                logger.warning(f"Inference failed: {e}")
+                with self._stats_lock:
+                    self._item_errors += 1
+                batch[0][1].set_exception(e)
+                return
+            # one unreadable image must not fail the other requests: run the items one at a time
+            logger.warning(f"Batched inference failed (batch_size={len(batch)}), retrying items one by one: {e}")
+            self._infer_each(batch, started)
+            return
+
+        elapsed = monotonic() - started
+        self._record(batch, started, elapsed)
+        for (_, fut, _), res in zip(batch, results):
+            fut.set_result(res)
+
+    def _infer_each(self, batch, started):
+        with self._stats_lock:
+            self._retried_batches += 1
+        outcomes = []
+        for src, fut, _ in batch:
+            try:
+                outcomes.append((fut, self._call([src])[0], None))
+            except Exception as e:
+                outcomes.append((fut, None, e))
+        self._record(batch, started, monotonic() - started)
+        for fut, res, error in outcomes:
+            if error is None:
+                fut.set_result(res)
+            else:
+                with self._stats_lock:
+                    self._item_errors += 1
+                fut.set_exception(error)
+
+    def _record(self, batch, started, elapsed):
+        with self._stats_lock:
+            self._batches += 1
+            self._items += len(batch)
+            self._infer_total += elapsed
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            for _, _, enqueued in batch:
+                waited = started - enqueued
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+                self._recent_waits.append(waited)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            depth = len(self._queue)
+        with self._stats_lock:
+            batches, items = self._batches, self._items
+            waits = sorted(self._recent_waits)
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "concurrency": self.concurrency,
+                "queue_depth": depth,
+                "batches": batches,
+                "items": items,
+                "errors": self._errors,
+                "item_errors": self._item_errors,
+                "retried_batches": self._retried_batches,
+                "avg_batch_size": round(items / batches, 3) if batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "avg_queue_wait_ms": round(self._wait_total / items * 1000, 3) if items else 0.0,
+                "p50_queue_wait_ms": _percentile_ms(waits, 0.50),
+                "p99_queue_wait_ms": _percentile_ms(waits, 0.99),
+                "max_queue_wait_ms": round(self._wait_max * 1000, 3),
+                "avg_batch_inference_ms": round(self._infer_total / batches * 1000, 3) if batches else 0.0,
+            }
+
+    def reset_metrics(self) -> None:
+        with self._stats_lock:
+            self._batches = self._items = self._errors = self._item_errors = self._retried_batches = 0
+            self._batch_sizes = {}
+            self._wait_total = self._wait_max = self._infer_total = 0.0
+            self._recent_waits.clear()
+
+
+def _percentile_ms(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return round(sorted_values[idx] * 1000, 3)
+
+
+class LiteBox:
+    """One detection, indexed like a row of ultralytics `Boxes` (box.cls[0], box.conf[0], box.xyxy[0])."""
+
+    __slots__ = ("xyxy", "cls", "conf")
+
+    def __init__(self, xyxy, cls, conf):
+        self.xyxy = np.asarray([xyxy], dtype=np.float32)
+        self.cls = np.asarray([cls], dtype=np.float32)
+        self.conf = np.asarray([conf], dtype=np.float32)
+
+
+class LiteResult:
+    """
+    Minimal stand-in for an ultralytics `Results` object, built from plain
+    (xyxy, cls, conf) tuples so it can cross a process boundary cheaply.
+    """
+
+    def __init__(self, orig_img: np.ndarray, boxes, names: dict):
+        self.orig_img = orig_img
+        self.names = names
+        self.boxes = [LiteBox(*b) for b in boxes]
+
+    def detections(self):
+        return [
+            (self.names[int(b.cls[0].item())], float(b.conf[0]), b.xyxy[0].tolist())
+            for b in self.boxes
+        ]
+
+    def plot(self) -> np.ndarray:
+        # same channel order as ultralytics: BGR in, BGR out
+        rgb = Image.fromarray(self.orig_img[..., ::-1])
+        return np.asarray(draw_detections(rgb, self.detections()))[..., ::-1]
+
+
+def boxes_to_tuples(result) -> list:
+    return [
+        (box.xyxy[0].tolist(), int(box.cls[0].item()), float(box.conf[0]))
+        for box in result.boxes
+    ]
+
+
+def _attach_shm(name: str):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: attaching registers the segment with the resource tracker,
+        # which would unlink it under the parent's feet when this worker exits.
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def load_yolo(weights: str):
+    from ultralytics import YOLO
+    return YOLO(weights)
+
+
+def _worker_main(model_factory, weights, threads, tasks, results, current):
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+    model = model_factory(weights)
+    results.put(("ready", os.getpid(), dict(model.names)))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, specs, kwargs = task
+        # shared with the parent without a feeder thread, so it is readable even if this process dies
+        current.value = task_id
+        shms = []
+        try:
+            arrays = []
+            for name, shape, dtype in specs:
+                shm = _attach_shm(name)
+                shms.append(shm)
+                arrays.append(np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf))
+            out = model(arrays, device="cpu", **kwargs)
+            payload = [boxes_to_tuples(r) for r in out]
+            del arrays, out
+            results.put(("ok", task_id, payload))
+        except Exception as e:
+            results.put(("error", task_id, f"{type(e).__name__}: {e}"))
+        finally:
+            current.value = -1
+            for shm in shms:
+                try:
+                    shm.close()
+                except BufferError:
+                    pass
+
+
+class WorkerPool:
+    """
+    Runs the model in `workers` separate processes, each with its own copy of
+    the weights and `threads_per_worker` torch threads.
+
+    Images are decoded in the API process and written to shared memory; only
+    the segment name/shape/dtype goes through the task queue, and workers send
+    back plain box tuples. Calling the pool looks like calling a YOLO model.
+    """
+
+    def __init__(self, weights: str, workers: int, threads_per_worker: int = 1,
+                 model_factory: Callable[[str], Any] = load_yolo, timeout: float = 120.0):
+        self.weights = weights
+        self.workers = max(1, int(workers))
+        self.threads_per_worker = max(1, int(threads_per_worker))
+        self.model_factory = model_factory
+        self.timeout = timeout
+
+        self._ctx = mp.get_context("spawn")
+        self._tasks = None
+        self._results = None
+        self._procs = []          # per worker slot; None once its worker failed to start
+        self._current = []        # per worker slot: id of the task it is running, -1 when idle
+        self._ready_pids = set()
+        self._collector = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._pending = {}
+        self._ready = threading.Event()
+        self._ready_count = 0
+        self._names = None
+        self._completed = 0
+        self._failed = 0
+        self._restarts = 0
+        self._start_failures = 0
+        self._broken = False      # every slot failed to start: calls fail at once instead of timing out
+
+    def start(self) -> None:
+        with self._lock:
+            if self._procs:
+                return
+            self._tasks = self._ctx.Queue()
+            self._results = self._ctx.Queue()
+            self._current = []
+            self._broken = False
+            self._ready.clear()
+            for i in range(self.workers):
+                self._current.append(self._ctx.Value("q", -1, lock=False))
+                self._procs.append(self._spawn(i))
+            self._collector = threading.Thread(target=self._collect, name="inference-pool-collector", daemon=True)
+            self._collector.start()
+            logger.info(f"Inference pool started: {self.workers} workers x {self.threads_per_worker} threads")
+
+    def _spawn(self, slot: int):
+        p = self._ctx.Process(
+            target=_worker_main,
+            args=(self.model_factory, self.weights, self.threads_per_worker, self._tasks, self._results,
+                  self._current[slot]),
+            name=f"inference-worker-{slot}",
+            daemon=True,
+        )
+        p.start()
+        return p
+
+    def _reap(self):
+        """Fails the task of every worker process that died and starts a replacement."""
+        failed = []
+        with self._lock:
+            for slot, p in enumerate(self._procs):
+                if p is None or p.is_alive():
+                    continue
+                task_id = self._current[slot].value
+                self._current[slot].value = -1
+                fut = self._pending.pop(task_id, None) if task_id >= 0 else None
+                if fut is not None:
+                    self._failed += 1
+                    failed.append(fut)
+                if p.pid not in self._ready_pids:
+                    # died while loading the model: restarting would only crash again
+                    logger.error(f"{p.name} exited with code {p.exitcode} before becoming ready")
+                    self._procs[slot] = None
+                    self._start_failures += 1
+                    continue
+                self._ready_pids.discard(p.pid)
+                self._ready_count -= 1
+                self._restarts += 1
+                logger.error(f"{p.name} (pid {p.pid}) exited with code {p.exitcode} while running "
+                             f"task {task_id if task_id >= 0 else '-'}; restarting it")
+                self._procs[slot] = self._spawn(slot)
+            if self._procs and not self._broken and all(p is None for p in self._procs):
+                logger.error("No inference worker could start; failing inference calls")
+                self._broken = True
+                failed += self._pending.values()
+                self._pending.clear()
+                self._ready.set()   # wake callers waiting in `names`
+        for fut in failed:
+            fut.set_exception(RuntimeError("Inference worker process died while running the task"))
+
+    def _collect(self):
+        while True:
+            try:
+                msg = self._results.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                self._reap()
+                continue
+            if msg is None:
+                break
+            kind = msg[0]
+            if kind == "ready":
+                with self._lock:
+                    self._names = msg[2]
+                    self._ready_count += 1
+                    self._ready_pids.add(msg[1])
+                self._ready.set()
+                self._reap()
+                continue
+            _, task_id, payload = msg
+            with self._lock:
+                fut = self._pending.pop(task_id, None)
+                if kind == "ok":
+                    self._completed += 1
+                else:
+                    self._failed += 1
+            if fut is None:
+                continue
+            if kind == "ok":
+                fut.set_result(payload)
+            else:
+                fut.set_exception(RuntimeError(f"Inference worker failed: {payload}"))
+            self._reap()
+
+    @property
+    def names(self) -> dict:
+        self.start()
+        if not self._ready.wait(self.timeout):
+            raise RuntimeError("Inference workers did not become ready in time")
+        if self._broken:
+            raise RuntimeError("No inference worker could start")
+        return self._names
+
+    def __call__(self, sources, device: str = "cpu", **kwargs):
+        if not isinstance(sources, (list, tuple)):
+            sources = [sources]
+        names = self.names
+        arrays = [load_image(s) for s in sources]
+
+        shms, specs = [], []
+        try:
+            for arr in arrays:
+                shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+                shms.append(shm)
+                np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+                specs.append((shm.name, arr.shape, arr.dtype.str))
+
+            fut = Future()
+            task_id = next(self._ids)
+            with self._lock:
+                self._pending[task_id] = fut
+            self._tasks.put((task_id, specs, kwargs))
+            try:
+                payload = fut.result(timeout=self.timeout)
+            finally:
+                with self._lock:
+                    self._pending.pop(task_id, None)
+        finally:
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+
+        return [LiteResult(arr, boxes, names) for arr, boxes in zip(arrays, payload)]
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "threads_per_worker": self.threads_per_worker,
+                "workers_alive": sum(1 for p in self._procs if p is not None and p.is_alive()),
+                "workers_ready": self._ready_count,
+                "tasks_in_flight": len(self._pending),
+                "tasks_completed": self._completed,
+                "tasks_failed": self._failed,
+                "worker_restarts": self._restarts,
+                "worker_start_failures": self._start_failures,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            procs, self._procs = self._procs, []
+        if not procs:
+            return
+        procs = [p for p in procs if p is not None]
+        for _ in procs:
+            self._tasks.put(None)
+        for p in procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        self._results.put(None)
@@ -0,0 +1,121 @@
+# migrations.py
+"""
+Small, idempotent schema migrations for databases created before a column existed.
+`Base.metadata.create_all` only creates missing tables, so new columns on existing
+tables are added here. Runs at app startup; can also be run by hand:
+
+    python migrations.py
+"""
+import logging
+
+from sqlalchemy import bindparam, inspect, select, text
+
+from db import Base, engine as default_engine
+from models import DetectionObject, HourlyPredictionRollup, HourlyLabelRollup
+from queries import parse_box, box_columns
+import rollups
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+BACKFILL_BATCH_SIZE = 1000
+
+BOX_COLUMNS = ("x1", "y1", "x2", "y2", "area")
+
+SESSION_COLUMNS = (("source_s3_key", "VARCHAR"), ("predicted_uploaded_at", "TIMESTAMP"))
+
+# indexes superseded by a wider one in models.py
+OBSOLETE_INDEXES = ("ix_prediction_sessions_timestamp",)
+
+
+def add_missing_columns(engine, table: str, columns) -> list:
+    inspector = inspect(engine)
+    if not inspector.has_table(table):
+        return []   # Base.metadata.create_all creates it with every column
+    existing = {c["name"] for c in inspector.get_columns(table)}
+    added = []
+    with engine.begin() as conn:
+        for name, ddl_type in columns:
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+                added.append(name)
+    if added:
+        logger.info(f"Added columns to {table}: {', '.join(added)}")
+    return added
+
+
+def backfill_detection_boxes(engine, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Fills x1/y1/x2/y2/area from the `box` string for rows that do not have them yet."""
+    table = DetectionObject.__table__
+    update = (
+        table.update()
+        .where(table.c.id == bindparam("row_id"))
+        .values({name: bindparam(name) for name in BOX_COLUMNS})
+    )
+    filled, last_id = 0, 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.box)
+                .where(table.c.x1.is_(None), table.c.box.isnot(None), table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            params = []
+            for row in rows:
+                bbox = parse_box(row.box)
+                if bbox is None:
+                    logger.warning(f"detection_objects.id={row.id}: cannot parse box {row.box!r}")
+                    continue
+                params.append({"row_id": row.id, **box_columns(bbox)})
+            if params:
+                conn.execute(update, params)
+            filled += len(params)
+    if filled:
+        logger.info(f"Backfilled numeric boxes for {filled} detection rows")
+    return filled
+
+
+def create_missing_indexes(engine) -> list:
+    """Creates indexes declared in models.py that an existing database does not have yet."""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+                created.append(index.name)
+    if created:
+        logger.info(f"Created indexes: {', '.join(created)}")
+    return created
+
+
+def drop_obsolete_indexes(engine) -> None:
+    with engine.begin() as conn:
+        for name in OBSOLETE_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def run_migrations(engine=None) -> None:
+    engine = engine or default_engine
+    add_missing_columns(engine, "detection_objects", [(name, "FLOAT") for name in BOX_COLUMNS])
+    add_missing_columns(engine, "prediction_sessions", SESSION_COLUMNS)
+    backfill_detection_boxes(engine)
+    create_missing_indexes(engine)
+    drop_obsolete_indexes(engine)
+    # rollup tables are new: create them and fill them from existing predictions
+    Base.metadata.create_all(bind=engine, tables=[HourlyPredictionRollup.__table__, HourlyLabelRollup.__table__])
+    if rollups.needs_rebuild(engine):
+        rollups.rebuild(engine)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_migrations()
@@ -1,6 +1,6 @@
 
 # models.py
-from sqlalchemy import Column, String, DateTime, Integer, Float, ForeignKey
+from sqlalchemy import Column, String, DateTime, Integer, Float, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from sqlalchemy.orm import declarative_base
@@ -23,10 +23,19 @@ class PredictionSession(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     original_image = Column(String)
     predicted_image = Column(String)
-    username = Column(String, ForeignKey('users.username'))
+    username = Column(String, ForeignKey('users.username'), index=True)
+    # ?img= predictions: the caller's S3 key the original was read from (not copied to <user>/original/)
+    source_s3_key = Column(String)
+    # set once the rendered image has been uploaded, so every replica knows the predicted key exists
+    predicted_uploaded_at = Column(DateTime)
     user = relationship("User", back_populates="sessions")
     objects = relationship("DetectionObject", back_populates="session")
 
+    __table_args__ = (
+        # time-window filters and keyset pagination (ORDER BY timestamp, uid)
+        Index("ix_prediction_sessions_timestamp_uid", "timestamp", "uid"),
+    )
+
 class DetectionObject(Base):
     __tablename__ = 'detection_objects'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -34,4 +43,39 @@ class DetectionObject(Base):
     label = Column(String)
     score = Column(Float)
     box = Column(String)
-    session = relationship("PredictionSession", back_populates="objects")
\ No newline at end of file
+    # numeric copy of `box` so size / position can be filtered in SQL
+    x1 = Column(Float)
+    y1 = Column(Float)
+    x2 = Column(Float)
+    y2 = Column(Float)
+    area = Column(Float)
+    session = relationship("PredictionSession", back_populates="objects")
+
+    __table_args__ = (
+        Index("ix_detection_objects_prediction_uid", "prediction_uid"),
+        # label/score filters join back to the session, so carry prediction_uid in the index
+        Index("ix_detection_objects_label_prediction_uid", "label", "prediction_uid"),
+        Index("ix_detection_objects_score_prediction_uid", "score", "prediction_uid"),
+        Index("ix_detection_objects_area", "area"),
+    )
+
+class PredictionCacheEntry(Base):
+    __tablename__ = 'prediction_cache'
+    key = Column(String, primary_key=True)
+    detections = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class HourlyPredictionRollup(Base):
+    # one row per UTC hour; maintained by queries.py on every save/delete
+    __tablename__ = 'hourly_prediction_rollups'
+    hour = Column(DateTime, primary_key=True)
+    predictions = Column(Integer, nullable=False, default=0)
+    detections = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Float, nullable=False, default=0.0)
+
+class HourlyLabelRollup(Base):
+    __tablename__ = 'hourly_label_rollups'
+    hour = Column(DateTime, primary_key=True)
+    label = Column(String, primary_key=True)
+    detections = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Float, nullable=False, default=0.0)
@@ -0,0 +1,137 @@
+# pipeline.py
+import os
+import queue
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from time import monotonic
+
+from inference import _percentile_ms
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# blocking network calls (boto3, DB round trips) – mostly waiting, so many threads are cheap
+IO_CONCURRENCY = int(os.getenv("IO_CONCURRENCY", "32"))
+# decode / hash / render / encode – sized to the machine, independent of the I/O stages
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "0")) or (os.cpu_count() or 1)
+# items allowed to wait in front of each stage before producers are held back (0 = unbounded)
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "64"))
+
+
+class Stage:
+    """
+    One step of the /predict pipeline: a bounded queue drained by `workers` threads.
+
+    Different requests occupy different stages at the same time, so a download
+    for one request overlaps with inference or rendering for another. When the
+    queue is full, `run()` waits for room without holding the event loop.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int = PIPELINE_QUEUE_SIZE):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._running = 0
+        self._completed = 0
+        self._errors = 0
+        self._blocked = 0
+        self._recent_waits = deque(maxlen=1024)
+        self._recent_service = deque(maxlen=1024)
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Queues `fn(*args, **kwargs)`; blocks the calling thread while the queue is full."""
+        self._ensure_started()
+        fut = Future()
+        self._queue.put((fut, fn, args, kwargs, monotonic()))
+        return fut
+
+    async def run(self, fn, *args, **kwargs):
+        self._ensure_started()
+        fut = Future()
+        item = (fut, fn, args, kwargs, monotonic())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._stats_lock:
+                self._blocked += 1
+            await asyncio.get_running_loop().run_in_executor(None, self._queue.put, item)
+        return await asyncio.wrap_future(fut)
+
+    def _worker(self) -> None:
+        while True:
+            fut, fn, args, kwargs, enqueued = self._queue.get()
+            if not fut.set_running_or_notify_cancel():
+                continue
+            start = monotonic()
+            with self._stats_lock:
+                self._running += 1
+                self._recent_waits.append(start - enqueued)
+            failed = False
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                failed = True
+                fut.set_exception(e)
+            finally:
+                with self._stats_lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._errors += failed
+                    self._recent_service.append(monotonic() - start)
+
+    def metrics(self) -> dict:
+        with self._stats_lock:
+            waits = sorted(self._recent_waits)
+            service = sorted(self._recent_service)
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queue.qsize(),
+                "running": self._running,
+                "completed": self._completed,
+                "errors": self._errors,
+                "blocked_submits": self._blocked,
+                "p50_queue_wait_ms": _percentile_ms(waits, 0.50),
+                "p99_queue_wait_ms": _percentile_ms(waits, 0.99),
+                "avg_latency_ms": round(sum(service) / len(service) * 1000, 3) if service else 0.0,
+                "p50_latency_ms": _percentile_ms(service, 0.50),
+                "p99_latency_ms": _percentile_ms(service, 0.99),
+            }
+
+    def reset_metrics(self) -> None:
+        with self._stats_lock:
+            self._completed = self._errors = self._blocked = 0
+            self._recent_waits.clear()
+            self._recent_service.clear()
+
+
+# download -> decode -> inference (BatchScheduler) -> render -> persist
+download_stage = Stage("download", IO_CONCURRENCY)
+decode_stage = Stage("decode", CPU_WORKERS)
+render_stage = Stage("render", CPU_WORKERS)
+persist_stage = Stage("persist", IO_CONCURRENCY)
+
+STAGES = (download_stage, decode_stage, render_stage, persist_stage)
+
+
+def pipeline_metrics() -> dict:
+    return {stage.name: stage.metrics() for stage in STAGES}
@@ -0,0 +1,110 @@
+# prediction_cache.py
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import queries
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# number of entries kept in memory; 0 disables the cache
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "1024"))
+# also keep entries in the prediction_cache table so they survive restarts / are shared by replicas
+PREDICTION_CACHE_PERSIST = os.getenv("PREDICTION_CACHE_PERSIST", "false").lower() in ("1", "true", "yes")
+
+
+def make_key(digest: str, model_id: str, params: dict) -> str:
+    """Cache key = content hash of the image + model identity + inference parameters."""
+    h = hashlib.sha256()
+    h.update(digest.encode())
+    h.update(model_id.encode())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class PredictionCache:
+    """
+    LRU of detections keyed by `make_key(...)`, with an optional persistent
+    second tier in the database. Detections are stored as (label, score, bbox) lists.
+    """
+
+    def __init__(self, max_entries: int = 1024, persist: bool = False):
+        self.max_entries = max(0, int(max_entries))
+        self.persist = persist
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._db_hits = 0
+        self._misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str, db=None) -> Optional[List]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key]
+
+        if self.persist and db is not None:
+            detections = queries.query_get_cached_detections(db, key)
+            if detections is not None:
+                with self._lock:
+                    self._db_hits += 1
+                self._remember(key, detections)
+                return detections
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def put(self, key: str, detections: List, db=None) -> None:
+        if not self.enabled:
+            return
+        detections = [(label, float(score), [float(v) for v in bbox]) for label, score, bbox in detections]
+        self._remember(key, detections)
+        if self.persist and db is not None:
+            try:
+                queries.query_save_cached_detections(db, key, detections)
+            except Exception as e:
+                logger.warning(f"Failed to persist prediction cache entry {key[:12]}: {e}")
+
+    def _remember(self, key: str, detections: List) -> None:
+        with self._lock:
+            self._entries[key] = detections
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._hits = self._db_hits = self._misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._hits + self._db_hits
+            lookups = hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "persistent": self.persist,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": hits,
+                "memory_hits": self._hits,
+                "db_hits": self._db_hits,
+                "misses": self._misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_PERSIST)
@@ -1,111 +1,276 @@
 
 #queries.py
+import json
+from collections import defaultdict
+from sqlalchemy import insert, select, or_, and_, func
 from sqlalchemy.orm import Session
-from models import PredictionSession, DetectionObject,User
-from datetime import datetime, timedelta
+from models import (PredictionSession, DetectionObject, User, PredictionCacheEntry,
+                    HourlyPredictionRollup, HourlyLabelRollup)
+from datetime import datetime
+import rollups
+
+def parse_box(box):
+    """Parses a stored "[x1, y1, x2, y2]" string; returns None if it is not four numbers."""
+    try:
+        values = [float(v) for v in json.loads(box)]
+    except (TypeError, ValueError):
+        return None
+    return values if len(values) == 4 else None
+
+def box_columns(bbox) -> dict:
+    x1, y1, x2, y2 = [float(v) for v in bbox]
+    return {"x1": x1, "y1": y1, "x2": x2, "y2": y2, "area": max(0.0, x2 - x1) * max(0.0, y2 - y1)}
 
 def ensure_user(db: Session, username: str):
+    # no commit here: the caller's transaction covers the new user row
     if not username:
         return
     user = db.get(User, username)
     if user is None:
         db.add(User(username=username, password="")) 
-        db.commit()
+        db.flush()
 
-def query_save_prediction_session(db: Session, uid: str, original_image: str, predicted_image: str, username=None):
+def query_save_prediction_session(db: Session, uid: str, original_image: str, predicted_image: str,
+                                  username=None, detections=None, source_s3_key=None):
+    """
+    Saves the session, (optionally) all of its detections and the hourly rollups in one transaction.
+    `detections` is an iterable of (label, score, bbox); boxes are inserted with a single executemany.
+    `source_s3_key` is the S3 key the original was read from, when it is not uploaded under our own key.
+    """
     ensure_user(db, username)
+    timestamp = datetime.utcnow()
     session = PredictionSession(
         uid=uid,
         original_image=original_image,
         predicted_image=predicted_image,
         username=username,
-        timestamp=datetime.utcnow()
+        source_s3_key=source_s3_key,
+        timestamp=timestamp
     )
     db.add(session)
+    rows = [
+        {"prediction_uid": uid, "label": label, "score": score, "box": str(bbox), **box_columns(bbox)}
+        for label, score, bbox in (detections or [])
+    ]
+    if rows:
+        db.flush()
+        db.execute(insert(DetectionObject), rows)
+    rollups.apply(db, timestamp, [(r["label"], r["score"]) for r in rows])
     db.commit()
 
 def query_save_detection_object(db: Session, prediction_uid: str, label: str, score: float, box: str):
-    obj = DetectionObject(prediction_uid=prediction_uid, label=label, score=score, box=str(box))
+    bbox = parse_box(box) if isinstance(box, str) else box
+    columns = box_columns(bbox) if bbox is not None else {}
+    obj = DetectionObject(prediction_uid=prediction_uid, label=label, score=score, box=str(box), **columns)
     db.add(obj)
+    session = db.get(PredictionSession, prediction_uid)
+    if session is not None and session.timestamp is not None:
+        rollups.apply(db, session.timestamp, [(label, score)], predictions=0)
     db.commit()
 
 def query_get_prediction_by_uid(db: Session, uid: str):
     return db.query(PredictionSession).filter_by(uid=uid).first()
 
-def query_get_predictions_by_label(db: Session, label: str):
-    rows = (
-        db.query(PredictionSession.uid, PredictionSession.timestamp)
-        .join(DetectionObject, DetectionObject.prediction_uid == PredictionSession.uid)
-        .filter(DetectionObject.label == label)
-        .distinct()
-        .all()
+def query_mark_predicted_uploaded(db: Session, uid: str) -> bool:
+    updated = (
+        db.query(PredictionSession)
+        .filter(PredictionSession.uid == uid)
+        .update({PredictionSession.predicted_uploaded_at: datetime.utcnow()}, synchronize_session=False)
     )
-    return [{"uid": uid, "timestamp": ts.isoformat() if ts else None} for uid, ts in rows]
+    db.commit()
+    return bool(updated)
 
-def query_get_predictions_by_score(db: Session, min_score: float):
-    rows = (
-        db.query(PredictionSession.uid, PredictionSession.timestamp)
-        .join(DetectionObject, DetectionObject.prediction_uid == PredictionSession.uid)
-        .filter(DetectionObject.score >= min_score)
-        .distinct()
-        .all()
-    )
-    return [{"uid": uid, "timestamp": ts.isoformat() if ts else None} for uid, ts in rows]
+def _sessions_page(db: Session, condition, limit=None, after=None):
+    """
+    Sessions matching `condition`, newest first, ordered by (timestamp, uid) so pages stay stable
+    while new predictions arrive. `after` is the (timestamp, uid) of the last row of the previous page.
+    """
+    q = db.query(PredictionSession.uid, PredictionSession.timestamp).filter(condition)
+    if after is not None:
+        ts, uid = after
+        q = q.filter(or_(
+            PredictionSession.timestamp < ts,
+            and_(PredictionSession.timestamp == ts, PredictionSession.uid < uid),
+        ))
+    q = q.order_by(PredictionSession.timestamp.desc(), PredictionSession.uid.desc())
+    if limit is not None:
+        q = q.limit(limit)
+    return [{"uid": uid, "timestamp": ts.isoformat() if ts else None} for uid, ts in q.all()]
+
+def _with_detection(*criteria):
+    """
+    Sessions that have a detection matching `criteria`. The filter is driven from the
+    detection_objects label/score index and joined to the sessions by primary key, so a rare
+    label or a high threshold reads only the matching detections instead of walking the sessions
+    newest first until enough of them match. The page is then sorted from that set.
+    """
+    return PredictionSession.uid.in_(select(DetectionObject.prediction_uid).where(*criteria))
+
+def query_get_predictions_by_label(db: Session, label: str, limit=None, after=None):
+    return _sessions_page(db, _with_detection(DetectionObject.label == label), limit=limit, after=after)
+
+def query_get_predictions_by_score(db: Session, min_score: float, limit=None, after=None):
+    return _sessions_page(db, _with_detection(DetectionObject.score >= min_score), limit=limit, after=after)
 
 def query_get_prediction_count_last_week(db: Session):
-    one_week_ago = datetime.utcnow() - timedelta(days=7)
-    return db.query(PredictionSession).filter(PredictionSession.timestamp >= one_week_ago).count()
+    """Predictions in the current hour and the 167 before it, summed from the hourly rollups."""
+    total = (
+        db.query(func.sum(HourlyPredictionRollup.predictions))
+        .filter(HourlyPredictionRollup.hour >= rollups.week_start())
+        .scalar()
+    )
+    return int(total or 0)
 
 def query_get_labels_from_last_week(db: Session):
-    one_week_ago = datetime.utcnow() - timedelta(days=7)
     rows = (
-        db.query(DetectionObject.label)
-        .join(PredictionSession, DetectionObject.prediction_uid == PredictionSession.uid)
-        .filter(PredictionSession.timestamp >= one_week_ago)
+        db.query(HourlyLabelRollup.label)
+        .filter(HourlyLabelRollup.hour >= rollups.week_start(), HourlyLabelRollup.detections > 0)
         .distinct()
         .all()
     )
     return [r[0] for r in rows]
 
 def query_delete_prediction(db: Session, uid: str):
+    """Deletes the session and its detections and takes them out of the hourly rollups, in one transaction."""
     prediction = db.query(PredictionSession).filter_by(uid=uid).first()
     if prediction:
+        if prediction.timestamp is not None:
+            detections = (
+                db.query(DetectionObject.label, DetectionObject.score)
+                .filter(DetectionObject.prediction_uid == uid)
+                .all()
+            )
+            rollups.apply(db, prediction.timestamp, detections, sign=-1)
         db.query(DetectionObject).filter(DetectionObject.prediction_uid == uid).delete()
         db.delete(prediction)
         db.commit()
         return prediction
     return None
 
-def query_get_prediction_stats(db: Session):
-    one_week_ago = datetime.utcnow() - timedelta(days=7)
-    total = db.query(PredictionSession).filter(PredictionSession.timestamp >= one_week_ago).count()
+def query_get_predictions_to_delete(db: Session, uids=None, username=None, before=None, limit=500):
+    """Oldest sessions matching all given bulk-delete filters (`before` is a naive UTC datetime)."""
+    q = db.query(PredictionSession)
+    if uids is not None:
+        q = q.filter(PredictionSession.uid.in_(list(uids)))
+    if username is not None:
+        q = q.filter(PredictionSession.username == username)
+    if before is not None:
+        q = q.filter(PredictionSession.timestamp < before)
+    return q.order_by(PredictionSession.timestamp, PredictionSession.uid).limit(limit).all()
+
+def query_delete_predictions(db: Session, uids) -> int:
+    """
+    Set-based version of query_delete_prediction: deletes the sessions in `uids`
+    and their detections with one statement each and takes them out of the hourly
+    rollups (one update per hour and label), in one transaction. Returns the number
+    of sessions deleted.
+    """
+    sessions = (
+        db.query(PredictionSession.uid, PredictionSession.timestamp)
+        .filter(PredictionSession.uid.in_(list(uids)))
+        .all()
+    )
+    if not sessions:
+        return 0
+    found = [uid for uid, _ in sessions]
 
-    scores = (
-        db.query(DetectionObject.score)
-        .join(PredictionSession, DetectionObject.prediction_uid == PredictionSession.uid)
-        .filter(PredictionSession.timestamp >= one_week_ago)
+    hour_of = {uid: rollups.floor_hour(ts) for uid, ts in sessions if ts is not None}
+    per_hour = defaultdict(lambda: [0, []])
+    for hour in hour_of.values():
+        per_hour[hour][0] += 1
+    detections = (
+        db.query(DetectionObject.prediction_uid, DetectionObject.label, DetectionObject.score)
+        .filter(DetectionObject.prediction_uid.in_(list(hour_of)))
         .all()
     )
-    avg_val = round(sum(s[0] for s in scores if s[0] is not None) / len(scores), 2) if scores else 0.0
+    for uid, label, score in detections:
+        per_hour[hour_of[uid]][1].append((label, score))
+    for hour, (count, hour_detections) in per_hour.items():
+        rollups.apply(db, hour, hour_detections, predictions=count, sign=-1)
 
-    label_counts = {}
-    labels = (
-        db.query(DetectionObject.label)
-        .join(PredictionSession, DetectionObject.prediction_uid == PredictionSession.uid)
-        .filter(PredictionSession.timestamp >= one_week_ago)
+    db.query(DetectionObject).filter(DetectionObject.prediction_uid.in_(found)).delete(synchronize_session=False)
+    deleted = db.query(PredictionSession).filter(PredictionSession.uid.in_(found)).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+def query_get_prediction_stats(db: Session, since=None, until=None, top_k=None):
+    """
+    Totals for predictions with since <= timestamp < until (default: the current hour and the
+    167 before it), read from the hourly rollups: one SUM over hours and one GROUP BY label.
+    `since` and `until` are rounded down to whole hours.
+    `top_k` limits most_common_labels to the k most frequent labels.
+    """
+    since = rollups.floor_hour(since) if since is not None else rollups.week_start()
+    hours = [HourlyPredictionRollup.hour >= since]
+    label_hours = [HourlyLabelRollup.hour >= since]
+    if until is not None:
+        until = rollups.floor_hour(until)
+        hours.append(HourlyPredictionRollup.hour < until)
+        label_hours.append(HourlyLabelRollup.hour < until)
+
+    total = db.query(func.sum(HourlyPredictionRollup.predictions)).filter(*hours).scalar() or 0
+
+    count = func.sum(HourlyLabelRollup.detections)
+    rows = (
+        db.query(HourlyLabelRollup.label, count, func.sum(HourlyLabelRollup.score_sum))
+        .filter(*label_hours)
+        .group_by(HourlyLabelRollup.label)
+        .having(count > 0)
+        .order_by(count.desc(), HourlyLabelRollup.label)
         .all()
     )
-    for l in labels:
-        label_counts[l[0]] = label_counts.get(l[0], 0) + 1
+    detections = sum(n for _, n, _ in rows)
+    score_sum = sum(s or 0.0 for _, _, s in rows)
+    avg_val = round(score_sum / detections, 2) if detections else 0.0
+
+    if top_k is not None:
+        rows = rows[:top_k]
 
     return {
-        "total_predictions": total,
+        "total_predictions": int(total),
         "average_confidence_score": avg_val,
-        "most_common_labels": label_counts,
+        "most_common_labels": {label: int(n) for label, n, _ in rows},
     }
 
 def query_get_objects_by_uid(db: Session, uid: str):
     return db.query(DetectionObject).filter(DetectionObject.prediction_uid == uid).all()
 
+def query_get_cached_detections(db: Session, key: str):
+    entry = db.get(PredictionCacheEntry, key)
+    if entry is None:
+        return None
+    return [tuple(d) for d in json.loads(entry.detections)]
 
+def query_save_cached_detections(db: Session, key: str, detections):
+    db.merge(PredictionCacheEntry(key=key, detections=json.dumps(detections), created_at=datetime.utcnow()))
+    db.commit()
 
+def query_get_predictions_by_box(db: Session, min_area=None, max_area=None, region=None,
+                                 min_aspect=None, max_aspect=None, label=None, limit=None, after=None):
+    """
+    Predictions having at least one box that matches every given filter, paged like the label
+    and score lists. `region` is (x1, y1, x2, y2); the box must lie fully inside it.
+    Aspect ratio is width / height.
+    """
+    criteria = [DetectionObject.x1.isnot(None)]
+    if label is not None:
+        criteria.append(DetectionObject.label == label)
+    if min_area is not None:
+        criteria.append(DetectionObject.area >= min_area)
+    if max_area is not None:
+        criteria.append(DetectionObject.area <= max_area)
+    if region is not None:
+        rx1, ry1, rx2, ry2 = region
+        criteria += [
+            DetectionObject.x1 >= rx1, DetectionObject.y1 >= ry1,
+            DetectionObject.x2 <= rx2, DetectionObject.y2 <= ry2,
+        ]
+    if min_aspect is not None or max_aspect is not None:
+        width = DetectionObject.x2 - DetectionObject.x1
+        height = DetectionObject.y2 - DetectionObject.y1
+        criteria.append(height > 0)
+        if min_aspect is not None:
+            criteria.append(width >= height * min_aspect)
+        if max_aspect is not None:
+            criteria.append(width <= height * max_aspect)
+    return _sessions_page(db, _with_detection(*criteria), limit=limit, after=after)
@@ -0,0 +1,168 @@
+# rollups.py
+"""
+Hourly rollups behind /stats, /predictions/count and /labels.
+
+`hourly_prediction_rollups` keeps, per UTC hour, the number of predictions,
+detections and the detection score sum; `hourly_label_rollups` keeps detections
+and score sum per (hour, label). queries.py updates both in the same transaction
+that saves or deletes a prediction, so a week of stats is at most 168 rows.
+
+Rollups can be recomputed from the raw tables at any time:
+
+    python rollups.py rebuild
+"""
+import sys
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from models import PredictionSession, DetectionObject, HourlyPredictionRollup, HourlyLabelRollup
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+WEEK_HOURS = 7 * 24
+
+
+def floor_hour(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def week_start(now: datetime | None = None) -> datetime:
+    """First bucket of the last-week window: the current hour plus the 167 before it."""
+    return floor_hour(now or datetime.utcnow()) - timedelta(hours=WEEK_HOURS - 1)
+
+
+def _upsert(db: Session, model, key: dict, deltas: dict) -> None:
+    """Adds `deltas` to the row identified by `key`, creating it if missing."""
+    table = model.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table).values(**key, **deltas)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key),
+            set_={name: table.c[name] + stmt.excluded[name] for name in deltas},
+        )
+        db.execute(stmt)
+        return
+
+    row = db.get(model, tuple(key.values()), with_for_update=True)
+    if row is None:
+        db.add(model(**key, **deltas))
+        db.flush()
+    else:
+        for name, value in deltas.items():
+            setattr(row, name, getattr(row, name) + value)
+
+
+def apply(db: Session, timestamp: datetime, detections, predictions: int = 1, sign: int = 1) -> None:
+    """
+    Adds one prediction (or removes it with sign=-1) and its `detections`
+    [(label, score), ...] to the rollups of its hour. Does not commit.
+    """
+    hour = floor_hour(timestamp)
+    per_label = defaultdict(lambda: [0, 0.0])
+    for label, score in detections:
+        per_label[label][0] += 1
+        per_label[label][1] += float(score or 0.0)
+
+    _upsert(db, HourlyPredictionRollup, {"hour": hour}, {
+        "predictions": sign * predictions,
+        "detections": sign * sum(n for n, _ in per_label.values()),
+        "score_sum": sign * sum(s for _, s in per_label.values()),
+    })
+    for label, (n, s) in per_label.items():
+        _upsert(db, HourlyLabelRollup, {"hour": hour, "label": label},
+                {"detections": sign * n, "score_sum": sign * s})
+
+
+def _hour_expr(column, dialect: str):
+    if dialect == "postgresql":
+        return func.date_trunc("hour", column)
+    if dialect == "sqlite":
+        return func.strftime("%Y-%m-%d %H:00:00", column)
+    return None
+
+
+def _as_hour(value) -> datetime:
+    return datetime.fromisoformat(value) if isinstance(value, str) else floor_hour(value)
+
+
+def rebuild(engine) -> dict:
+    """Replaces both rollup tables with totals recomputed from prediction_sessions / detection_objects."""
+    ts = PredictionSession.timestamp
+    hour = _hour_expr(ts, engine.dialect.name)
+    sessions = defaultdict(lambda: [0, 0, 0.0])
+    labels = defaultdict(lambda: [0, 0.0])
+
+    with engine.begin() as conn:
+        if hour is not None:
+            session_rows = conn.execute(
+                select(hour, func.count(PredictionSession.uid))
+                .where(ts.isnot(None)).group_by(hour)
+            ).all()
+            label_rows = conn.execute(
+                select(hour, DetectionObject.label, func.count(DetectionObject.id), func.sum(DetectionObject.score))
+                .join(PredictionSession, DetectionObject.prediction_uid == PredictionSession.uid)
+                .where(ts.isnot(None)).group_by(hour, DetectionObject.label)
+            ).all()
+        else:
+            session_rows = [(t, 1) for (t,) in conn.execute(select(ts).where(ts.isnot(None)))]
+            label_rows = [
+                (t, label, 1, score) for t, label, score in conn.execute(
+                    select(ts, DetectionObject.label, DetectionObject.score)
+                    .join(PredictionSession, DetectionObject.prediction_uid == PredictionSession.uid)
+                    .where(ts.isnot(None))
+                )
+            ]
+
+        for h, n in session_rows:
+            sessions[_as_hour(h)][0] += n
+        for h, label, n, s in label_rows:
+            h = _as_hour(h)
+            sessions[h][1] += n
+            sessions[h][2] += s or 0.0
+            labels[(h, label)][0] += n
+            labels[(h, label)][1] += s or 0.0
+
+        conn.execute(delete(HourlyLabelRollup))
+        conn.execute(delete(HourlyPredictionRollup))
+        if sessions:
+            conn.execute(insert(HourlyPredictionRollup), [
+                {"hour": h, "predictions": p, "detections": d, "score_sum": s}
+                for h, (p, d, s) in sessions.items()
+            ])
+        if labels:
+            conn.execute(insert(HourlyLabelRollup), [
+                {"hour": h, "label": label, "detections": d, "score_sum": s}
+                for (h, label), (d, s) in labels.items()
+            ])
+
+    logger.info(f"Rebuilt rollups: {len(sessions)} hours, {len(labels)} hour/label rows")
+    return {"hours": len(sessions), "label_rows": len(labels)}
+
+
+def needs_rebuild(engine) -> bool:
+    """True for databases that have predictions but no rollups yet (created before rollups existed)."""
+    tables = set(inspect(engine).get_table_names())
+    if not {PredictionSession.__tablename__, HourlyPredictionRollup.__tablename__} <= tables:
+        return False
+    with engine.connect() as conn:
+        has_rollups = conn.execute(select(HourlyPredictionRollup.hour).limit(1)).first() is not None
+        has_sessions = conn.execute(select(PredictionSession.uid).limit(1)).first() is not None
+    return has_sessions and not has_rollups
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python rollups.py rebuild")
+    from db import engine
+    rebuild(engine)
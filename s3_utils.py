@@ -1,20 +1,28 @@
 
 # s3_utils.py
+import io
 import os
 import logging
 import mimetypes
 import tempfile
+import threading
+from time import monotonic
+from datetime import datetime, timezone
+from collections import OrderedDict
 from typing import Optional
 from urllib.parse import urlparse
 
 import boto3
 from botocore.config import Config
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import (
     ClientError, NoCredentialsError, EndpointConnectionError, ProfileNotFound
 )
 from botocore import UNSIGNED
 import httpx
 
+import http_client
+
 # .env לפיתוח (לא חובה בדוקר)
 try:
     from dotenv import load_dotenv  # type: ignore
@@ -31,6 +39,27 @@ AWS_PROFILE = os.getenv("AWS_PROFILE")  # לא לקבוע ברירת מחדל
 AWS_S3_ENDPOINT_URL = os.getenv("AWS_S3_ENDPOINT_URL")
 AWS_S3_ADDRESSING_STYLE = os.getenv("AWS_S3_ADDRESSING_STYLE", "path")
 AWS_S3_UNSIGNED = os.getenv("AWS_S3_UNSIGNED", "false").lower() in ("1", "true", "yes")
+# transfer tuning: files above the threshold go multipart in chunks of S3_MULTIPART_CHUNKSIZE_MB,
+# with up to S3_MAX_CONCURRENCY parts in flight per transfer
+S3_MULTIPART_THRESHOLD_MB = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8"))
+S3_MULTIPART_CHUNKSIZE_MB = int(os.getenv("S3_MULTIPART_CHUNKSIZE_MB", "8"))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "10"))
+# HTTP connections shared by all threads using the client (boto3 default: 10);
+# size it for concurrent transfers x S3_MAX_CONCURRENCY
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "50"))
+S3_TCP_KEEPALIVE = os.getenv("S3_TCP_KEEPALIVE", "true").lower() in ("1", "true", "yes")
+# bytes read from a GetObject body per chunk when streaming to a client
+S3_STREAM_CHUNK_SIZE = int(os.getenv("S3_STREAM_CHUNK_SIZE", str(64 * 1024)))
+# how long the answer of has_s3_credentials() is reused before credentials are resolved again
+S3_CREDENTIALS_TTL = float(os.getenv("S3_CREDENTIALS_TTL", "300"))
+# "no credentials" is re-checked sooner so credentials that show up later are picked up
+S3_CREDENTIALS_NEGATIVE_TTL = float(os.getenv("S3_CREDENTIALS_NEGATIVE_TTL", "30"))
+# temporary credentials (instance role, SSO, assume-role) are re-checked this long before they expire
+S3_CREDENTIALS_EXPIRY_MARGIN = 60.0
+# presigned URLs kept per (key, expiry); 0 disables the cache
+S3_PRESIGN_CACHE_SIZE = int(os.getenv("S3_PRESIGN_CACHE_SIZE", "4096"))
+# a cached URL is handed out until this many seconds before it expires (at most half its lifetime)
+S3_PRESIGN_REFRESH_MARGIN = float(os.getenv("S3_PRESIGN_REFRESH_MARGIN", "300"))
 
 
 def _make_session():
@@ -53,37 +82,102 @@ def _make_session():
     return boto3.Session(region_name=AWS_REGION)
 
 
-def _make_client():
+def make_transfer_config(threshold_mb: int = S3_MULTIPART_THRESHOLD_MB,
+                         chunksize_mb: int = S3_MULTIPART_CHUNKSIZE_MB,
+                         max_concurrency: int = S3_MAX_CONCURRENCY) -> TransferConfig:
+    return TransferConfig(
+        multipart_threshold=threshold_mb * 1024 * 1024,
+        multipart_chunksize=chunksize_mb * 1024 * 1024,
+        max_concurrency=max_concurrency,
+        use_threads=max_concurrency > 1,
+    )
+
+
+def make_client_config(max_pool_connections: int = S3_MAX_POOL_CONNECTIONS,
+                       tcp_keepalive: bool = S3_TCP_KEEPALIVE) -> Config:
+    kwargs = {
+        "s3": {"addressing_style": AWS_S3_ADDRESSING_STYLE},
+        "max_pool_connections": max_pool_connections,
+        "tcp_keepalive": tcp_keepalive,
+    }
     if AWS_S3_UNSIGNED:
-        cfg = Config(signature_version=UNSIGNED, s3={"addressing_style": AWS_S3_ADDRESSING_STYLE})
-        mode = "UNSIGNED"
-    else:
-        cfg = Config(s3={"addressing_style": AWS_S3_ADDRESSING_STYLE})
-        mode = "SIGNED"
-    client = _make_session().client("s3", endpoint_url=AWS_S3_ENDPOINT_URL, config=cfg)
-    logger.info(f"S3 client created in {mode} mode (bucket={AWS_S3_BUCKET}, region={AWS_REGION})")
+        kwargs["signature_version"] = UNSIGNED
+    return Config(**kwargs)
+
+
+TRANSFER_CONFIG = make_transfer_config()
+
+
+def _make_client():
+    mode = "UNSIGNED" if AWS_S3_UNSIGNED else "SIGNED"
+    client = _make_session().client("s3", endpoint_url=AWS_S3_ENDPOINT_URL, config=make_client_config())
+    logger.info(
+        f"S3 client created in {mode} mode (bucket={AWS_S3_BUCKET}, region={AWS_REGION}, "
+        f"pool={S3_MAX_POOL_CONNECTIONS}, transfer concurrency={S3_MAX_CONCURRENCY})"
+    )
     return client
 
 
 _s3 = _make_client()
 
+_credentials_lock = threading.Lock()
+_credentials_ok = False
+_credentials_valid_until = 0.0
+
+
+def _check_credentials(sess) -> tuple:
+    """Resolves credentials once; returns (available, seconds the answer may be reused)."""
+    try:
+        creds = sess.get_credentials()
+        if not creds:
+            return False, S3_CREDENTIALS_NEGATIVE_TTL
+        fc = creds.get_frozen_credentials()
+        if not (fc and fc.access_key and fc.secret_key):
+            return False, S3_CREDENTIALS_NEGATIVE_TTL
+    except Exception:
+        return False, S3_CREDENTIALS_NEGATIVE_TTL
+
+    ttl = S3_CREDENTIALS_TTL
+    expiry = getattr(creds, "_expiry_time", None)
+    if expiry is not None:
+        left = (expiry - datetime.now(timezone.utc)).total_seconds() - S3_CREDENTIALS_EXPIRY_MARGIN
+        ttl = max(0.0, min(ttl, left))
+    return True, ttl
+
+
+def invalidate_credentials() -> None:
+    global _credentials_valid_until
+    with _credentials_lock:
+        _credentials_valid_until = 0.0
+
 
 def refresh_client() -> None:
     global _s3
     _s3 = _make_client()
+    invalidate_credentials()
+    presign_cache.clear()
     logger.info("S3 client refreshed with current environment variables.")
 
 
 def has_s3_credentials() -> bool:
-    try:
-        sess = _make_session()
-        creds = sess.get_credentials()
-        if not creds:
-            return False
-        fc = creds.get_frozen_credentials()
-        return bool(fc and fc.access_key and fc.secret_key)
-    except Exception:
-        return False
+    """
+    Whether AWS credentials are available. The answer is cached: resolving
+    credentials builds a boto3 session and may call the instance metadata service.
+    """
+    global _credentials_ok, _credentials_valid_until
+    if monotonic() < _credentials_valid_until:
+        return _credentials_ok
+    with _credentials_lock:
+        if monotonic() < _credentials_valid_until:
+            return _credentials_ok
+        ok, ttl = _check_credentials(_make_session())
+        _credentials_ok, _credentials_valid_until = ok, monotonic() + ttl
+        return ok
+
+
+def s3_configured() -> bool:
+    """Whether uploads can work at all: a bucket is set and credentials are available."""
+    return bool(AWS_S3_BUCKET) and has_s3_credentials()
 
 
 def s3_download_to_path(key: str, dest_path: str) -> bool:
@@ -93,7 +187,7 @@ def s3_download_to_path(key: str, dest_path: str) -> bool:
     os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
     logger.info(f"S3: downloading s3://{AWS_S3_BUCKET}/{key} -> {dest_path}")
     try:
-        _s3.download_file(AWS_S3_BUCKET, key, dest_path)
+        _s3.download_file(AWS_S3_BUCKET, key, dest_path, Config=TRANSFER_CONFIG)
         return True
     except NoCredentialsError:
         logger.error("S3 download failed: No AWS credentials available")
@@ -119,12 +213,62 @@ def s3_download_to_temp(key: str, suffix: Optional[str] = None) -> Optional[str]
         fd, tmp_path = tempfile.mkstemp(suffix=ext)
         os.close(fd)
         ok = s3_download_to_path(key, tmp_path)
+        if not ok:
+            os.remove(tmp_path)
         return tmp_path if ok else None
     except Exception as e:
         logger.exception(f"S3 temp download failed: {e}")
         return None
 
 
+def s3_open_object(key: str) -> Optional[dict]:
+    """
+    Starts a GetObject and returns {"body", "content_length", "content_type", "etag"}
+    without reading the body, or None if the object cannot be read. The caller
+    must consume or close the body (see iter_s3_body).
+    """
+    if not AWS_S3_BUCKET:
+        logger.error("S3: Missing AWS_S3_BUCKET env")
+        return None
+    try:
+        resp = _s3.get_object(Bucket=AWS_S3_BUCKET, Key=key)
+    except NoCredentialsError:
+        logger.error("S3 get failed: No AWS credentials available")
+        return None
+    except EndpointConnectionError as e:
+        logger.error(f"S3 get failed: Endpoint connection error: {e}")
+        return None
+    except ClientError as e:
+        err = e.response.get("Error", {})
+        if err.get("Code") in ("NoSuchKey", "404"):
+            logger.info(f"S3: s3://{AWS_S3_BUCKET}/{key} not found")
+        else:
+            logger.error(
+                f"S3 get failed for key='{key}' bucket='{AWS_S3_BUCKET}': "
+                f"{err.get('Code')} - {err.get('Message')}"
+            )
+        return None
+    except Exception as e:
+        logger.exception(f"S3 get failed (unexpected): {e}")
+        return None
+    return {
+        "body": resp["Body"],
+        "content_length": resp.get("ContentLength"),
+        "content_type": resp.get("ContentType"),
+        "etag": resp.get("ETag"),
+    }
+
+
+def iter_s3_body(body, chunk_size: int = S3_STREAM_CHUNK_SIZE):
+    """Yields a GetObject body in chunks and always releases the connection."""
+    try:
+        for chunk in body.iter_chunks(chunk_size):
+            if chunk:
+                yield chunk
+    finally:
+        body.close()
+
+
 def s3_upload_file(local_path: str, key: str, extra_args: Optional[dict] = None) -> bool:
     if not AWS_S3_BUCKET:
         logger.error("S3: Missing AWS_S3_BUCKET env")
@@ -144,7 +288,43 @@ def s3_upload_file(local_path: str, key: str, extra_args: Optional[dict] = None)
 
     logger.info(f"S3: uploading {local_path} -> s3://{AWS_S3_BUCKET}/{key}")
     try:
-        _s3.upload_file(local_path, AWS_S3_BUCKET, key, ExtraArgs=extra_args)
+        _s3.upload_file(local_path, AWS_S3_BUCKET, key, ExtraArgs=extra_args, Config=TRANSFER_CONFIG)
+        return True
+    except NoCredentialsError:
+        logger.error("S3 upload failed: No AWS credentials available")
+        return False
+    except EndpointConnectionError as e:
+        logger.error(f"S3 upload failed: Endpoint connection error: {e}")
+        return False
+    except ClientError as e:
+        err = e.response.get("Error", {})
+        logger.error(
+            f"S3 upload failed for key='{key}' bucket='{AWS_S3_BUCKET}': "
+            f"{err.get('Code')} - {err.get('Message')}"
+        )
+        return False
+    except Exception as e:
+        logger.exception(f"S3 upload failed (unexpected): {e}")
+        return False
+
+
+def s3_upload_bytes(data: bytes, key: str, extra_args: Optional[dict] = None) -> bool:
+    if not AWS_S3_BUCKET:
+        logger.error("S3: Missing AWS_S3_BUCKET env")
+        return False
+    if not has_s3_credentials():
+        logger.warning("S3 upload skipped: no credentials available in environment/instance.")
+        return False
+
+    if extra_args is None:
+        extra_args = {}
+    if "ContentType" not in extra_args:
+        ctype, _ = mimetypes.guess_type(key)
+        extra_args["ContentType"] = ctype or "application/octet-stream"
+
+    logger.info(f"S3: uploading {len(data)} bytes from memory -> s3://{AWS_S3_BUCKET}/{key}")
+    try:
+        _s3.upload_fileobj(io.BytesIO(data), AWS_S3_BUCKET, key, ExtraArgs=extra_args, Config=TRANSFER_CONFIG)
         return True
     except NoCredentialsError:
         logger.error("S3 upload failed: No AWS credentials available")
@@ -193,10 +373,146 @@ def s3_delete_object(key: str) -> bool:
         return False
 
 
+# DeleteObjects accepts at most 1000 keys per request
+S3_DELETE_BATCH_SIZE = 1000
+
+
+def s3_delete_objects(keys) -> dict:
+    """
+    Deletes `keys` with DeleteObjects, up to S3_DELETE_BATCH_SIZE per request.
+    Returns {"deleted": [keys], "errors": [{"key", "code", "message"}]}; deleting a
+    missing key counts as deleted, as with delete_object.
+    """
+    keys = list(dict.fromkeys(keys))
+    result = {"deleted": [], "errors": []}
+    if not keys:
+        return result
+
+    def fail_all(batch, code, message):
+        result["errors"].extend({"key": k, "code": code, "message": message} for k in batch)
+
+    if not AWS_S3_BUCKET:
+        logger.error("S3: Missing AWS_S3_BUCKET env")
+        fail_all(keys, "NoBucket", "AWS_S3_BUCKET is not set")
+        return result
+    if not has_s3_credentials():
+        logger.warning("S3 batch delete skipped: no credentials available.")
+        fail_all(keys, "NoCredentials", "no AWS credentials available")
+        return result
+
+    for i in range(0, len(keys), S3_DELETE_BATCH_SIZE):
+        batch = keys[i:i + S3_DELETE_BATCH_SIZE]
+        try:
+            # Quiet: only failures are listed in the response
+            resp = _s3.delete_objects(
+                Bucket=AWS_S3_BUCKET,
+                Delete={"Objects": [{"Key": k} for k in batch], "Quiet": True},
+            )
+        except ClientError as e:
+            err = e.response.get("Error", {})
+            logger.error(f"S3 batch delete failed in bucket='{AWS_S3_BUCKET}': {err.get('Code')} - {err.get('Message')}")
+            fail_all(batch, err.get("Code"), err.get("Message"))
+            continue
+        except Exception as e:
+            logger.exception(f"S3 batch delete failed (unexpected): {e}")
+            fail_all(batch, type(e).__name__, str(e))
+            continue
+        errors = [
+            {"key": err.get("Key"), "code": err.get("Code"), "message": err.get("Message")}
+            for err in resp.get("Errors", [])
+        ]
+        failed = {err["key"] for err in errors}
+        result["errors"].extend(errors)
+        result["deleted"].extend(k for k in batch if k not in failed)
+    logger.info(f"S3: deleted {len(result['deleted'])} objects from s3://{AWS_S3_BUCKET} "
+                f"({len(result['errors'])} errors)")
+    return result
+
+
+class PresignedUrlCache:
+    """
+    LRU of presigned GET URLs keyed by (bucket, key, expires_in). An entry is
+    reused until `S3_PRESIGN_REFRESH_MARGIN` seconds before the URL expires, and
+    never past the expiry of the temporary credentials that signed it.
+    """
+
+    def __init__(self, max_entries: int = 4096, margin: float = 300.0):
+        self.max_entries = max(0, int(max_entries))
+        self.margin = margin
+        self._entries = OrderedDict()   # (bucket, key, expires_in) -> (url, reuse_until monotonic)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def margin_for(self, expires_in: int) -> float:
+        """Lifetime a URL must have left when it is handed out."""
+        return min(self.margin, expires_in / 2)
+
+    def get(self, cache_key: tuple) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and monotonic() < entry[1]:
+                self._entries.move_to_end(cache_key)
+                self._hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[cache_key]
+            self._misses += 1
+            return None
+
+    def put(self, cache_key: tuple, url: str, reuse_for: float) -> None:
+        if not self.enabled or reuse_for <= 0:
+            return
+        with self._lock:
+            self._entries[cache_key] = (url, monotonic() + reuse_for)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._hits = self._misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+presign_cache = PresignedUrlCache(S3_PRESIGN_CACHE_SIZE, S3_PRESIGN_REFRESH_MARGIN)
+
+
+def _signing_credentials_ttl() -> Optional[float]:
+    """Seconds until the client's temporary credentials expire; None for long-lived keys."""
+    creds = getattr(getattr(_s3, "_request_signer", None), "_credentials", None)
+    expiry = getattr(creds, "_expiry_time", None)
+    if not isinstance(expiry, datetime):
+        return None
+    return (expiry - datetime.now(timezone.utc)).total_seconds()
+
+
 def s3_presign_get_url(key: str, expires_in: int = 3600) -> Optional[str]:
     if not AWS_S3_BUCKET:
         logger.error("S3: Missing AWS_S3_BUCKET env")
         return None
+    cache_key = (AWS_S3_BUCKET, key, expires_in)
+    url = presign_cache.get(cache_key)
+    if url is not None:
+        return url
     if not has_s3_credentials():
         logger.info("Skipping presign: no AWS credentials available.")
         return None
@@ -206,6 +522,12 @@ def s3_presign_get_url(key: str, expires_in: int = 3600) -> Optional[str]:
             Params={"Bucket": AWS_S3_BUCKET, "Key": key},
             ExpiresIn=expires_in,
         )
+        # a URL stops working when either its own expiry or the signing credentials run out
+        lifetime = expires_in
+        creds_ttl = _signing_credentials_ttl()
+        if creds_ttl is not None:
+            lifetime = min(lifetime, creds_ttl)
+        presign_cache.put(cache_key, url, lifetime - presign_cache.margin_for(expires_in))
         return url
     except Exception as e:
         logger.exception(f"S3 presign get url failed: {e}")
@@ -224,15 +546,8 @@ def s3_or_http_download(ref: str, dest_path: str) -> bool:
         scheme = (parsed.scheme or "").lower()
 
         if scheme in ("http", "https"):
-            with httpx.stream("GET", ref, timeout=60.0) as r:
-                if r.status_code != 200:
-                    logger.error(f"HTTP download failed: {r.status_code} - {ref}")
-                    return False
-                os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
-                with open(dest_path, "wb") as f:
-                    for chunk in r.iter_bytes():
-                        f.write(chunk)
-            return True
+            # pooled client shared by all requests, with the HTTP_MAX_DOWNLOAD_MB limit
+            return http_client.download(ref, dest_path)
 
         if scheme == "s3":
             bucket = parsed.netloc
@@ -245,7 +560,7 @@ def s3_or_http_download(ref: str, dest_path: str) -> bool:
                 print("keyyyy")
                 print(key)
     
-                _s3.download_file(bucket, key, dest_path)
+                _s3.download_file(bucket, key, dest_path, Config=TRANSFER_CONFIG)
                 print("****testttt********")
             
                 return True
@@ -261,6 +576,11 @@ def s3_or_http_download(ref: str, dest_path: str) -> bool:
         return False
 
 
+async def async_http_download(url: str, dest_path: str, client: Optional[httpx.AsyncClient] = None) -> bool:
+    """Streams an http(s) URL to `dest_path` on the event loop's shared, pooled client."""
+    return await http_client.async_download(url, dest_path, client=client)
+
+
 
 
 
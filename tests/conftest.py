@@ -40,7 +40,7 @@ def fake_ultralytics_module():
     class FakeYOLO:
         def __init__(self, *args, **kwargs):
             self.names = {0: "person"}
-        def __call__(self, path, device="cpu"):
+        def __call__(self, path, device="cpu", **kwargs):
             return [FakeResult()]
 
     mod = types.ModuleType("ultralytics")
@@ -78,6 +78,31 @@ def stub_queries_writes(monkeypatch):
     monkeypatch.setattr(queries, "query_save_detection_object", lambda *a, **k: None)
 
 
+@pytest.fixture(autouse=True)
+def clear_prediction_cache():
+    # every test starts with an empty content-hash cache so identical test images don't hit
+    from prediction_cache import prediction_cache
+    prediction_cache.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def isolated_upload_spool(tmp_path):
+    # background S3 uploads journal into a per-test spool and are forgotten afterwards
+    from controllers import s3_uploader
+    s3_uploader.reset(str(tmp_path / "spool"))
+    yield
+    s3_uploader.reset()
+
+
+@pytest.fixture(autouse=True)
+def isolated_image_cache(tmp_path):
+    # S3 objects fetched by image endpoints are cached in a per-test directory
+    from image_cache import image_cache
+    image_cache.reset(str(tmp_path / "image-cache"))
+    yield
+
+
 @pytest.fixture(autouse=True)
 def mock_verify_user(monkeypatch):
     # עוקף אימות בסיסי
@@ -0,0 +1,147 @@
+# tests/test_auth_cache.py
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from fastapi.testclient import TestClient
+
+import auth_middleware
+from app import app
+from db import Base
+from models import User
+from tests.utils import get_auth_headers
+# conftest replaces auth_middleware.verify_user with a fake; keep the real one
+from auth_middleware import verify_user, CredentialCache
+
+
+class TestCredentialCache(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        with self.Session() as db:
+            db.add(User(username="alice", password="secret"))
+            db.commit()
+
+        self.queries = []
+        event.listen(self.engine, "before_cursor_execute", self._count)
+        self.p_session = patch.object(auth_middleware, "SessionLocal", self.Session)
+        self.p_session.start()
+        auth_middleware.credential_cache.clear()
+
+    def _count(self, conn, cursor, statement, *args):
+        if "FROM users" in statement:
+            self.queries.append(statement)
+
+    def tearDown(self):
+        self.p_session.stop()
+        auth_middleware.credential_cache.clear()
+        self.engine.dispose()
+
+    def test_success_is_cached(self):
+        for _ in range(5):
+            self.assertTrue(verify_user("alice", "secret"))
+        self.assertEqual(len(self.queries), 1)
+        stats = auth_middleware.credential_cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["positive_hits"], 4)
+
+    def test_wrong_password_is_not_served_from_cache(self):
+        self.assertTrue(verify_user("alice", "secret"))
+        self.assertFalse(verify_user("alice", "nope"))
+        self.assertEqual(len(self.queries), 2)
+
+    def test_failure_cached_briefly(self):
+        self.assertFalse(verify_user("alice", "nope"))
+        self.assertFalse(verify_user("alice", "nope"))
+        self.assertEqual(len(self.queries), 1)
+        self.assertEqual(auth_middleware.credential_cache.stats()["negative_hits"], 1)
+
+        with patch("auth_middleware.monotonic", return_value=auth_middleware.monotonic() + 60):
+            self.assertFalse(verify_user("alice", "nope"))
+        self.assertEqual(len(self.queries), 2)
+
+    def test_password_change_invalidates(self):
+        self.assertTrue(verify_user("alice", "secret"))
+        with self.Session() as db:
+            db.get(User, "alice").password = "changed"
+            db.commit()
+        self.assertFalse(verify_user("alice", "secret"))
+        self.assertTrue(verify_user("alice", "changed"))
+
+    def test_lookup_between_flush_and_commit_is_not_kept(self):
+        cache = auth_middleware.credential_cache
+        with self.Session() as db:
+            db.get(User, "alice").password = "changed"
+            db.flush()
+            # a concurrent verify_user still sees the committed row and caches it
+            cache.put("alice", "secret", True, cache.generation)
+            db.commit()
+        self.assertIsNone(cache.get("alice", "secret"))
+        self.assertFalse(verify_user("alice", "secret"))
+
+    def test_rollback_keeps_entries(self):
+        self.assertTrue(verify_user("alice", "secret"))
+        with self.Session() as db:
+            db.get(User, "alice").password = "changed"
+            db.flush()
+            db.rollback()
+        self.assertTrue(verify_user("alice", "secret"))
+        self.assertEqual(len(self.queries), 2)   # the first lookup + loading alice in the session
+
+    def test_bulk_update_invalidates(self):
+        self.assertTrue(verify_user("alice", "secret"))
+        with self.Session() as db:
+            db.query(User).filter(User.username == "alice").update({"password": "changed"})
+            db.commit()
+        self.assertFalse(verify_user("alice", "secret"))
+
+    def test_new_user_clears_negative_entry(self):
+        self.assertFalse(verify_user("bob", "pw"))
+        with self.Session() as db:
+            db.add(User(username="bob", password="pw"))
+            db.commit()
+        self.assertTrue(verify_user("bob", "pw"))
+
+    def test_bounded_and_stale_generation_ignored(self):
+        cache = CredentialCache(max_entries=2, ttl=60, negative_ttl=5)
+        for name in ("a", "b", "c"):
+            cache.put(name, "pw", True, cache.generation)
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertIsNone(cache.get("a", "pw"))
+
+        generation = cache.generation
+        cache.invalidate("d")
+        cache.put("d", "old", True, generation)
+        self.assertIsNone(cache.get("d", "old"))
+
+
+    def test_failures_cannot_evict_successes(self):
+        cache = CredentialCache(max_entries=2, ttl=60, negative_ttl=5, max_negative_entries=3)
+        cache.put("alice", "secret", True, cache.generation)
+        cache.put("bob", "secret", True, cache.generation)
+        for i in range(100):
+            cache.put("alice", f"guess-{i}", False, cache.generation)
+
+        self.assertTrue(cache.get("alice", "secret"))
+        self.assertTrue(cache.get("bob", "secret"))
+        self.assertFalse(cache.get("alice", "guess-99"))
+        self.assertIsNone(cache.get("alice", "guess-0"))
+        stats = cache.stats()
+        self.assertEqual((stats["entries"], stats["negative_entries"]), (2, 3))
+
+        cache.invalidate("alice")
+        self.assertIsNone(cache.get("alice", "guess-99"))
+
+
+class TestAuthCacheMetrics(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+
+    def test_metrics_endpoint(self):
+        resp = self.client.get("/metrics/auth-cache", headers=get_auth_headers())
+        self.assertEqual(resp.status_code, 200)
+        for key in ("hits", "misses", "negative_hits", "entries", "hit_rate"):
+            self.assertIn(key, resp.json())
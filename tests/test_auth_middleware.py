@@ -0,0 +1,74 @@
+# tests/test_auth_middleware.py
+import base64
+import unittest
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from auth_middleware import BasicAuthMiddleware, basic_auth_middleware
+from tests.utils import get_auth_headers
+
+
+def build_app(kind: str) -> FastAPI:
+    app = FastAPI()
+    if kind == "asgi":
+        app.add_middleware(BasicAuthMiddleware)
+    else:
+        app.middleware("http")(basic_auth_middleware())
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok!"}
+
+    @app.post("/predict")
+    def predict(request: Request):
+        return {"username": getattr(request.state, "username", "unset")}
+
+    @app.get("/whoami")
+    def whoami(request: Request):
+        return {"username": request.state.username}
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([b"a" * 1024] * 64), media_type="application/octet-stream")
+
+    return app
+
+
+class TestBasicAuthMiddleware(unittest.TestCase):
+    """The ASGI middleware must answer exactly like the call_next version."""
+
+    CASES = [
+        ("GET", "/health", None),
+        ("POST", "/predict", None),
+        ("POST", "/predict", get_auth_headers()),
+        ("POST", "/predict", {"Authorization": "Basic d3Jvbmc6dXNlcg=="}),
+        ("POST", "/predict", {"Authorization": "Basic"}),
+        ("GET", "/whoami", None),
+        ("GET", "/whoami", get_auth_headers()),
+        ("GET", "/whoami", {"Authorization": "Basic d3Jvbmc6dXNlcg=="}),
+        ("GET", "/whoami", {"Authorization": "Basic " + base64.b64encode(b"no-colon").decode()}),
+        ("GET", "/missing", None),
+    ]
+
+    def test_same_responses_as_call_next(self):
+        legacy, asgi = TestClient(build_app("call_next")), TestClient(build_app("asgi"))
+        for method, path, headers in self.CASES:
+            with self.subTest(method=method, path=path, headers=headers):
+                expected = legacy.request(method, path, headers=headers)
+                actual = asgi.request(method, path, headers=headers)
+                self.assertEqual(actual.status_code, expected.status_code)
+                self.assertEqual(actual.json(), expected.json())
+
+    def test_sets_username(self):
+        client = TestClient(build_app("asgi"))
+        self.assertEqual(client.get("/whoami", headers=get_auth_headers()).json(), {"username": "testuser"})
+        self.assertEqual(client.post("/predict").json(), {"username": None})
+        self.assertEqual(client.get("/whoami").json(), {"detail": "Missing credentials"})
+
+    def test_streaming_body_passes_through(self):
+        client = TestClient(build_app("asgi"))
+        resp = client.get("/stream", headers=get_auth_headers())
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.content), 64 * 1024)
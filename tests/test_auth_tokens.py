@@ -0,0 +1,71 @@
+# tests/test_auth_tokens.py
+import time
+import unittest
+from unittest.mock import patch, Mock
+
+from fastapi.testclient import TestClient
+
+import auth_tokens
+from app import app
+from db import get_db
+from tests.utils import get_auth_headers
+
+
+class TestTokens(unittest.TestCase):
+    def test_roundtrip(self):
+        token, expires_at = auth_tokens.issue_token("alice", ttl=60)
+        self.assertEqual(auth_tokens.verify_token(token), "alice")
+        self.assertAlmostEqual(expires_at, time.time() + 60, delta=2)
+
+    def test_expired(self):
+        token, expires_at = auth_tokens.issue_token("alice", ttl=60)
+        self.assertIsNone(auth_tokens.verify_token(token, now=expires_at))
+
+    def test_tampered(self):
+        token, _ = auth_tokens.issue_token("alice", ttl=60)
+        other, _ = auth_tokens.issue_token("mallory", ttl=60)
+        forged = other.split(".")[0] + "." + token.split(".")[1]
+        self.assertIsNone(auth_tokens.verify_token(forged))
+        for junk in ("", "abc", "a.b.c", token + "x", "." + token.split(".")[1]):
+            self.assertIsNone(auth_tokens.verify_token(junk))
+
+
+class TestTokenEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+        self.db = Mock()
+
+        def override_get_db():
+            yield self.db
+        app.dependency_overrides[get_db] = override_get_db
+
+    def tearDown(self):
+        app.dependency_overrides = {}
+
+    def _token(self):
+        resp = self.client.post("/token", headers=get_auth_headers())
+        self.assertEqual(resp.status_code, 200)
+        body = resp.json()
+        self.assertEqual(body["token_type"], "bearer")
+        return body["access_token"]
+
+    @patch("queries.query_get_prediction_count_last_week", return_value=4)
+    def test_bearer_token_skips_credential_check(self, _count):
+        token = self._token()
+        with patch("auth_middleware.verify_user", side_effect=AssertionError("DB check")):
+            resp = self.client.get("/predictions/count", headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"count": 4})
+
+    def test_invalid_bearer_rejected(self):
+        resp = self.client.get("/predictions/count", headers={"Authorization": "Bearer nope.nope"})
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(resp.json(), {"detail": "Invalid credentials"})
+
+    def test_token_requires_basic_credentials(self):
+        self.assertEqual(self.client.post("/token").status_code, 401)
+        self.assertEqual(self.client.post("/token", headers=get_auth_headers("testuser", "bad")).status_code, 401)
+        token = self._token()
+        resp = self.client.post("/token", headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(resp.json(), {"detail": "Basic credentials required"})
@@ -0,0 +1,61 @@
+# tests/test_backends.py
+import unittest
+
+import numpy as np
+
+from backends import letterbox, postprocess, preprocess, load_model
+
+
+def _head(boxes, num_classes=3):
+    """Builds a fake YOLOv8 head output (4 + nc, anchors) from (cx, cy, w, h, cls, score) rows."""
+    out = np.zeros((4 + num_classes, len(boxes)), dtype=np.float32)
+    for i, (cx, cy, w, h, cls, score) in enumerate(boxes):
+        out[:4, i] = [cx, cy, w, h]
+        out[4 + cls, i] = score
+    return out
+
+
+class TestLetterbox(unittest.TestCase):
+    def test_wide_image_is_padded_vertically(self):
+        img = np.zeros((100, 200, 3), dtype=np.uint8)
+        boxed, gain, (left, top) = letterbox(img, 64)
+        self.assertEqual(boxed.shape, (64, 64, 3))
+        self.assertAlmostEqual(gain, 0.32)
+        self.assertEqual(left, 0)
+        self.assertEqual(top, 16)
+        self.assertEqual(int(boxed[0, 0, 0]), 114)
+
+    def test_preprocess_stacks_batch_as_nchw(self):
+        imgs = [np.zeros((10, 20, 3), dtype=np.uint8), np.zeros((30, 10, 3), dtype=np.uint8)]
+        x, metas = preprocess(imgs, 32)
+        self.assertEqual(x.shape, (2, 3, 32, 32))
+        self.assertEqual(x.dtype, np.float32)
+        self.assertEqual(len(metas), 2)
+
+
+class TestPostprocess(unittest.TestCase):
+    def test_nms_and_rescale(self):
+        # letterbox of a 100x200 image into 64x64: gain 0.32, top pad 16
+        meta = (0.32, (0, 16), (100, 200))
+        pred = _head([
+            (32, 32, 16, 16, 0, 0.9),   # kept
+            (33, 32, 16, 16, 0, 0.8),   # overlaps the first, same class -> suppressed
+            (33, 32, 16, 16, 1, 0.7),   # same place, other class -> kept
+            (10, 20, 4, 4, 2, 0.1),     # below threshold
+        ])
+        dets = postprocess(pred, meta, conf_thres=0.25, iou_thres=0.5)
+
+        self.assertEqual([d[1] for d in dets], [0, 1])
+        xyxy, cls, conf = dets[0]
+        self.assertAlmostEqual(conf, 0.9, places=5)
+        np.testing.assert_allclose(xyxy, [75.0, 25.0, 125.0, 75.0], atol=1e-4)
+
+    def test_no_detections(self):
+        meta = (1.0, (0, 0), (64, 64))
+        self.assertEqual(postprocess(_head([(5, 5, 2, 2, 0, 0.01)]), meta), [])
+
+
+class TestLoadModel(unittest.TestCase):
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            load_model("yolov8n.pt", "tensorrt")
@@ -0,0 +1,159 @@
+# tests/test_box_columns.py
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import patch, Mock
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import queries
+from app import app
+from db import Base, get_db
+from migrations import run_migrations
+from models import DetectionObject
+# bound at import time: conftest stubs queries.query_save_prediction_session for endpoint tests
+from queries import query_save_prediction_session
+from tests.utils import get_auth_headers
+
+
+def memory_engine():
+    return create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+
+class TestBoxMigration(unittest.TestCase):
+    def test_adds_columns_and_backfills_old_rows(self):
+        engine = memory_engine()
+        with engine.begin() as conn:
+            # detection_objects as it looked before the numeric columns
+            conn.execute(text(
+                "CREATE TABLE detection_objects (id INTEGER PRIMARY KEY, prediction_uid VARCHAR,"
+                " label VARCHAR, score FLOAT, box VARCHAR)"
+            ))
+            conn.execute(text(
+                "INSERT INTO detection_objects (prediction_uid, label, score, box) VALUES"
+                " ('a', 'cat', 0.9, '[1.0, 2.0, 11.0, 7.0]'), ('a', 'dog', 0.8, 'garbage')"
+            ))
+
+        run_migrations(engine)
+        run_migrations(engine)  # idempotent
+
+        columns = {c["name"] for c in inspect(engine).get_columns("detection_objects")}
+        self.assertTrue({"x1", "y1", "x2", "y2", "area"} <= columns)
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT label, x1, y1, x2, y2, area FROM detection_objects ORDER BY id")).all()
+        self.assertEqual(tuple(rows[0]), ("cat", 1.0, 2.0, 11.0, 7.0, 50.0))
+        self.assertIsNone(rows[1].x1)
+
+    def test_adds_session_columns(self):
+        engine = memory_engine()
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE prediction_sessions (uid VARCHAR PRIMARY KEY, timestamp DATETIME,"
+                " original_image VARCHAR, predicted_image VARCHAR, username VARCHAR)"
+            ))
+        # as at app startup: missing tables are created first
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+        columns = {c["name"] for c in inspect(engine).get_columns("prediction_sessions")}
+        self.assertTrue({"source_s3_key", "predicted_uploaded_at"} <= columns)
+
+
+class TestBoxQueries(unittest.TestCase):
+    def setUp(self):
+        self.engine = memory_engine()
+        Base.metadata.create_all(bind=self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        query_save_prediction_session(self.db, "small", "o", "p", "u", detections=[("cat", 0.9, [0, 0, 10, 10])])
+        query_save_prediction_session(self.db, "wide", "o", "p", "u", detections=[("car", 0.9, [100, 100, 300, 150])])
+
+    def tearDown(self):
+        self.db.close()
+
+    def uids(self, **filters):
+        return sorted(r["uid"] for r in queries.query_get_predictions_by_box(self.db, **filters))
+
+    def test_numeric_columns_are_written(self):
+        obj = self.db.query(DetectionObject).filter_by(prediction_uid="wide").one()
+        self.assertEqual((obj.x1, obj.y1, obj.x2, obj.y2, obj.area), (100.0, 100.0, 300.0, 150.0, 10000.0))
+
+    def test_filters(self):
+        self.assertEqual(self.uids(min_area=1000), ["wide"])
+        self.assertEqual(self.uids(max_area=100), ["small"])
+        self.assertEqual(self.uids(region=(0, 0, 50, 50)), ["small"])
+        self.assertEqual(self.uids(min_aspect=2), ["wide"])
+        self.assertEqual(self.uids(max_aspect=1.5, label="cat"), ["small"])
+        self.assertEqual(self.uids(label="car", max_area=100), [])
+
+    def test_pages(self):
+        query_save_prediction_session(self.db, "wide-2", "o", "p", "u", detections=[("car", 0.9, [0, 0, 300, 150])])
+        first = queries.query_get_predictions_by_box(self.db, min_area=1000, limit=1)
+        self.assertEqual(len(first), 1)
+        after = (datetime.fromisoformat(first[0]["timestamp"]), first[0]["uid"])
+        rest = queries.query_get_predictions_by_box(self.db, min_area=1000, limit=10, after=after)
+        self.assertEqual(sorted(r["uid"] for r in first + rest), ["wide", "wide-2"])
+
+
+class TestBoxEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+        self.p_auth = patch("auth_middleware.verify_user",
+                            lambda u, p: (u == "testuser" and p == "testpass"))
+        self.p_auth.start()
+        def override_get_db():
+            yield Mock()
+        app.dependency_overrides[get_db] = override_get_db
+
+    def tearDown(self):
+        app.dependency_overrides = {}
+        self.p_auth.stop()
+
+    @patch("queries.query_get_predictions_by_box", return_value=[{"uid": "u1", "timestamp": None}])
+    def test_box_filter_endpoint(self, mock_query):
+        resp = self.client.get("/predictions/box?min_area=50&region=0,0,100,100&label=cat",
+                               headers=get_auth_headers())
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"items": [{"uid": "u1", "timestamp": None}]})
+        kwargs = mock_query.call_args.kwargs
+        self.assertEqual(kwargs["min_area"], 50)
+        self.assertEqual(kwargs["region"], [0, 0, 100, 100])
+        self.assertEqual(kwargs["label"], "cat")
+        self.assertEqual(kwargs["limit"], 101)   # one extra row tells whether there is a next page
+        self.assertIsNone(kwargs["after"])
+
+    def test_bad_region(self):
+        resp = self.client.get("/predictions/box?region=1,2,3", headers=get_auth_headers())
+        self.assertEqual(resp.status_code, 400)
+
+    @patch("queries.query_get_objects_by_uid")
+    @patch("queries.query_get_prediction_by_uid")
+    def test_prediction_returns_numeric_bbox(self, mock_session, mock_objects):
+        mock_session.return_value = SimpleNamespace(
+            uid="u1", timestamp=datetime(2025, 1, 1), username="testuser",
+            original_image="uploads/original/u1.jpg", predicted_image="uploads/predicted/u1.jpg",
+        )
+        mock_objects.return_value = [DetectionObject(
+            id=1, prediction_uid="u1", label="dog", score=0.5, box="[1.0, 2.0, 3.0, 4.0]",
+            x1=1.0, y1=2.0, x2=3.0, y2=4.0, area=4.0,
+        )]
+        with patch("controllers.s3_presign_get_url", return_value=None):
+            resp = self.client.get("/prediction/u1", headers=get_auth_headers())
+        obj = resp.json()["detection_objects"][0]
+        self.assertEqual(obj["bbox"], [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(obj["area"], 4.0)
+
+    @patch("queries.query_get_objects_by_uid")
+    @patch("queries.query_get_prediction_by_uid")
+    def test_prediction_bbox_of_row_not_backfilled(self, mock_session, mock_objects):
+        mock_session.return_value = SimpleNamespace(
+            uid="u1", timestamp=datetime(2025, 1, 1), username="testuser",
+            original_image="uploads/original/u1.jpg", predicted_image="uploads/predicted/u1.jpg",
+        )
+        mock_objects.return_value = [DetectionObject(
+            id=1, prediction_uid="u1", label="dog", score=0.5, box="[1.0, 2.0, 3.0, 4.0]",
+        )]
+        with patch("controllers.s3_presign_get_url", return_value=None):
+            resp = self.client.get("/prediction/u1", headers=get_auth_headers())
+        self.assertEqual(resp.json()["detection_objects"][0]["bbox"], [1.0, 2.0, 3.0, 4.0])
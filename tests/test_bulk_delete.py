@@ -0,0 +1,167 @@
+# tests/test_bulk_delete.py
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch, Mock
+
+from botocore.exceptions import ClientError
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import auth_middleware
+import queries
+import rollups
+import s3_utils
+from app import app
+from db import Base, get_db
+from models import PredictionSession, DetectionObject, HourlyPredictionRollup, HourlyLabelRollup
+from tests.utils import get_auth_headers
+# conftest replaces queries.query_save_prediction_session with a stub; keep the real one
+from queries import query_save_prediction_session
+
+
+def rollup_snapshot(engine):
+    with engine.connect() as conn:
+        hours = {r.hour: (r.predictions, r.detections, round(r.score_sum, 6))
+                 for r in conn.execute(select(HourlyPredictionRollup)) if r.predictions}
+        labels = {(r.hour, r.label): (r.detections, round(r.score_sum, 6))
+                  for r in conn.execute(select(HourlyLabelRollup)) if r.detections}
+    return hours, labels
+
+
+class TestS3DeleteObjects(unittest.TestCase):
+    def test_batches_of_1000_and_reports_errors(self):
+        client = Mock()
+        client.delete_objects.side_effect = [
+            {"Errors": [{"Key": "k5", "Code": "AccessDenied", "Message": "no"}]},
+            {},
+            ClientError({"Error": {"Code": "SlowDown", "Message": "later"}}, "DeleteObjects"),
+        ]
+        keys = [f"k{i}" for i in range(2500)]
+        with patch.object(s3_utils, "_s3", client), patch.object(s3_utils, "AWS_S3_BUCKET", "bucket"), \
+                patch("s3_utils.has_s3_credentials", return_value=True) as has_credentials:
+            result = s3_utils.s3_delete_objects(keys + ["k1"])
+
+        self.assertEqual([len(c.kwargs["Delete"]["Objects"]) for c in client.delete_objects.call_args_list],
+                         [1000, 1000, 500])
+        has_credentials.assert_called_once()
+        self.assertEqual(len(result["deleted"]), 1999)
+        self.assertEqual(len(result["errors"]), 501)
+        self.assertEqual(result["errors"][0], {"key": "k5", "code": "AccessDenied", "message": "no"})
+
+
+class TestBulkDeleteEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        app.dependency_overrides[get_db] = lambda: (yield self.db)
+        self.client = TestClient(app)
+        self.tmpdir = tempfile.mkdtemp(prefix="test-bulk-delete-")
+
+        self.s3_calls = []
+
+        def fake_delete_objects(keys):
+            self.s3_calls.append(list(keys))
+            return {"deleted": list(keys), "errors": []}
+        self.p_s3 = patch("controllers.s3_delete_objects", side_effect=fake_delete_objects)
+        self.p_s3.start()
+        # testuser may delete anyone's predictions unless a test says otherwise
+        self.p_admin = patch.object(auth_middleware, "ADMIN_USERS", frozenset({"testuser"}))
+        self.p_admin.start()
+
+    def tearDown(self):
+        self.p_admin.stop()
+        self.p_s3.stop()
+        app.dependency_overrides = {}
+        self.db.close()
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def save(self, uid, username, detections, days_ago=0):
+        original = os.path.join(self.tmpdir, f"{uid}.jpg")
+        with open(original, "wb") as f:
+            f.write(b"x")
+        query_save_prediction_session(self.db, uid, original, os.path.join(self.tmpdir, f"p-{uid}.jpg"), username,
+                                      detections=[(label, score, [0, 0, 1, 1]) for label, score in detections])
+        if days_ago:
+            self.db.query(PredictionSession).filter_by(uid=uid).update(
+                {"timestamp": datetime.utcnow() - timedelta(days=days_ago)})
+            self.db.commit()
+
+    def post(self, body):
+        resp = self.client.post("/predictions/delete", json=body, headers=get_auth_headers())
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers["content-type"], "application/x-ndjson")
+        return [json.loads(line) for line in resp.text.splitlines()]
+
+    def test_delete_by_uids_streams_progress(self):
+        self.save("a", "alice", [("cat", 0.9), ("dog", 0.5)])
+        self.save("b", "bob", [("dog", 0.3)])
+        self.save("c", "alice", [])
+
+        with patch.object(__import__("controllers"), "BULK_DELETE_CHUNK", 2):
+            lines = self.post({"uids": ["a", "b", "missing", "a"]})
+
+        self.assertEqual([line["deleted"] for line in lines[:-1]], [2, 0])
+        self.assertEqual(lines[1]["not_found"], ["missing"])
+        self.assertEqual(lines[-1], {**lines[-1], "done": True, "deleted": 2, "s3_deleted": 4, "not_found": 1})
+        self.assertEqual(sorted(self.s3_calls[0]), ["alice/original/a.jpg", "alice/predicted/a.jpg",
+                                                    "bob/original/b.jpg", "bob/predicted/b.jpg"])
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, "a.jpg")))
+        self.assertEqual([s.uid for s in self.db.query(PredictionSession)], ["c"])
+        self.assertEqual(self.db.query(DetectionObject).count(), 0)
+        self.assertEqual(queries.query_get_prediction_count_last_week(self.db), 1)
+        self.assertEqual(queries.query_get_labels_from_last_week(self.db), [])
+
+    def test_delete_by_age_and_user_keeps_rollups_consistent(self):
+        self.save("old-alice", "alice", [("cat", 0.8)], days_ago=40)
+        self.save("old-alice-2", "alice", [("cat", 0.6), ("car", 0.4)], days_ago=40)
+        self.save("old-bob", "bob", [("cat", 0.7)], days_ago=40)
+        self.save("new-alice", "alice", [("dog", 0.2)])
+        rollups.rebuild(self.engine)
+
+        lines = self.post({"older_than_days": 30, "username": "alice"})
+
+        self.assertTrue(lines[-1]["done"])
+        self.assertEqual(lines[-1]["deleted"], 2)
+        self.assertEqual(sorted(s.uid for s in self.db.query(PredictionSession)), ["new-alice", "old-bob"])
+        # the incremental decrements match a full recomputation
+        after_delete = rollup_snapshot(self.engine)
+        rollups.rebuild(self.engine)
+        self.assertEqual(after_delete, rollup_snapshot(self.engine))
+
+    @patch.object(auth_middleware, "ADMIN_USERS", frozenset())
+    def test_non_admin_only_deletes_own_predictions(self):
+        self.save("mine", "testuser", [("cat", 0.9)], days_ago=40)
+        self.save("theirs", "alice", [("cat", 0.9)], days_ago=40)
+
+        lines = self.post({"uids": ["mine", "theirs"]})
+        self.assertEqual(lines[-1]["deleted"], 1)
+        self.assertEqual(lines[0]["not_found"], ["theirs"])
+
+        self.save("old-alice", "alice", [], days_ago=40)
+        lines = self.post({"older_than_days": 30})
+        self.assertEqual(lines[-1]["deleted"], 0)
+        self.assertEqual(sorted(s.uid for s in self.db.query(PredictionSession)), ["old-alice", "theirs"])
+
+        resp = self.client.post("/predictions/delete", json={"username": "alice"}, headers=get_auth_headers())
+        self.assertEqual(resp.status_code, 403)
+
+    def test_empty_uids_deletes_nothing(self):
+        self.save("old-alice", "alice", [("cat", 0.9)], days_ago=40)
+        self.save("old-bob", "bob", [], days_ago=40)
+
+        lines = self.post({"uids": [], "older_than_days": 1})
+        self.assertEqual(lines, [{**lines[-1], "done": True, "deleted": 0, "not_found": 0}])
+        self.assertEqual(self.s3_calls, [])
+        self.assertEqual(self.db.query(PredictionSession).count(), 2)
+
+    def test_requires_a_filter(self):
+        resp = self.client.post("/predictions/delete", json={}, headers=get_auth_headers())
+        self.assertEqual(resp.status_code, 400)
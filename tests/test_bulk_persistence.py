@@ -0,0 +1,66 @@
+# tests/test_bulk_persistence.py
+import unittest
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import queries
+from db import Base
+# bound at import time: conftest stubs queries.query_save_prediction_session for endpoint tests
+from queries import query_save_prediction_session
+from models import DetectionObject, PredictionSession, User
+
+
+class TestBulkPersistence(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=self.engine)
+        self.Session = sessionmaker(bind=self.engine, autoflush=False, autocommit=False)
+        self.commits = 0
+
+        def on_commit(conn):
+            self.commits += 1
+
+        event.listen(self.engine, "commit", on_commit)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_session_user_and_boxes_in_one_commit(self):
+        detections = [("person", 0.9, [1.0, 2.0, 3.0, 4.0]) for _ in range(40)]
+        with self.Session() as db:
+            query_save_prediction_session(db, "u1", "o.jpg", "p.jpg", "alice", detections=detections)
+
+        self.assertEqual(self.commits, 1)
+        with self.Session() as db:
+            self.assertIsNotNone(db.get(User, "alice"))
+            self.assertIsNotNone(db.get(PredictionSession, "u1"))
+            rows = queries.query_get_objects_by_uid(db, "u1")
+            self.assertEqual(len(rows), 40)
+            self.assertEqual(rows[0].box, "[1.0, 2.0, 3.0, 4.0]")
+
+    def test_source_key_and_predicted_upload_are_stored(self):
+        with self.Session() as db:
+            query_save_prediction_session(db, "s1", "o.jpg", "p.jpg", "alice", source_s3_key="public/a.jpg")
+        with self.Session() as db:
+            self.assertTrue(queries.query_mark_predicted_uploaded(db, "s1"))
+            self.assertFalse(queries.query_mark_predicted_uploaded(db, "missing"))
+        with self.Session() as db:
+            session = db.get(PredictionSession, "s1")
+            self.assertEqual(session.source_s3_key, "public/a.jpg")
+            self.assertIsNotNone(session.predicted_uploaded_at)
+
+    def test_failed_insert_leaves_nothing_behind(self):
+        with self.Session() as db:
+            query_save_prediction_session(db, "dup", "o.jpg", "p.jpg", "bob")
+        with self.Session() as db:
+            with self.assertRaises(Exception):
+                query_save_prediction_session(
+                    db, "dup", "o.jpg", "p.jpg", "carol", detections=[("cat", 0.5, [0, 0, 1, 1])]
+                )
+        with self.Session() as db:
+            self.assertIsNone(db.get(User, "carol"))
+            self.assertEqual(db.query(DetectionObject).count(), 0)
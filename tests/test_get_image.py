@@ -49,9 +49,11 @@ class TestGetImage(unittest.TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertTrue(resp.headers["content-type"].startswith("image/"))
 
+    @patch("controllers.s3_download_to_path", return_value=False)
+    @patch("controllers.s3_open_object", return_value=None)
     @patch("controllers.s3_download_to_temp", return_value=None)  # פולבק מ-S3 נכשל -> 404
     @patch("queries.query_get_prediction_by_uid")
-    def test_get_prediction_image_not_found(self, mock_query, _mock_s3_tmp):
+    def test_get_prediction_image_not_found(self, mock_query, _mock_s3_tmp, _mock_s3_open, _mock_s3_download):
         """
         כאשר הקובץ הלוקאלי לא קיים וגם הפולבק מ-S3 נכשל (mok ל-s3_download_to_temp מחזיר None),
         מצפים ל-404 עם ההודעה המתאימה.
@@ -1,6 +1,8 @@
 
 
 # tests/test_get_prediction_by_uid.py
+import os
+import tempfile
 import unittest
 from datetime import datetime
 from unittest.mock import patch, Mock
@@ -76,11 +78,14 @@ class TestGetPredictionByUID(unittest.TestCase):
 
         # המפתחות ל-S3 נגזרים מ-username (ברירת מחדל: anonymous), uid והסיומת .jpg
         assert data["s3_keys"]["original"].endswith(f"/{self.uid}.jpg")
-        assert data["s3_keys"]["predicted"].endswith(f"/{self.uid}.jpg")
 
         # presigned URLs צריכים להיות מה-mock שלנו
         assert data["s3_presigned"]["original"].startswith("https://signed.example/")
-        assert data["s3_presigned"]["predicted"].startswith("https://signed.example/")
+
+        # the annotated image was never rendered: no key / URL for it, only the render endpoint
+        assert data["s3_keys"]["predicted"] is None
+        assert data["s3_presigned"]["predicted"] is None
+        assert data["predicted_image_url"] == f"/prediction/{self.uid}/image"
 
     @patch("queries.query_get_prediction_by_uid")
     @patch("queries.query_get_objects_by_uid")
@@ -91,11 +96,15 @@ class TestGetPredictionByUID(unittest.TestCase):
         וש-URL חתום נבנה עם אותם מפתחות.
         """
         username = "myuser"
+        # a rendered annotated image exists locally
+        fd, predicted_image = tempfile.mkstemp(suffix=".png")
+        os.close(fd)
+        self.addCleanup(os.remove, predicted_image)
         mock_get_prediction.return_value = type("MockPrediction", (), {
             "uid": self.uid,
             "timestamp": datetime.fromisoformat("2025-08-30T10:20:30"),
             "original_image": "uploads/original/whatever.png",   # הסיומת כאן תקבע את ext
-            "predicted_image": "uploads/predicted/whatever.png",
+            "predicted_image": predicted_image,
             "username": username
         })()
 
@@ -118,6 +127,27 @@ class TestGetPredictionByUID(unittest.TestCase):
         self.assertIn(f"{username}/predicted/{self.uid}.png", data["s3_presigned"]["predicted"])
 
 
+    @patch("queries.query_get_prediction_by_uid")
+    @patch("queries.query_get_objects_by_uid", return_value=[])
+    def test_uploaded_prediction_on_another_replica(self, mock_get_objects, mock_get_prediction):
+        # no local files, but the rendered image was uploaded; the original came from ?img=
+        mock_get_prediction.return_value = type("MockPrediction", (), {
+            "uid": self.uid,
+            "timestamp": datetime.fromisoformat("2025-08-30T10:20:30"),
+            "original_image": "uploads/original/missing.png",
+            "predicted_image": "uploads/predicted/missing.png",
+            "username": "myuser",
+            "source_s3_key": "public/beatles.png",
+            "predicted_uploaded_at": datetime.fromisoformat("2025-08-30T10:21:00"),
+        })()
+
+        resp = self.client.get(f"/prediction/{self.uid}", headers=get_auth_headers("testuser", "testpass"))
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(data["s3_keys"]["original"], "public/beatles.png")
+        self.assertEqual(data["s3_keys"]["predicted"], f"myuser/predicted/{self.uid}.png")
+        self.assertIn(f"myuser/predicted/{self.uid}.png", data["s3_presigned"]["predicted"])
+
     @patch("queries.query_get_prediction_by_uid", return_value=None)
     def test_get_prediction_by_uid_not_found(self, mock_get_prediction):
         """
@@ -124,9 +124,11 @@ class TestGetPredictionImage(unittest.TestCase):
         self.assertEqual(resp.json(), {"detail": "Prediction not found"})
         mock_query.assert_called_once()
 
+    @patch("controllers.s3_download_to_path", return_value=False)
+    @patch("controllers.s3_open_object", return_value=None)
     @patch("controllers.s3_download_to_temp", return_value=None)  # מונע פולבק מוצלח מה-S3
     @patch("queries.query_get_prediction_by_uid")
-    def test_get_prediction_image_file_missing(self, mock_query, _mock_s3_tmp):
+    def test_get_prediction_image_file_missing(self, mock_query, _mock_s3_tmp, _mock_s3_open, _mock_s3_download):
         """
         אם הקובץ לוקאלית חסר וגם הפולבק ל-S3 נכשל — מצופה 404.
         """
@@ -0,0 +1,136 @@
+# tests/test_http_client.py
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+import http_client
+
+PAYLOAD = b"\xff\xd8" + b"j" * 4096
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(PAYLOAD)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSharedClient(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="test-http-")
+        http_client._metrics.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        http_client._metrics.reset()
+
+    def dest(self, name="a.jpg"):
+        return os.path.join(self.tmpdir, name)
+
+    def test_connections_are_reused(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f"http://127.0.0.1:{server.server_address[1]}/img.jpg"
+
+        with httpx.Client(limits=http_client._limits()) as client:
+            for i in range(5):
+                self.assertTrue(http_client.download(url, self.dest(f"{i}.jpg"), client=client))
+        with open(self.dest("4.jpg"), "rb") as f:
+            self.assertEqual(f.read(), PAYLOAD)
+
+        stats = http_client.metrics()
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["new_connections"], 1)
+        self.assertEqual(stats["reused_connections"], 4)
+        self.assertEqual(stats["bytes_downloaded"], 5 * len(PAYLOAD))
+
+    def test_declared_length_over_limit_is_rejected(self):
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=PAYLOAD))
+        with httpx.Client(transport=transport) as client:
+            self.assertFalse(http_client.download("http://cdn/a.jpg", self.dest(), client=client, max_bytes=100))
+        self.assertFalse(os.path.exists(self.dest()))
+        self.assertEqual(http_client.metrics()["rejected_too_large"], 1)
+
+    def test_streamed_body_over_limit_is_aborted(self):
+        def chunks():
+            for _ in range(10):
+                yield b"x" * 64
+
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=chunks()))
+
+        async def achunks():
+            for _ in range(10):
+                yield b"y" * 64
+
+        async def main():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(
+                    lambda request: httpx.Response(200, content=achunks()))) as client:
+                return await http_client.async_download("http://cdn/b.jpg", self.dest("b.jpg"),
+                                                        client=client, max_bytes=100)
+
+        with httpx.Client(transport=transport) as client:
+            self.assertFalse(http_client.download("http://cdn/a.jpg", self.dest(), client=client, max_bytes=100))
+        self.assertFalse(asyncio.run(main()))
+        self.assertFalse(os.path.exists(self.dest()))
+        self.assertFalse(os.path.exists(self.dest("b.jpg")))
+        self.assertEqual(http_client.metrics()["rejected_too_large"], 2)
+
+    def test_async_download_writes_off_the_event_loop(self):
+        threads = []
+        real_open = http_client._open_for_write
+
+        class RecordingFile:
+            def __init__(self, f):
+                self.f = f
+
+            def write(self, data):
+                threads.append(threading.get_ident())
+                return self.f.write(data)
+
+            def close(self):
+                threads.append(threading.get_ident())
+                self.f.close()
+
+        async def achunks():
+            for _ in range(8):
+                yield b"z" * 64
+
+        async def main():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(
+                    lambda request: httpx.Response(200, content=achunks()))) as client:
+                ok = await http_client.async_download("http://cdn/c.jpg", self.dest("c.jpg"), client=client)
+            return ok, threading.get_ident()
+
+        with patch.object(http_client, "HTTP_WRITE_BUFFER_SIZE", 128), \
+                patch.object(http_client, "_open_for_write",
+                                           lambda path: RecordingFile(real_open(path))):
+            ok, loop_thread = asyncio.run(main())
+
+        self.assertTrue(ok)
+        with open(self.dest("c.jpg"), "rb") as f:
+            self.assertEqual(f.read(), b"z" * 512)
+        self.assertEqual(len(threads), 5)   # four 128-byte blocks and the close
+        self.assertNotIn(loop_thread, threads)
+
+    def test_one_async_client_per_event_loop(self):
+        async def client_id():
+            return id(http_client.get_async_client()), id(http_client.get_async_client())
+
+        first, again = asyncio.run(client_id())
+        self.assertEqual(first, again)
@@ -0,0 +1,201 @@
+# tests/test_image_cache.py
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, Mock
+
+from fastapi.testclient import TestClient
+
+from app import app
+from db import get_db
+from image_cache import DiskObjectCache, image_cache
+from tests.utils import get_auth_headers
+
+
+def writer(data: bytes, calls=None):
+    def fetch(dest_path):
+        if calls is not None:
+            calls.append(dest_path)
+        with open(dest_path, "wb") as f:
+            f.write(data)
+        return True
+    return fetch
+
+
+class TestDiskObjectCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="test-image-cache-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_miss_then_hit(self):
+        cache = DiskObjectCache(self.tmpdir, max_bytes=1000)
+        calls = []
+        path = cache.get("u/original/a.jpg", writer(b"x" * 100, calls))
+        self.assertTrue(path.endswith(".jpg"))
+        self.assertEqual(cache.get("u/original/a.jpg", writer(b"y", calls)), path)
+        self.assertEqual(len(calls), 1)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"x" * 100)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["hit_ratio"], 0.5)
+        self.assertEqual(stats["bytes_served"], 100)
+        self.assertEqual(stats["bytes_fetched"], 100)
+
+    def test_evicts_least_recently_used(self):
+        cache = DiskObjectCache(self.tmpdir, max_bytes=250)
+        a = cache.get("a", writer(b"a" * 100))
+        cache.get("b", writer(b"b" * 100))
+        cache.get("a", writer(b""))           # a is now the most recently used
+        cache.get("c", writer(b"c" * 100))
+        self.assertTrue(os.path.exists(a))
+        self.assertEqual(list(cache._entries), ["a", "c"])
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual(cache.stats()["bytes"], 200)
+
+    def test_failed_fetch_is_not_cached(self):
+        cache = DiskObjectCache(self.tmpdir, max_bytes=1000)
+        self.assertIsNone(cache.get("k", Mock(return_value=False)))
+        self.assertIsNone(cache.get("k", Mock(side_effect=RuntimeError("boom"))))
+        self.assertEqual(cache.stats()["failed_fetches"], 2)
+        self.assertEqual(os.listdir(self.tmpdir), ["index.json"])
+
+    def test_index_survives_restart(self):
+        cache = DiskObjectCache(self.tmpdir, max_bytes=1000)
+        path = cache.get("a", writer(b"a" * 10))
+        cache.get("b", writer(b"b" * 10))
+        with open(os.path.join(self.tmpdir, "stale.part"), "wb") as f:
+            f.write(b"half a download")
+
+        restarted = DiskObjectCache(self.tmpdir, max_bytes=1000)
+        fetch = Mock()
+        self.assertEqual(restarted.get("a", fetch), path)
+        fetch.assert_not_called()
+        self.assertEqual(restarted.stats()["entries"], 2)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, "stale.part")))
+
+    def test_concurrent_misses_share_one_download(self):
+        cache = DiskObjectCache(self.tmpdir, max_bytes=1000)
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def slow_fetch(dest_path):
+            calls.append(dest_path)
+            started.set()
+            release.wait(5)
+            with open(dest_path, "wb") as f:
+                f.write(b"z" * 10)
+            return True
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            first = pool.submit(cache.get, "k", slow_fetch)
+            self.assertTrue(started.wait(5))
+            others = [pool.submit(cache.get, "k", slow_fetch) for _ in range(3)]
+            while cache.stats()["coalesced"] < 3:
+                threading.Event().wait(0.01)
+            release.set()
+            paths = {f.result(timeout=5) for f in [first, *others]}
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(paths), 1)
+        stats = cache.stats()
+        self.assertEqual((stats["misses"], stats["coalesced"]), (1, 3))
+        self.assertEqual(stats["bytes_served"], 30)
+
+    def test_checked_out_file_survives_eviction(self):
+        cache = DiskObjectCache(self.tmpdir, max_bytes=250)
+        link = cache.checkout("a", writer(b"a" * 100))
+        cache.get("b", writer(b"b" * 100))
+        cache.get("c", writer(b"c" * 100))      # evicts a
+        self.assertNotIn("a", cache._entries)
+        with open(link, "rb") as f:
+            self.assertEqual(f.read(), b"a" * 100)
+        cache.release(link)
+        self.assertFalse(os.path.exists(link))
+
+    def test_concurrent_eviction_while_serving(self):
+        cache = DiskObjectCache(self.tmpdir, max_bytes=300)
+        stop = threading.Event()
+        errors = []
+
+        def churn():
+            i = 0
+            while not stop.is_set():
+                cache.get(f"other-{i % 50}", writer(bytes([i % 256]) * 100))
+                i += 1
+
+        def serve(n):
+            for _ in range(n):
+                link = cache.checkout("hot", writer(b"h" * 100))
+                # hold the file until the churn has pushed "hot" out of the cache
+                evictions = cache.stats()["evictions"]
+                while cache.stats()["evictions"] < evictions + 3:
+                    threading.Event().wait(0.001)
+                try:
+                    with open(link, "rb") as f:
+                        if f.read() != b"h" * 100:
+                            errors.append("wrong content")
+                except OSError as e:
+                    errors.append(e)
+                finally:
+                    cache.release(link)
+
+        churner = threading.Thread(target=churn)
+        churner.start()
+        try:
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                for f in [pool.submit(serve, 20) for _ in range(4)]:
+                    f.result(timeout=30)
+        finally:
+            stop.set()
+            churner.join()
+        self.assertEqual(errors, [])
+        self.assertGreater(cache.stats()["evictions"], 0)
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir, "serving")), [])
+
+    def test_disabled(self):
+        cache = DiskObjectCache(self.tmpdir, max_bytes=0)
+        fetch = Mock()
+        self.assertIsNone(cache.get("k", fetch))
+        fetch.assert_not_called()
+
+
+class TestImageEndpointsUseCache(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+
+        def override_get_db():
+            yield Mock()
+        app.dependency_overrides[get_db] = override_get_db
+
+    def tearDown(self):
+        app.dependency_overrides = {}
+
+    def test_get_image_downloads_s3_key_once(self):
+        def download(key, dest_path):
+            with open(dest_path, "wb") as f:
+                f.write(b"\xff\xd8jpeg")
+            return True
+
+        with patch("controllers.s3_download_to_path", side_effect=download) as s3_download, \
+                patch("controllers.s3_open_object") as s3_open:
+            for _ in range(2):
+                resp = self.client.get("/image/original/gone.jpg?s3_key=alice/original/gone.jpg",
+                                       headers=get_auth_headers())
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual(resp.content, b"\xff\xd8jpeg")
+                self.assertEqual(resp.headers["content-type"], "image/jpeg")
+        s3_download.assert_called_once()
+        s3_open.assert_not_called()
+        # the private links handed to FileResponse are removed once the body was sent
+        self.assertEqual(os.listdir(os.path.join(image_cache.cache_dir, "serving")), [])
+
+        stats = self.client.get("/metrics/image-cache", headers=get_auth_headers()).json()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["bytes_served"], 6)
+        self.assertEqual(stats["cache_dir"], image_cache.cache_dir)
@@ -0,0 +1,109 @@
+# tests/test_inference.py
+import threading
+import time
+import unittest
+from unittest.mock import patch, Mock
+from fastapi.testclient import TestClient
+
+from app import app
+from db import get_db
+from imaging import InvalidImage
+from inference import BatchScheduler
+from tests.utils import get_auth_headers
+
+
+class TestBatchScheduler(unittest.TestCase):
+    def test_concurrent_requests_share_one_batch(self):
+        calls = []
+
+        def predict_fn(sources):
+            calls.append(list(sources))
+            return [f"result-{s}" for s in sources]
+
+        scheduler = BatchScheduler(predict_fn, max_batch_size=4, max_wait_ms=200)
+        futures = [scheduler.submit(i) for i in range(4)]
+        results = [f.result(timeout=5) for f in futures]
+
+        self.assertEqual(results, ["result-0", "result-1", "result-2", "result-3"])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0], [0, 1, 2, 3])
+
+        m = scheduler.metrics()
+        self.assertEqual(m["batches"], 1)
+        self.assertEqual(m["items"], 4)
+        self.assertEqual(m["batch_size_histogram"], {4: 1})
+        self.assertGreaterEqual(m["max_queue_wait_ms"], 0.0)
+
+    def test_batch_is_capped_at_max_batch_size(self):
+        gate = threading.Event()
+        sizes = []
+
+        def predict_fn(sources):
+            gate.wait(5)
+            sizes.append(len(sources))
+            return list(sources)
+
+        scheduler = BatchScheduler(predict_fn, max_batch_size=2, max_wait_ms=50)
+        futures = [scheduler.submit(i) for i in range(5)]
+        time.sleep(0.1)
+        gate.set()
+        self.assertEqual([f.result(timeout=5) for f in futures], [0, 1, 2, 3, 4])
+        self.assertTrue(all(s <= 2 for s in sizes))
+        self.assertEqual(sum(sizes), 5)
+
+    def test_model_error_is_propagated_to_every_caller(self):
+        def predict_fn(sources):
+            raise ValueError("boom")
+
+        scheduler = BatchScheduler(predict_fn, max_batch_size=2, max_wait_ms=50)
+        futures = [scheduler.submit(i) for i in range(2)]
+        for f in futures:
+            with self.assertRaises(ValueError):
+                f.result(timeout=5)
+        self.assertEqual(scheduler.metrics()["errors"], 1)
+
+    def test_bad_item_does_not_fail_the_rest_of_the_batch(self):
+        calls = []
+
+        def predict_fn(sources):
+            calls.append(list(sources))
+            # like ultralytics: unreadable sources are skipped, so fewer results come back
+            return [f"result-{s}" for s in sources if s != "bad"]
+
+        scheduler = BatchScheduler(predict_fn, max_batch_size=3, max_wait_ms=200)
+        futures = [scheduler.submit(s) for s in ("a", "bad", "b")]
+
+        self.assertEqual(futures[0].result(timeout=5), "result-a")
+        self.assertEqual(futures[2].result(timeout=5), "result-b")
+        with self.assertRaises(InvalidImage):
+            futures[1].result(timeout=5)
+        self.assertEqual(calls, [["a", "bad", "b"], ["a"], ["bad"], ["b"]])
+        m = scheduler.metrics()
+        self.assertEqual((m["errors"], m["item_errors"], m["retried_batches"]), (1, 1, 1))
+
+
+class TestInferenceMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+        self.p_auth = patch("auth_middleware.verify_user",
+                            lambda u, p: (u == "testuser" and p == "testpass"))
+        self.p_auth.start()
+        self.db = Mock()
+        def override_get_db():
+            yield self.db
+        app.dependency_overrides[get_db] = override_get_db
+
+    def tearDown(self):
+        app.dependency_overrides = {}
+        self.p_auth.stop()
+
+    def test_metrics_requires_auth(self):
+        resp = self.client.get("/metrics/inference")
+        self.assertEqual(resp.status_code, 401)
+
+    def test_metrics_shape(self):
+        resp = self.client.get("/metrics/inference", headers=get_auth_headers())
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        for key in ("max_batch_size", "queue_depth", "avg_batch_size", "p99_queue_wait_ms"):
+            self.assertIn(key, data)
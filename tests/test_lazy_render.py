@@ -0,0 +1,114 @@
+# tests/test_lazy_render.py
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import patch, Mock
+
+from PIL import Image
+from fastapi.testclient import TestClient
+
+from app import app
+from db import get_db
+from tests.utils import get_auth_headers
+
+
+class TestLazyRender(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+        self.p_auth = patch("auth_middleware.verify_user",
+                            lambda u, p: (u == "testuser" and p == "testpass"))
+        self.p_auth.start()
+        def override_get_db():
+            yield Mock()
+        app.dependency_overrides[get_db] = override_get_db
+
+        self.tmpdir = tempfile.mkdtemp(prefix="test-lazy-")
+        self.uid = "lazy-uid"
+        self.original_path = os.path.join(self.tmpdir, f"{self.uid}.png")
+        self.predicted_path = os.path.join(self.tmpdir, "predicted", f"{self.uid}.png")
+        os.makedirs(os.path.dirname(self.predicted_path))
+        Image.new("RGB", (40, 30), color=(0, 0, 0)).save(self.original_path)
+
+        self.session = SimpleNamespace(
+            uid=self.uid, timestamp=datetime.utcnow(), username="testuser",
+            original_image=self.original_path, predicted_image=self.predicted_path,
+        )
+        box = SimpleNamespace(label="person", score=0.9, box="[5.0, 5.0, 30.0, 25.0]")
+
+        self.patches = [
+            patch("queries.query_get_prediction_by_uid", return_value=self.session),
+            patch("queries.query_get_objects_by_uid", return_value=[box]),
+            patch("controllers.s3_download_to_temp", return_value=None),
+            patch("controllers.s3_configured", return_value=True),
+            patch("controllers.s3_open_object", return_value=None),
+            patch("controllers.s3_download_to_path", return_value=False),
+        ]
+        for p in self.patches:
+            p.start()
+        self.p_upload = patch("controllers.s3_upload_file", return_value=True)
+        self.mock_upload = self.p_upload.start()
+
+    def tearDown(self):
+        app.dependency_overrides = {}
+        for p in [self.p_auth, self.p_upload, *self.patches]:
+            p.stop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_first_request_renders_from_stored_boxes_then_serves_cache(self):
+        resp = self.client.get(f"/prediction/{self.uid}/image",
+                               headers={**get_auth_headers(), "Accept": "image/png"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(os.path.exists(self.predicted_path))
+
+        rendered = Image.open(self.predicted_path).convert("RGB")
+        self.assertNotEqual(rendered.getpixel((5, 15)), (0, 0, 0))   # box edge drawn
+        self.assertEqual(rendered.getpixel((20, 21)), (0, 0, 0))     # interior untouched
+
+        import controllers
+        self.assertTrue(controllers.s3_uploader.drain(timeout=5))
+        self.mock_upload.assert_called_once()
+        self.assertEqual(self.mock_upload.call_args[0][1], f"testuser/predicted/{self.uid}.png")
+
+        resp = self.client.get(f"/prediction/{self.uid}/image",
+                               headers={**get_auth_headers(), "Accept": "image/png"})
+        self.assertEqual(resp.status_code, 200)
+        self.mock_upload.assert_called_once()
+
+    def test_upload_is_recorded_on_the_session(self):
+        import controllers
+        with patch("queries.query_mark_predicted_uploaded") as mark, \
+                patch.object(controllers, "SessionLocal", Mock()):
+            resp = self.client.get(f"/prediction/{self.uid}/image", headers=get_auth_headers())
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(controllers.s3_uploader.drain(timeout=5))
+        mark.assert_called_once()
+        self.assertEqual(mark.call_args[0][1], self.uid)
+
+    def test_s3key_original_is_rendered_from_its_source_key(self):
+        # ?img= prediction served by a replica without the local original
+        source = os.path.join(self.tmpdir, "source.png")
+        shutil.copyfile(self.original_path, source)
+        os.remove(self.original_path)
+        self.session.source_s3_key = "public/beatles.png"
+
+        def download_to_temp(key, suffix=None):
+            if key != "public/beatles.png":
+                return None
+            tmp = os.path.join(self.tmpdir, "download.png")
+            shutil.copyfile(source, tmp)
+            return tmp
+
+        with patch("controllers.s3_download_to_temp", side_effect=download_to_temp):
+            resp = self.client.get(f"/prediction/{self.uid}/image", headers=get_auth_headers())
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(os.path.exists(self.predicted_path))
+
+    def test_get_image_renders_missing_predicted_file(self):
+        import controllers
+        with patch.object(controllers, "PREDICTED_DIR", os.path.dirname(self.predicted_path)):
+            resp = self.client.get(f"/image/predicted/{self.uid}.png", headers=get_auth_headers())
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(os.path.exists(self.predicted_path))
@@ -0,0 +1,86 @@
+# tests/test_pagination.py
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import app
+from db import Base, get_db
+# bound at import time: conftest stubs queries.query_save_prediction_session for endpoint tests
+from queries import query_save_prediction_session
+from tests.utils import get_auth_headers
+
+
+class TestKeysetPagination(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        with self.Session() as db:
+            for i in range(7):
+                query_save_prediction_session(db, f"uid-{i}", "o", "p", "u",
+                                              detections=[("person", 0.5 + i / 100, [0, 0, 1, 1])])
+            query_save_prediction_session(db, "cat-only", "o", "p", "u", detections=[("cat", 0.1, [0, 0, 1, 1])])
+
+        def override_get_db():
+            with self.Session() as db:
+                yield db
+        app.dependency_overrides[get_db] = override_get_db
+        self.p_auth = patch("auth_middleware.verify_user",
+                            lambda u, p: (u == "testuser" and p == "testpass"))
+        self.p_auth.start()
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        app.dependency_overrides = {}
+        self.p_auth.stop()
+        self.engine.dispose()
+
+    def walk(self, url):
+        uids, cursor, pages = [], None, 0
+        while True:
+            resp = self.client.get(url, params={"limit": 3, **({"cursor": cursor} if cursor else {})},
+                                   headers=get_auth_headers())
+            self.assertEqual(resp.status_code, 200)
+            data = resp.json()
+            uids += [x["uid"] for x in data["items"]]
+            pages += 1
+            cursor = data.get("next_cursor")
+            if not cursor:
+                return uids, pages
+
+    def test_pages_cover_every_match_once_newest_first(self):
+        uids, pages = self.walk("/predictions/label/person")
+        self.assertEqual(uids, [f"uid-{i}" for i in reversed(range(7))])
+        self.assertEqual(pages, 3)
+
+        uids, _ = self.walk("/predictions/score/0.55")
+        self.assertEqual(uids, ["uid-6", "uid-5"])
+
+    def test_new_predictions_do_not_shift_later_pages(self):
+        first = self.client.get("/predictions/label/person?limit=3", headers=get_auth_headers()).json()
+        with self.Session() as db:
+            query_save_prediction_session(db, "newer", "o", "p", "u", detections=[("person", 0.9, [0, 0, 1, 1])])
+        second = self.client.get("/predictions/label/person",
+                                 params={"limit": 3, "cursor": first["next_cursor"]},
+                                 headers=get_auth_headers()).json()
+        self.assertEqual([x["uid"] for x in second["items"]], ["uid-3", "uid-2", "uid-1"])
+
+    def test_same_timestamp_is_ordered_by_uid(self):
+        ts = datetime.utcnow() + timedelta(days=1)
+        with self.Session() as db:
+            from models import PredictionSession
+            for uid in ("tie-a", "tie-b", "tie-c"):
+                query_save_prediction_session(db, uid, "o", "p", "u", detections=[("dog", 0.5, [0, 0, 1, 1])])
+            db.query(PredictionSession).filter(PredictionSession.uid.like("tie-%")).update({"timestamp": ts})
+            db.commit()
+        uids, _ = self.walk("/predictions/label/dog")
+        self.assertEqual(uids, ["tie-c", "tie-b", "tie-a"])
+
+    def test_invalid_cursor(self):
+        resp = self.client.get("/predictions/label/person?cursor=not-a-cursor", headers=get_auth_headers())
+        self.assertEqual(resp.status_code, 400)
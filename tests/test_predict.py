@@ -61,12 +61,16 @@ class TestPredictEndpoint(unittest.TestCase):
         # Stub S3 upload so no real network call is performed
         self.p_s3_upload = patch("controllers.s3_upload_file", return_value=True)
         self.mock_s3_upload = self.p_s3_upload.start()
+        # open() is mocked in these tests, so nothing reaches disk for the uploader to send
+        self.p_enqueue = patch("controllers.s3_uploader.enqueue")
+        self.mock_enqueue = self.p_enqueue.start()
 
     def tearDown(self):
         app.dependency_overrides = {}
         try:
             self.p_auth.stop()
             self.p_s3_upload.stop()
+            self.p_enqueue.stop()
         except Exception:
             pass
 
@@ -123,14 +127,35 @@ class TestPredictEndpoint(unittest.TestCase):
             if self.mock_s3_upload is not None:
                 self.assertIn(self.mock_s3_upload.call_count, (0, 2))
         else:
-            # Legacy structure: only predicted_s3_key
+            # the annotated image is rendered on the first GET of predicted_image_url; no key until then
             self.assertIn("predicted_s3_key", data)
-            assert_keys_end_with(data["predicted_s3_key"], expected_ext, allow_jpg_fallback=True)
+            self.assertIsNone(data["predicted_s3_key"])
+            self.assertEqual(data["predicted_image_url"], f"/prediction/{data['prediction_uid']}/image")
 
         mock_save_session.assert_called_once()
         # Ensure local image save was attempted
         self.assertTrue(mock_save_img.called)
 
+    @patch("queries.query_save_prediction_session")
+    @patch("controllers.model")
+    @patch("shutil.copyfileobj")
+    @patch("builtins.open", new_callable=mock_open)
+    def test_predict_unreadable_image_returns_400(
+        self,
+        mock_open_func,
+        mock_copyfileobj,
+        mock_model,
+        mock_save_session,
+    ):
+        # YOLO skips sources it cannot read and returns no result for them
+        mock_model.return_value = []
+
+        files = {"file": ("broken.jpg", create_image_bytes(), "image/jpeg")}
+        resp = client.post("/predict", files=files, headers=get_auth_headers())
+
+        self.assertEqual(resp.status_code, 400)
+        mock_save_session.assert_not_called()
+
     @patch("queries.query_save_prediction_session")
     @patch("controllers.model")
     @patch("shutil.copyfileobj")
@@ -176,8 +201,10 @@ class TestPredictEndpoint(unittest.TestCase):
             if self.mock_s3_upload is not None:
                 self.assertIn(self.mock_s3_upload.call_count, (0, 2))
         else:
+            # the annotated image is rendered on the first GET of predicted_image_url; no key until then
             self.assertIn("predicted_s3_key", data)
-            assert_keys_end_with(data["predicted_s3_key"], expected_ext, allow_jpg_fallback=True)
+            self.assertIsNone(data["predicted_s3_key"])
+            self.assertEqual(data["predicted_image_url"], f"/prediction/{data['prediction_uid']}/image")
 
     @patch("queries.query_save_prediction_session")
     @patch("queries.query_save_detection_object")
@@ -226,7 +253,12 @@ class TestPredictEndpoint(unittest.TestCase):
         self.assertEqual(data.get("detection_count"), 2)
         self.assertIn("cat", data.get("labels", []))
         self.assertIn("dog", data.get("labels", []))
-        self.assertEqual(mock_save_detection.call_count, 2)
+        # session and both boxes are written by one bulk call
+        mock_save_detection.assert_not_called()
+        mock_save_session.assert_called_once()
+        saved = mock_save_session.call_args.kwargs["detections"]
+        self.assertEqual([d[0] for d in saved], ["cat", "dog"])
+        self.assertEqual(saved[1][2], [5, 6, 7, 8])
 
         if "s3" in data:
             s3 = data["s3"]
@@ -241,8 +273,10 @@ class TestPredictEndpoint(unittest.TestCase):
             if self.mock_s3_upload is not None:
                 self.assertIn(self.mock_s3_upload.call_count, (0, 2))
         else:
+            # the annotated image is rendered on the first GET of predicted_image_url; no key until then
             self.assertIn("predicted_s3_key", data)
-            assert_keys_end_with(data["predicted_s3_key"], expected_ext, allow_jpg_fallback=True)
+            self.assertIsNone(data["predicted_s3_key"])
+            self.assertEqual(data["predicted_image_url"], f"/prediction/{data['prediction_uid']}/image")
 
     @patch("queries.query_save_prediction_session")
     @patch("controllers.model")
@@ -281,11 +315,12 @@ class TestPredictEndpoint(unittest.TestCase):
             assert_keys_end_with(s3["predicted_key"], expected_ext, allow_jpg_fallback=True)
         else:
             if "predicted_s3_key" in data:
-                assert_keys_end_with(data["predicted_s3_key"], expected_ext, allow_jpg_fallback=True)
+                self.assertIsNone(data["predicted_s3_key"])
 
-        # If the service performed uploads, expect 2; if not, don't fail
-        if self.mock_s3_upload is not None:
-            self.assertIn(self.mock_s3_upload.call_count, (0, 2))
+        # Only the original is queued for upload by /predict; the annotated image is rendered
+        # and uploaded the first time it is requested
+        self.mock_enqueue.assert_called_once()
+        self.assertIn("/original/", self.mock_enqueue.call_args[0][1])
 
 
 
@@ -0,0 +1,164 @@
+# tests/test_predict_async.py
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch, Mock
+
+import httpx
+import numpy as np
+from PIL import Image
+from fastapi.testclient import TestClient
+
+from app import app
+from db import get_db
+from pipeline import Stage
+from s3_utils import async_http_download
+from tests.utils import get_auth_headers
+
+
+def png_bytes():
+    buf = io.BytesIO()
+    Image.new("RGB", (12, 12), color=(9, 9, 9)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class TestStages(unittest.TestCase):
+    def test_stage_runs_work_on_its_own_threads(self):
+        stage = Stage("unit", workers=2, max_queue=4)
+
+        async def main():
+            return await stage.run(lambda: threading.current_thread().name)
+
+        self.assertTrue(asyncio.run(main()).startswith("unit-"))
+        self.assertEqual(stage.submit(sum, [1, 2, 3]).result(timeout=5), 6)
+        m = stage.metrics()
+        self.assertEqual(m["completed"], 2)
+        self.assertEqual(m["queue_depth"], 0)
+        self.assertEqual(m["max_queue"], 4)
+
+    def test_full_queue_holds_producers_back(self):
+        stage = Stage("bounded", workers=1, max_queue=1)
+        gate = threading.Event()
+        first = stage.submit(gate.wait, 5)       # occupies the only worker
+        time.sleep(0.05)
+        second = stage.submit(lambda: "queued")  # fills the queue
+
+        async def third():
+            return await stage.run(lambda: "waited")
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pending = pool.submit(asyncio.run, third())
+            time.sleep(0.1)
+            self.assertFalse(pending.done())
+            self.assertEqual(stage.metrics()["blocked_submits"], 1)
+            gate.set()
+            self.assertEqual(pending.result(timeout=5), "waited")
+        self.assertTrue(first.result(timeout=5))
+        self.assertEqual(second.result(timeout=5), "queued")
+
+    def test_errors_reach_the_caller(self):
+        stage = Stage("failing", workers=1)
+        with self.assertRaises(ZeroDivisionError):
+            stage.submit(lambda: 1 / 0).result(timeout=5)
+        self.assertEqual(stage.metrics()["errors"], 1)
+
+class TestAsyncDownload(unittest.TestCase):
+    def test_async_http_download(self):
+        tmpdir = tempfile.mkdtemp(prefix="test-dl-")
+        self.addCleanup(shutil.rmtree, tmpdir, True)
+
+        def handler(request):
+            if request.url.path == "/missing.jpg":
+                return httpx.Response(404)
+            return httpx.Response(200, content=b"image-bytes")
+
+        async def main():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                ok = await async_http_download("http://x/a.jpg", os.path.join(tmpdir, "a.jpg"), client=client)
+                missing = await async_http_download("http://x/missing.jpg", os.path.join(tmpdir, "b.jpg"), client=client)
+                return ok, missing
+
+        ok, missing = asyncio.run(main())
+        self.assertTrue(ok)
+        self.assertFalse(missing)
+        with open(os.path.join(tmpdir, "a.jpg"), "rb") as f:
+            self.assertEqual(f.read(), b"image-bytes")
+
+
+class TestSlowS3DoesNotBlockPredict(unittest.TestCase):
+    def setUp(self):
+        self.p_auth = patch("auth_middleware.verify_user",
+                            lambda u, p: (u == "testuser" and p == "testpass"))
+        self.p_auth.start()
+        def override_get_db():
+            yield Mock()
+        app.dependency_overrides[get_db] = override_get_db
+
+        self.tmpdir = tempfile.mkdtemp(prefix="test-async-")
+        self.predicted_dir = os.path.join(self.tmpdir, "predicted")
+        os.makedirs(self.predicted_dir)
+        import controllers
+        self.patches = [
+            patch.object(controllers, "UPLOAD_DIR", self.tmpdir),
+            patch.object(controllers, "PREDICTED_DIR", self.predicted_dir),
+            patch("controllers.s3_upload_file", return_value=True),
+            patch("queries.query_save_prediction_session"),
+        ]
+        result = MagicMock()
+        result.boxes = []
+        result.plot.return_value = np.zeros((12, 12, 3), dtype=np.uint8)
+        self.mock_model = MagicMock(return_value=[result])
+        self.patches.append(patch("controllers.model", self.mock_model))
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        app.dependency_overrides = {}
+        for p in [self.p_auth, *self.patches]:
+            p.stop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_upload_completes_while_s3_download_is_stuck(self):
+        release = threading.Event()
+        data = png_bytes()
+
+        def slow_download(ref, dest_path):
+            release.wait(10)
+            with open(dest_path, "wb") as f:
+                f.write(data)
+            return True
+
+        with patch("controllers.s3_or_http_download", side_effect=slow_download), \
+                TestClient(app) as client, ThreadPoolExecutor(max_workers=1) as pool:
+            stuck = pool.submit(client.post, "/predict?img=slow.png", headers=get_auth_headers())
+
+            resp = client.post("/predict", files={"file": ("a.png", io.BytesIO(data), "image/png")},
+                               headers=get_auth_headers())
+            self.assertEqual(resp.status_code, 200)
+            self.assertFalse(stuck.done())
+
+            release.set()
+            self.assertEqual(stuck.result(timeout=10).status_code, 200)
+
+    def test_predict_does_not_render(self):
+        with TestClient(app) as client:
+            before = client.get("/metrics/pipeline", headers=get_auth_headers()).json()
+            resp = client.post("/predict", files={"file": ("b.png", io.BytesIO(png_bytes()), "image/png")},
+                               headers=get_auth_headers())
+            self.assertEqual(resp.status_code, 200)
+            after = client.get("/metrics/pipeline", headers=get_auth_headers()).json()
+
+        for stage in ("download", "decode", "inference", "render", "persist"):
+            self.assertIn(stage, after)
+        self.assertGreater(after["persist"]["completed"], before["persist"]["completed"])
+        self.assertIn("p99_latency_ms", after["persist"])
+        # the annotated image is only drawn when someone asks for it
+        self.assertEqual(after["render"]["completed"], before["render"]["completed"])
+        uid = resp.json()["prediction_uid"]
+        self.assertFalse(os.path.exists(os.path.join(self.predicted_dir, f"{uid}.png")))
@@ -0,0 +1,100 @@
+# tests/test_predict_in_memory.py
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch, Mock
+
+import numpy as np
+from PIL import Image
+from fastapi.testclient import TestClient
+
+from app import app
+from db import get_db
+from tests.utils import get_auth_headers
+
+
+def create_image_bytes():
+    img = Image.new("RGB", (20, 10), color=(255, 0, 0))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class TestPredictInMemory(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+        self.p_auth = patch("auth_middleware.verify_user",
+                            lambda u, p: (u == "testuser" and p == "testpass"))
+        self.p_auth.start()
+
+        self.db = Mock()
+        def override_get_db():
+            yield self.db
+        app.dependency_overrides[get_db] = override_get_db
+
+        self.tmpdir = tempfile.mkdtemp(prefix="test-inmem-")
+        os.makedirs(os.path.join(self.tmpdir, "predicted"))
+        import controllers
+        self.patches = [
+            patch.object(controllers, "PREDICT_IN_MEMORY", True),
+            patch("controllers.s3_configured", return_value=True),
+            patch.object(controllers, "UPLOAD_DIR", self.tmpdir),
+            patch.object(controllers, "PREDICTED_DIR", os.path.join(self.tmpdir, "predicted")),
+            patch("queries.query_save_prediction_session"),
+        ]
+        for p in self.patches:
+            p.start()
+        self.p_upload_bytes = patch("controllers.s3_upload_bytes", return_value=True)
+        self.mock_upload_bytes = self.p_upload_bytes.start()
+        self.p_upload_file = patch("controllers.s3_upload_file", return_value=True)
+        self.mock_upload_file = self.p_upload_file.start()
+
+        self.p_model = patch("controllers.model")
+        self.mock_model = self.p_model.start()
+        mock_result = MagicMock()
+        mock_result.boxes = []
+        mock_result.plot.return_value = np.zeros((10, 20, 3), dtype=np.uint8)
+        self.mock_model.return_value = [mock_result]
+
+    def tearDown(self):
+        app.dependency_overrides = {}
+        for p in [self.p_auth, self.p_upload_bytes, self.p_upload_file, self.p_model, *self.patches]:
+            p.stop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_upload_is_decoded_in_memory_and_persisted_after(self):
+        data = create_image_bytes()
+        resp = self.client.post(
+            "/predict",
+            files={"file": ("red.png", io.BytesIO(data), "image/png")},
+            headers=get_auth_headers(),
+        )
+        self.assertEqual(resp.status_code, 200)
+        uid = resp.json()["prediction_uid"]
+
+        # the model got a decoded BGR array, not a path
+        sources = self.mock_model.call_args[0][0]
+        self.assertIsInstance(sources[0], np.ndarray)
+        self.assertEqual(sources[0].shape, (10, 20, 3))
+        self.assertEqual(sources[0][0, 0].tolist(), [0, 0, 255])
+
+        # original persisted by the background task, from the same bytes
+        with open(os.path.join(self.tmpdir, f"{uid}.png"), "rb") as f:
+            self.assertEqual(f.read(), data)
+        # and handed to the background uploader from disk
+        import controllers
+        self.assertTrue(controllers.s3_uploader.drain(timeout=5))
+        self.mock_upload_file.assert_called_once()
+        self.assertEqual(self.mock_upload_file.call_args[0][1], f"testuser/original/{uid}.png")
+        self.mock_upload_bytes.assert_not_called()
+
+    def test_invalid_image_is_rejected(self):
+        resp = self.client.post(
+            "/predict",
+            files={"file": ("broken.jpg", io.BytesIO(b"not an image"), "image/jpeg")},
+            headers=get_auth_headers(),
+        )
+        self.assertEqual(resp.status_code, 400)
+        self.mock_model.assert_not_called()
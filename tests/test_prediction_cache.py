@@ -0,0 +1,135 @@
+# tests/test_prediction_cache.py
+import io
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch, Mock
+
+import numpy as np
+from PIL import Image
+from fastapi.testclient import TestClient
+
+from app import app
+from db import get_db
+from prediction_cache import PredictionCache, make_key
+from tests.utils import get_auth_headers
+
+
+class TestPredictionCacheUnit(unittest.TestCase):
+    def test_key_depends_on_model_and_params(self):
+        k1 = make_key("abc", "torch:yolov8n.pt", {"conf": 0.25})
+        self.assertEqual(k1, make_key("abc", "torch:yolov8n.pt", {"conf": 0.25}))
+        self.assertNotEqual(k1, make_key("abc", "onnx:yolov8n.pt", {"conf": 0.25}))
+        self.assertNotEqual(k1, make_key("abc", "torch:yolov8n.pt", {"conf": 0.5}))
+        self.assertNotEqual(k1, make_key("abd", "torch:yolov8n.pt", {"conf": 0.25}))
+
+    def test_lru_eviction_and_stats(self):
+        cache = PredictionCache(max_entries=2)
+        cache.put("a", [("cat", 0.9, [1, 2, 3, 4])])
+        cache.put("b", [])
+        self.assertIsNotNone(cache.get("a"))   # a becomes most recent
+        cache.put("c", [])                     # evicts b
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), [("cat", 0.9, [1.0, 2.0, 3.0, 4.0])])
+
+        stats = cache.stats()
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 1)
+        self.assertAlmostEqual(stats["hit_rate"], 0.6667, places=3)
+
+    def test_disabled_cache(self):
+        cache = PredictionCache(max_entries=0)
+        cache.put("a", [])
+        self.assertIsNone(cache.get("a"))
+
+    @patch("queries.query_save_cached_detections")
+    @patch("queries.query_get_cached_detections", return_value=[("dog", 0.5, [0, 0, 1, 1])])
+    def test_persistent_tier(self, mock_get, mock_save):
+        cache = PredictionCache(max_entries=4, persist=True)
+        db = Mock()
+        self.assertEqual(cache.get("k", db), [("dog", 0.5, [0, 0, 1, 1])])
+        self.assertEqual(cache.stats()["db_hits"], 1)
+        # now served from memory
+        cache.get("k", db)
+        mock_get.assert_called_once()
+
+        cache.put("k2", [], db)
+        mock_save.assert_called_once_with(db, "k2", [])
+
+
+class TestPredictUsesCache(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+        self.p_auth = patch("auth_middleware.verify_user",
+                            lambda u, p: (u == "testuser" and p == "testpass"))
+        self.p_auth.start()
+        self.db = Mock()
+        def override_get_db():
+            yield self.db
+        app.dependency_overrides[get_db] = override_get_db
+
+        self.tmpdir = tempfile.mkdtemp(prefix="test-cache-")
+        import controllers
+        self.patches = [
+            patch.object(controllers, "UPLOAD_DIR", self.tmpdir),
+            patch.object(controllers, "PREDICTED_DIR", self.tmpdir),
+            patch("controllers.s3_upload_file", return_value=True),
+        ]
+        for p in self.patches:
+            p.start()
+        self.p_save = patch("queries.query_save_prediction_session")
+        self.mock_save = self.p_save.start()
+
+        box = MagicMock()
+        box.cls = [MagicMock(item=MagicMock(return_value=0))]
+        box.conf = [0.75]
+        box.xyxy = [np.array([1, 2, 8, 9])]
+        result = MagicMock()
+        result.boxes = [box]
+        result.plot.return_value = np.zeros((10, 10, 3), dtype=np.uint8)
+        self.p_model = patch("controllers.model")
+        self.mock_model = self.p_model.start()
+        self.mock_model.names = {0: "cat"}
+        self.mock_model.return_value = [result]
+
+    def tearDown(self):
+        app.dependency_overrides = {}
+        for p in [self.p_auth, self.p_save, self.p_model, *self.patches]:
+            p.stop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _post(self):
+        buf = io.BytesIO()
+        Image.new("RGB", (10, 10), color=(1, 2, 3)).save(buf, format="PNG")
+        buf.seek(0)
+        return self.client.post("/predict", files={"file": ("a.png", buf, "image/png")}, headers=get_auth_headers())
+
+    def test_duplicate_image_skips_inference(self):
+        first = self._post().json()
+        second = self._post().json()
+
+        self.assertFalse(first["cache_hit"])
+        self.assertTrue(second["cache_hit"])
+        self.assertEqual(self.mock_model.call_count, 1)
+        self.assertEqual(first["labels"], second["labels"])
+        self.assertNotEqual(first["prediction_uid"], second["prediction_uid"])
+        # both predictions still get their own detection rows
+        self.assertEqual(self.mock_save.call_count, 2)
+        for call in self.mock_save.call_args_list:
+            self.assertEqual(call.kwargs["detections"], [("cat", 0.75, [1, 2, 8, 9])])
+
+        stats = self.client.get("/metrics/prediction-cache", headers=get_auth_headers()).json()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_key_is_built_from_the_params_the_model_receives(self):
+        import controllers
+        controllers.prediction_cache.clear()
+        with patch("controllers.make_key", wraps=make_key) as key:
+            self.assertEqual(self._post().status_code, 200)
+
+        call_params = dict(self.mock_model.call_args.kwargs)
+        call_params.pop("device")
+        self.assertEqual(set(call_params), {"imgsz", "conf", "iou", "max_det"})
+        self.assertEqual(key.call_args.args[2], call_params)
@@ -0,0 +1,108 @@
+# tests/test_presign_cache.py
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import patch, Mock
+
+from fastapi.testclient import TestClient
+
+import s3_utils
+from app import app
+from db import get_db
+from tests.utils import get_auth_headers
+
+
+def fake_client(credentials_expiry=None):
+    client = Mock()
+    client.generate_presigned_url.side_effect = lambda op, Params, ExpiresIn: (
+        f"https://signed.example/{Params['Key']}?exp={ExpiresIn}&n={client.generate_presigned_url.call_count}"
+    )
+    client._request_signer._credentials = SimpleNamespace(_expiry_time=credentials_expiry)
+    return client
+
+
+class TestPresignCache(unittest.TestCase):
+    def setUp(self):
+        s3_utils.presign_cache.clear()
+        self.patches = [
+            patch.object(s3_utils, "AWS_S3_BUCKET", "bucket"),
+            patch("s3_utils.has_s3_credentials", return_value=True),
+        ]
+        self.has_credentials = [p.start() for p in self.patches][1]
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        s3_utils.presign_cache.clear()
+
+    def test_reused_until_shortly_before_expiry(self):
+        client = fake_client()
+        with patch.object(s3_utils, "_s3", client):
+            first = s3_utils.s3_presign_get_url("a.jpg", 3600)
+            self.assertEqual(s3_utils.s3_presign_get_url("a.jpg", 3600), first)
+            self.assertEqual(client.generate_presigned_url.call_count, 1)
+            self.assertEqual(self.has_credentials.call_count, 1)
+
+            almost = s3_utils.monotonic() + 3600 - s3_utils.S3_PRESIGN_REFRESH_MARGIN + 1
+            with patch("s3_utils.monotonic", return_value=almost):
+                self.assertNotEqual(s3_utils.s3_presign_get_url("a.jpg", 3600), first)
+        self.assertEqual(client.generate_presigned_url.call_count, 2)
+        stats = s3_utils.presign_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    def test_keyed_by_expiry(self):
+        client = fake_client()
+        with patch.object(s3_utils, "_s3", client):
+            short = s3_utils.s3_presign_get_url("a.jpg", 600)
+            long = s3_utils.s3_presign_get_url("a.jpg", 3600)
+        self.assertIn("exp=600", short)
+        self.assertIn("exp=3600", long)
+
+    def test_not_reused_past_credential_expiry(self):
+        expiry = datetime.now(timezone.utc) + timedelta(seconds=200)
+        client = fake_client(credentials_expiry=expiry)
+        with patch.object(s3_utils, "_s3", client):
+            s3_utils.s3_presign_get_url("a.jpg", 3600)
+            s3_utils.s3_presign_get_url("a.jpg", 3600)
+        # 200s of credentials left is less than the refresh margin: nothing is cached
+        self.assertEqual(client.generate_presigned_url.call_count, 2)
+
+    def test_refresh_client_clears(self):
+        client = fake_client()
+        with patch.object(s3_utils, "_s3", client):
+            s3_utils.s3_presign_get_url("a.jpg", 3600)
+        with patch("s3_utils._make_client", return_value=client):
+            s3_utils.refresh_client()
+        self.assertEqual(s3_utils.presign_cache.stats()["entries"], 0)
+
+
+class TestPredictionExpiresIn(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+
+        def override_get_db():
+            yield Mock()
+        app.dependency_overrides[get_db] = override_get_db
+
+    def tearDown(self):
+        app.dependency_overrides = {}
+
+    @patch("queries.query_get_objects_by_uid", return_value=[])
+    @patch("queries.query_get_prediction_by_uid")
+    def test_expires_in_is_passed_to_presign(self, mock_get, _mock_objects):
+        fd, predicted_image = tempfile.mkstemp(suffix=".png")   # already rendered
+        os.close(fd)
+        self.addCleanup(os.remove, predicted_image)
+        mock_get.return_value = SimpleNamespace(uid="u1", timestamp=datetime(2025, 1, 1), username="alice",
+                                                original_image="uploads/original/u1.png",
+                                                predicted_image=predicted_image)
+        with patch("controllers.s3_presign_get_url", return_value="https://signed") as presign:
+            resp = self.client.get("/prediction/u1?expires_in=900", headers=get_auth_headers())
+            self.assertEqual(resp.status_code, 200)
+            presign.assert_any_call("alice/original/u1.png", 900)
+            presign.assert_any_call("alice/predicted/u1.png", 900)
+
+            resp = self.client.get("/prediction/u1?expires_in=10", headers=get_auth_headers())
+            self.assertEqual(resp.status_code, 422)
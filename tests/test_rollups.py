@@ -0,0 +1,97 @@
+# tests/test_rollups.py
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import queries
+import rollups
+from db import Base
+from models import PredictionSession, HourlyPredictionRollup, HourlyLabelRollup
+# conftest replaces queries.query_save_prediction_session with a stub; keep the real one
+from queries import query_save_prediction_session
+
+
+def snapshot(engine):
+    with engine.connect() as conn:
+        hours = {
+            r.hour: (r.predictions, r.detections, round(r.score_sum, 6))
+            for r in conn.execute(select(HourlyPredictionRollup))
+        }
+        labels = {
+            (r.hour, r.label): (r.detections, round(r.score_sum, 6))
+            for r in conn.execute(select(HourlyLabelRollup)) if r.detections
+        }
+    return hours, labels
+
+
+class TestHourlyRollups(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+
+    def tearDown(self):
+        self.db.close()
+        self.engine.dispose()
+
+    def save(self, uid, detections):
+        query_save_prediction_session(self.db, uid, "o.jpg", "p.jpg", "alice",
+                                      detections=[(label, score, [0, 0, 1, 1]) for label, score in detections])
+
+    def test_save_and_delete_update_rollups(self):
+        self.save("a", [("cat", 0.9), ("cat", 0.7), ("dog", 0.5)])
+        self.save("b", [("dog", 0.3)])
+        self.save("c", [])
+
+        self.assertEqual(queries.query_get_prediction_count_last_week(self.db), 3)
+        self.assertEqual(sorted(queries.query_get_labels_from_last_week(self.db)), ["cat", "dog"])
+        stats = queries.query_get_prediction_stats(self.db)
+        self.assertEqual(stats["total_predictions"], 3)
+        self.assertEqual(stats["average_confidence_score"], 0.6)
+        self.assertEqual(stats["most_common_labels"], {"cat": 2, "dog": 2})
+
+        queries.query_delete_prediction(self.db, "a")
+        self.assertEqual(queries.query_get_prediction_count_last_week(self.db), 2)
+        self.assertEqual(queries.query_get_labels_from_last_week(self.db), ["dog"])
+        stats = queries.query_get_prediction_stats(self.db)
+        self.assertEqual(stats["most_common_labels"], {"dog": 1})
+        self.assertEqual(stats["average_confidence_score"], 0.3)
+
+    def test_rebuild_matches_incremental(self):
+        self.save("a", [("cat", 0.9), ("dog", 0.5)])
+        self.save("b", [("cat", 0.4)])
+        queries.query_save_detection_object(self.db, "b", "bird", 0.2, "[0, 0, 2, 2]")
+        self.save("c", [("dog", 0.8)])
+        queries.query_delete_prediction(self.db, "c")
+        # an older prediction written before rollups existed
+        self.db.add(PredictionSession(uid="old", timestamp=datetime.utcnow() - timedelta(days=3)))
+        self.db.commit()
+        rollups.apply(self.db, datetime.utcnow() - timedelta(days=3), [])
+        self.db.commit()
+
+        incremental = snapshot(self.engine)
+        rollups.rebuild(self.engine)
+        self.assertEqual(snapshot(self.engine), incremental)
+
+    def test_reads_only_rollup_tables(self):
+        self.save("a", [("cat", 0.9)])
+        statements = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        queries.query_get_prediction_stats(self.db)
+        queries.query_get_prediction_count_last_week(self.db)
+        queries.query_get_labels_from_last_week(self.db)
+        self.assertEqual(len(statements), 4)
+        for statement in statements:
+            self.assertNotIn("prediction_sessions", statement)
+            self.assertNotIn("detection_objects", statement)
+
+    def test_window_is_168_hours(self):
+        now = datetime.utcnow()
+        for hours_ago in (0, 167, 168):
+            rollups.apply(self.db, now - timedelta(hours=hours_ago), [("cat", 1.0)])
+        self.db.commit()
+        self.assertEqual(queries.query_get_prediction_count_last_week(self.db), 2)
@@ -0,0 +1,62 @@
+# tests/test_s3_credentials.py
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch, Mock
+
+import s3_utils
+
+
+def fake_session(access_key="AKIA", expiry=None):
+    creds = Mock(spec=["get_frozen_credentials", "_expiry_time"])
+    creds.get_frozen_credentials.return_value = Mock(access_key=access_key, secret_key="secret")
+    creds._expiry_time = expiry
+    sess = Mock()
+    sess.get_credentials.return_value = creds if access_key else None
+    return sess
+
+
+class TestCredentialCheckCache(unittest.TestCase):
+    def setUp(self):
+        s3_utils.invalidate_credentials()
+
+    def tearDown(self):
+        s3_utils.invalidate_credentials()
+
+    def test_resolved_once_within_ttl(self):
+        with patch("s3_utils._make_session", return_value=fake_session()) as make:
+            self.assertTrue(all(s3_utils.has_s3_credentials() for _ in range(10)))
+        self.assertEqual(make.call_count, 1)
+
+    def test_rechecked_after_ttl(self):
+        with patch("s3_utils._make_session", return_value=fake_session()) as make:
+            self.assertTrue(s3_utils.has_s3_credentials())
+            later = s3_utils.monotonic() + s3_utils.S3_CREDENTIALS_TTL + 1
+            with patch("s3_utils.monotonic", return_value=later):
+                self.assertTrue(s3_utils.has_s3_credentials())
+        self.assertEqual(make.call_count, 2)
+
+    def test_missing_credentials_rechecked_sooner(self):
+        with patch("s3_utils._make_session", return_value=fake_session(access_key=None)) as make:
+            self.assertFalse(s3_utils.has_s3_credentials())
+            self.assertFalse(s3_utils.has_s3_credentials())
+            later = s3_utils.monotonic() + s3_utils.S3_CREDENTIALS_NEGATIVE_TTL + 1
+            with patch("s3_utils.monotonic", return_value=later):
+                s3_utils.has_s3_credentials()
+        self.assertEqual(make.call_count, 2)
+
+    def test_temporary_credentials_rechecked_before_expiry(self):
+        expiry = datetime.now(timezone.utc) + timedelta(seconds=90)
+        ok, ttl = s3_utils._check_credentials(fake_session(expiry=expiry))
+        self.assertTrue(ok)
+        self.assertLessEqual(ttl, 30.5)
+
+        expired = datetime.now(timezone.utc) + timedelta(seconds=10)
+        self.assertEqual(s3_utils._check_credentials(fake_session(expiry=expired)), (True, 0.0))
+
+    def test_refresh_client_drops_cached_answer(self):
+        with patch("s3_utils._make_session", return_value=fake_session()) as make, \
+                patch("s3_utils._make_client"), patch.object(s3_utils, "_s3"):
+            s3_utils.has_s3_credentials()
+            s3_utils.refresh_client()
+            s3_utils.has_s3_credentials()
+        self.assertEqual(make.call_count, 2)
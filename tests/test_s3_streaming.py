@@ -0,0 +1,94 @@
+# tests/test_s3_streaming.py
+import io
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import patch, Mock
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from fastapi.testclient import TestClient
+
+import s3_utils
+from app import app
+from db import get_db
+from image_cache import image_cache
+from tests.utils import get_auth_headers
+
+PAYLOAD = bytes(range(256)) * 1024   # 256 KiB, several chunks
+
+
+def s3_object(data=PAYLOAD, content_type="image/jpeg"):
+    body = StreamingBody(io.BytesIO(data), len(data))
+    body.close = Mock(wraps=body.close)
+    return {"body": body, "content_length": len(data), "content_type": content_type, "etag": '"abc"'}
+
+
+class TestStreamFromS3(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+
+        def override_get_db():
+            yield Mock()
+        app.dependency_overrides[get_db] = override_get_db
+        self.p_tmp = patch("controllers.s3_download_to_temp",
+                           side_effect=AssertionError("must not download to a temp file"))
+        self.p_tmp.start()
+        # with the image cache turned off, objects are streamed straight from S3
+        self.p_cache = patch.object(image_cache, "max_bytes", 0)
+        self.p_cache.start()
+
+    def tearDown(self):
+        app.dependency_overrides = {}
+        self.p_tmp.stop()
+        self.p_cache.stop()
+
+    def test_get_image_streams_s3_key(self):
+        obj = s3_object()
+        with patch("controllers.s3_open_object", return_value=obj) as open_object:
+            resp = self.client.get("/image/original/missing-file.jpg?s3_key=alice/original/x.jpg",
+                                   headers=get_auth_headers())
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, PAYLOAD)
+        self.assertEqual(resp.headers["content-length"], str(len(PAYLOAD)))
+        self.assertEqual(resp.headers["content-type"], "image/jpeg")
+        self.assertEqual(resp.headers["etag"], '"abc"')
+        open_object.assert_called_once_with("alice/original/x.jpg")
+        obj["body"].close.assert_called()
+
+    def test_prediction_image_streams_from_s3_when_local_missing(self):
+        session = SimpleNamespace(uid="u1", timestamp=datetime.utcnow(), username="alice",
+                                  original_image="uploads/original/gone.png",
+                                  predicted_image="uploads/predicted/gone.png")
+        with patch("queries.query_get_prediction_by_uid", return_value=session), \
+                patch("controllers.s3_open_object", return_value=s3_object(content_type=None)) as open_object:
+            resp = self.client.get("/prediction/u1/image", headers=get_auth_headers())
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, PAYLOAD)
+        self.assertEqual(resp.headers["content-type"], "image/png")
+        open_object.assert_called_once_with("alice/predicted/u1.png")
+
+
+class TestOpenObject(unittest.TestCase):
+    def test_missing_key_returns_none(self):
+        client = Mock()
+        client.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey", "Message": "nope"}}, "GetObject")
+        with patch.object(s3_utils, "_s3", client), patch.object(s3_utils, "AWS_S3_BUCKET", "bucket"):
+            self.assertIsNone(s3_utils.s3_open_object("k"))
+
+    def test_body_is_not_read_up_front(self):
+        body = Mock()
+        client = Mock()
+        client.get_object.return_value = {"Body": body, "ContentLength": 3, "ContentType": "image/png", "ETag": "e"}
+        with patch.object(s3_utils, "_s3", client), patch.object(s3_utils, "AWS_S3_BUCKET", "bucket"):
+            obj = s3_utils.s3_open_object("k")
+        self.assertEqual(obj["content_length"], 3)
+        body.read.assert_not_called()
+        body.iter_chunks.assert_not_called()
+
+    def test_iter_closes_body_when_client_disconnects(self):
+        obj = s3_object()
+        chunks = s3_utils.iter_s3_body(obj["body"], chunk_size=1024)
+        next(chunks)
+        chunks.close()
+        obj["body"].close.assert_called()
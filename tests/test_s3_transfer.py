@@ -0,0 +1,37 @@
+# tests/test_s3_transfer.py
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, Mock
+
+import s3_utils
+
+
+class TestTransferSettings(unittest.TestCase):
+    def test_transfer_config(self):
+        cfg = s3_utils.make_transfer_config(threshold_mb=16, chunksize_mb=4, max_concurrency=6)
+        self.assertEqual(cfg.multipart_threshold, 16 * 1024 * 1024)
+        self.assertEqual(cfg.multipart_chunksize, 4 * 1024 * 1024)
+        self.assertEqual(cfg.max_request_concurrency, 6)
+        self.assertTrue(cfg.use_threads)
+        self.assertFalse(s3_utils.make_transfer_config(max_concurrency=1).use_threads)
+
+    def test_client_config(self):
+        cfg = s3_utils.make_client_config(max_pool_connections=64, tcp_keepalive=True)
+        self.assertEqual(cfg.max_pool_connections, 64)
+        self.assertTrue(cfg.tcp_keepalive)
+
+    def test_transfers_use_transfer_config(self):
+        fd, path = tempfile.mkstemp(suffix=".jpg")
+        os.close(fd)
+        client = Mock()
+        try:
+            with patch.object(s3_utils, "_s3", client), \
+                    patch.object(s3_utils, "AWS_S3_BUCKET", "bucket"), \
+                    patch("s3_utils.has_s3_credentials", return_value=True):
+                self.assertTrue(s3_utils.s3_upload_file(path, "k.jpg"))
+                self.assertTrue(s3_utils.s3_download_to_path("k.jpg", path))
+        finally:
+            os.remove(path)
+        self.assertIs(client.upload_file.call_args.kwargs["Config"], s3_utils.TRANSFER_CONFIG)
+        self.assertIs(client.download_file.call_args.kwargs["Config"], s3_utils.TRANSFER_CONFIG)
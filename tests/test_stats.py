@@ -1,11 +1,18 @@
 
 # tests/test_stats_endpoint.py
 import unittest
+from datetime import datetime, timedelta
 from unittest.mock import patch, Mock
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
+import queries
+import rollups
 from app import app
-from db import get_db
+from db import Base, get_db
+from models import PredictionSession, DetectionObject
 from tests.utils import get_auth_headers
 
 
@@ -63,6 +70,63 @@ class TestStatsEndpoint(unittest.TestCase):
         self.assertEqual(resp.status_code, 401)
         self.assertEqual(resp.json(), {"detail": "Missing credentials"})
 
+    @patch("queries.query_get_prediction_stats",
+           return_value={"total_predictions": 0, "average_confidence_score": 0.0, "most_common_labels": {}})
+    def test_stats_passes_window_and_top_k(self, mock_stats):
+        resp = self.client.get(
+            "/stats?top_k=3&since=2025-01-01T02:00:00%2B02:00&until=2025-01-08T00:00:00",
+            headers=get_auth_headers(),
+        )
+        self.assertEqual(resp.status_code, 200)
+        kwargs = mock_stats.call_args.kwargs
+        self.assertEqual(kwargs["top_k"], 3)
+        self.assertEqual(kwargs["since"], datetime(2025, 1, 1, 0, 0))
+        self.assertEqual(kwargs["until"], datetime(2025, 1, 8, 0, 0))
+
+
+class TestStatsQuery(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        now = datetime.utcnow()
+        sessions = {
+            "a": (now - timedelta(days=1), [("cat", 0.9), ("cat", 0.7), ("dog", 0.5)]),
+            "b": (now - timedelta(days=2), [("dog", 0.3)]),
+            "c": (now - timedelta(days=3), []),
+            "old": (now - timedelta(days=30), [("cat", 0.1)]),
+        }
+        for uid, (ts, dets) in sessions.items():
+            self.db.add(PredictionSession(uid=uid, timestamp=ts))
+            for label, score in dets:
+                self.db.add(DetectionObject(prediction_uid=uid, label=label, score=score, box="[0, 0, 1, 1]"))
+        self.db.commit()
+        rollups.rebuild(self.engine)
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def tearDown(self):
+        self.db.close()
+        self.engine.dispose()
+
+    def test_last_week_in_two_queries(self):
+        stats = queries.query_get_prediction_stats(self.db)
+        self.assertEqual(stats["total_predictions"], 3)
+        self.assertEqual(stats["average_confidence_score"], 0.6)
+        self.assertEqual(stats["most_common_labels"], {"cat": 2, "dog": 2})
+        self.assertEqual(len(self.statements), 2)
+
+    def test_window_and_top_k(self):
+        now = datetime.utcnow()
+        stats = queries.query_get_prediction_stats(self.db, since=now - timedelta(days=60),
+                                                   until=now - timedelta(days=1, hours=1), top_k=1)
+        self.assertEqual(stats["total_predictions"], 3)   # b, c, old
+        self.assertEqual(stats["most_common_labels"], {"cat": 1})
+        self.assertEqual(stats["average_confidence_score"], 0.2)
+
 
 # import unittest
 # from unittest.mock import patch
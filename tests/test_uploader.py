@@ -0,0 +1,125 @@
+# tests/test_uploader.py
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import Mock
+
+from uploader import S3Uploader, UploadNotConfigured
+
+
+class TestS3Uploader(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="test-uploader-")
+        self.spool = os.path.join(self.tmpdir, "spool")
+        self.file = os.path.join(self.tmpdir, "img.jpg")
+        with open(self.file, "wb") as f:
+            f.write(b"data")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def journal(self, sub=""):
+        path = os.path.join(self.spool, sub)
+        return sorted(n for n in os.listdir(path) if n.endswith(".json")) if os.path.isdir(path) else []
+
+    def test_uploads_and_clears_journal(self):
+        upload = Mock(return_value=True)
+        uploader = S3Uploader(upload, spool_dir=self.spool, workers=2)
+        uploader.enqueue(self.file, "u/original/a.jpg", {"Metadata": {"user": "u"}})
+        self.assertTrue(uploader.drain(timeout=5))
+        upload.assert_called_once_with(self.file, "u/original/a.jpg", extra_args={"Metadata": {"user": "u"}})
+        self.assertEqual(self.journal(), [])
+        self.assertEqual(uploader.metrics()["uploaded"], 1)
+
+    def test_on_uploaded_runs_only_after_success(self):
+        on_uploaded = Mock(side_effect=RuntimeError("db down"))
+        uploader = S3Uploader(Mock(side_effect=[True, False]), spool_dir=self.spool,
+                              max_attempts=1, on_uploaded=on_uploaded)
+        uploader.enqueue(self.file, "u/predicted/a.jpg", {"Metadata": {"prediction_uid": "a"}})
+        self.assertTrue(uploader.drain(timeout=5))
+        on_uploaded.assert_called_once_with(self.file, "u/predicted/a.jpg", {"Metadata": {"prediction_uid": "a"}})
+        # a failing callback does not turn the upload into a failure
+        self.assertEqual(uploader.metrics()["uploaded"], 1)
+        uploader.enqueue(self.file, "u/predicted/b.jpg")
+        self.assertTrue(uploader.drain(timeout=5))
+        on_uploaded.assert_called_once()
+
+    def test_retries_with_backoff_then_succeeds(self):
+        upload = Mock(side_effect=[False, RuntimeError("slow down"), True])
+        uploader = S3Uploader(upload, spool_dir=self.spool, retry_base=0.01, retry_max=0.05)
+        uploader.enqueue(self.file, "k")
+        self.assertTrue(uploader.drain(timeout=5))
+        self.assertEqual(upload.call_count, 3)
+        metrics = uploader.metrics()
+        self.assertEqual(metrics["failed_attempts"], 2)
+        self.assertEqual(metrics["uploaded"], 1)
+        self.assertEqual(self.journal(), [])
+
+    def test_gives_up_into_failed_dir(self):
+        uploader = S3Uploader(Mock(return_value=False), spool_dir=self.spool,
+                              max_attempts=2, retry_base=0.01)
+        job_id = uploader.enqueue(self.file, "k")
+        self.assertTrue(uploader.drain(timeout=5))
+        self.assertEqual(self.journal(), [])
+        self.assertEqual(self.journal("failed"), [f"{job_id}.json"])
+        with open(os.path.join(self.spool, "failed", f"{job_id}.json")) as f:
+            self.assertEqual(json.load(f)["attempts"], 2)
+        self.assertEqual(uploader.metrics()["dead_lettered"], 1)
+
+    def test_pending_uploads_survive_restart(self):
+        release = threading.Event()
+        blocked = S3Uploader(lambda *a, **k: release.wait(5) and False, spool_dir=self.spool,
+                             retry_base=60)
+        blocked.enqueue(self.file, "k1")
+        blocked.enqueue(self.file, "k2")
+        self.assertEqual(len(self.journal()), 2)
+        metrics = blocked.metrics()
+        self.assertEqual(metrics["queue_depth"] + metrics["running"], 2)
+        self.assertGreaterEqual(metrics["oldest_pending_age_s"], 0.0)
+
+        # a new process finds both entries in the spool and uploads them
+        upload = Mock(return_value=True)
+        restarted = S3Uploader(upload, spool_dir=self.spool)
+        restarted.start()
+        self.assertTrue(restarted.drain(timeout=5))
+        self.assertEqual(sorted(c.args[1] for c in upload.call_args_list), ["k1", "k2"])
+        self.assertEqual(restarted.metrics()["recovered_on_start"], 2)
+        blocked.reset()
+        release.set()
+
+    def test_missing_file_is_dropped(self):
+        upload = Mock(return_value=True)
+        uploader = S3Uploader(upload, spool_dir=self.spool)
+        uploader.enqueue(os.path.join(self.tmpdir, "deleted.jpg"), "k")
+        self.assertTrue(uploader.drain(timeout=5))
+        upload.assert_not_called()
+        self.assertEqual(self.journal(), [])
+        self.assertEqual(uploader.metrics()["dropped_missing_file"], 1)
+
+    def test_not_configured_is_skipped_or_dropped(self):
+        upload = Mock(side_effect=UploadNotConfigured("no bucket"))
+        skipping = S3Uploader(upload, spool_dir=self.spool, configured=lambda: False)
+        self.assertIsNone(skipping.enqueue(self.file, "k"))
+        self.assertEqual(self.journal(), [])
+
+        # configured when queued, gone by the time it runs: dropped, not retried
+        uploader = S3Uploader(upload, spool_dir=self.spool, retry_base=0.01)
+        uploader.enqueue(self.file, "k")
+        self.assertTrue(uploader.drain(timeout=5))
+        upload.assert_called_once()
+        self.assertEqual(self.journal(), [])
+        self.assertEqual(self.journal("failed"), [])
+        self.assertEqual(uploader.metrics()["dropped_not_configured"], 1)
+
+    def test_failed_dir_keeps_only_the_newest_entries(self):
+        uploader = S3Uploader(Mock(return_value=False), spool_dir=self.spool, max_attempts=1, failed_max=2)
+        job_ids = []
+        for i in range(4):
+            job_ids.append(uploader.enqueue(self.file, f"k{i}"))
+            self.assertTrue(uploader.drain(timeout=5))
+            os.utime(os.path.join(self.spool, "failed", f"{job_ids[-1]}.json"), (i, i))
+        self.assertEqual(self.journal("failed"), sorted(f"{j}.json" for j in job_ids[-2:]))
+        self.assertEqual(uploader.metrics()["failed_pruned"], 2)
@@ -0,0 +1,135 @@
+# tests/test_worker_pool.py
+import io
+import os
+import time
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from inference import WorkerPool, LiteResult, resolve_worker_count
+
+
+class _MeanBox:
+    def __init__(self, arr):
+        h, w = arr.shape[:2]
+        self.xyxy = [np.array([0.0, 0.0, float(w), float(h)])]
+        self.cls = [np.float32(0)]
+        self.conf = [np.float32(arr.mean() / 255.0)]
+
+
+class _FakeResult:
+    def __init__(self, arr, conf=0.0):
+        box = _MeanBox(arr)
+        self.boxes = [box] if box.conf[0] >= conf else []
+
+
+class FakeModel:
+    # runs inside the worker process; reports one full-frame box per image
+    names = {0: "blob"}
+
+    def __call__(self, arrays, device="cpu", conf=0.0, **kwargs):
+        return [_FakeResult(a, conf) for a in arrays]
+
+
+class CrashingModel(FakeModel):
+    # a pure red image kills the worker process, like a segfault in native code would
+    def __call__(self, arrays, device="cpu", **kwargs):
+        if any(a[..., 2].min() == 255 and a[..., :2].max() == 0 for a in arrays):
+            os._exit(3)
+        return super().__call__(arrays, device, **kwargs)
+
+
+def fake_factory(weights):
+    return FakeModel()
+
+
+def crashing_factory(weights):
+    return CrashingModel()
+
+
+def failing_factory(weights):
+    os._exit(4)
+
+
+def png_bytes(color, size=(16, 8)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color=color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class TestWorkerPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = WorkerPool("unused.pt", workers=2, model_factory=fake_factory, timeout=60)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_batch_roundtrip_through_shared_memory(self):
+        white = np.full((8, 16, 3), 255, dtype=np.uint8)
+        results = self.pool([white, png_bytes((0, 0, 0))], device="cpu")
+
+        self.assertEqual(len(results), 2)
+        self.assertIsInstance(results[0], LiteResult)
+        self.assertEqual(self.pool.names, {0: "blob"})
+
+        box = results[0].boxes[0]
+        self.assertEqual(int(box.cls[0].item()), 0)
+        self.assertAlmostEqual(float(box.conf[0]), 1.0, places=3)
+        self.assertEqual(box.xyxy[0].tolist(), [0.0, 0.0, 16.0, 8.0])
+        self.assertAlmostEqual(float(results[1].boxes[0].conf[0]), 0.0, places=3)
+
+        plotted = results[0].plot()
+        self.assertEqual(plotted.shape, (8, 16, 3))
+        self.assertEqual(self.pool.metrics()["tasks_completed"], 1)
+
+    def test_inference_params_reach_the_worker(self):
+        gray = np.full((8, 16, 3), 128, dtype=np.uint8)
+        self.assertEqual(len(self.pool([gray], device="cpu", conf=0.25)[0].boxes), 1)
+        self.assertEqual(len(self.pool([gray], device="cpu", conf=0.9)[0].boxes), 0)
+
+
+class TestWorkerPoolCrash(unittest.TestCase):
+    def test_dead_worker_fails_its_task_and_is_replaced(self):
+        pool = WorkerPool("unused.pt", workers=1, model_factory=crashing_factory, timeout=60)
+        self.addCleanup(pool.close)
+        red = np.zeros((8, 16, 3), dtype=np.uint8)
+        red[..., 2] = 255   # BGR
+
+        with self.assertRaisesRegex(RuntimeError, "died"):
+            pool([red])
+        results = pool([np.full((8, 16, 3), 255, dtype=np.uint8)])
+        self.assertEqual(len(results), 1)
+
+        stats = pool.metrics()
+        self.assertEqual(stats["worker_restarts"], 1)
+        self.assertEqual(stats["tasks_failed"], 1)
+        self.assertEqual(stats["workers_alive"], 1)
+
+    def test_workers_that_never_start_fail_fast(self):
+        pool = WorkerPool("unused.pt", workers=2, model_factory=failing_factory, timeout=60)
+        self.addCleanup(pool.close)
+        with self.assertLogs("inference", level="ERROR") as logs:
+            t0 = time.monotonic()
+            with self.assertRaisesRegex(RuntimeError, "could start"):
+                pool([np.zeros((8, 16, 3), dtype=np.uint8)])
+            self.assertLess(time.monotonic() - t0, 30)
+            time.sleep(1.5)   # a few more collector polls
+            with self.assertRaisesRegex(RuntimeError, "could start"):
+                pool.names
+
+        # each slot is reported once, not on every poll
+        self.assertEqual(sum("before becoming ready" in line for line in logs.output), 2)
+        stats = pool.metrics()
+        self.assertEqual(stats["worker_start_failures"], 2)
+        self.assertEqual(stats["workers_alive"], 0)
+
+
+class TestResolveWorkerCount(unittest.TestCase):
+    def test_values(self):
+        self.assertEqual(resolve_worker_count("0"), 0)
+        self.assertEqual(resolve_worker_count("3"), 3)
+        self.assertGreaterEqual(resolve_worker_count("auto", threads_per_worker=1), 1)
+        self.assertEqual(resolve_worker_count("not-a-number"), 0)
@@ -0,0 +1,306 @@
+# uploader.py
+"""
+Background S3 uploads with a local spool.
+
+Every upload is written to `UPLOAD_SPOOL_DIR` as a small JSON journal entry
+before it is queued, and the entry is removed only after S3 accepted the file.
+Failed attempts are retried with exponential backoff; entries left over from a
+previous run are picked up again on start. After `UPLOAD_MAX_ATTEMPTS` the entry
+is moved to `<spool>/failed/` instead of being dropped; only the newest
+`UPLOAD_FAILED_MAX` entries are kept there.
+
+When the destination is not configured at all, nothing is journaled: `enqueue`
+skips the upload, and a job whose upload raises UploadNotConfigured is dropped
+instead of being retried.
+"""
+import os
+import json
+import heapq
+import uuid
+import random
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", "uploads/spool")
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", "10"))
+UPLOAD_RETRY_BASE = float(os.getenv("UPLOAD_RETRY_BASE", "1"))
+UPLOAD_RETRY_MAX = float(os.getenv("UPLOAD_RETRY_MAX", "300"))
+# dead-lettered entries kept in <spool>/failed/; the oldest are removed beyond this
+UPLOAD_FAILED_MAX = int(os.getenv("UPLOAD_FAILED_MAX", "1000"))
+
+
+class UploadNotConfigured(Exception):
+    """Raised by the upload callable when retrying cannot help (no bucket / no credentials)."""
+
+
+class S3Uploader:
+    """
+    `upload(local_path, key, extra_args=...)` returns True on success; False or an
+    exception counts as a failed attempt, except UploadNotConfigured, which drops the job.
+    `configured()` is checked by `enqueue`; when it returns False the upload is skipped.
+    `on_uploaded(local_path, key, extra_args)` runs after each successful upload; its errors are only logged.
+    """
+
+    def __init__(self, upload: Callable, spool_dir: str = UPLOAD_SPOOL_DIR, workers: int = UPLOAD_WORKERS,
+                 max_attempts: int = UPLOAD_MAX_ATTEMPTS, retry_base: float = UPLOAD_RETRY_BASE,
+                 retry_max: float = UPLOAD_RETRY_MAX, configured: Callable[[], bool] = lambda: True,
+                 failed_max: int = UPLOAD_FAILED_MAX, on_uploaded: Optional[Callable] = None):
+        self.upload = upload
+        self.configured = configured
+        self.on_uploaded = on_uploaded
+        self.failed_max = max(0, failed_max)
+        self.spool_dir = spool_dir
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+
+        self._cond = threading.Condition()
+        self._heap = []          # (next_attempt_at, seq, job)
+        self._seq = 0
+        self._running = {}       # job id -> job
+        self._threads = []
+        self._generation = 0
+
+        self._uploaded = 0
+        self._failed_attempts = 0
+        self._dead = 0
+        self._missing = 0
+        self._not_configured = 0
+        self._failed_pruned = 0
+        self._recovered = 0
+
+    # ---- journal -------------------------------------------------------
+
+    def _journal_path(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.json")
+
+    def _write_journal(self, job: dict) -> None:
+        path = self._journal_path(job["id"])
+        tmp = f"{path}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, json.dumps(job).encode("utf-8"))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp, path)
+
+    def _remove_journal(self, job: dict) -> None:
+        try:
+            os.remove(self._journal_path(job["id"]))
+        except FileNotFoundError:
+            pass
+
+    def _dead_letter(self, job: dict) -> None:
+        failed_dir = os.path.join(self.spool_dir, "failed")
+        os.makedirs(failed_dir, exist_ok=True)
+        self._write_journal(job)
+        os.replace(self._journal_path(job["id"]), os.path.join(failed_dir, f"{job['id']}.json"))
+        self._prune_failed(failed_dir)
+
+    def _prune_failed(self, failed_dir: str) -> None:
+        entries = []
+        for name in os.listdir(failed_dir):
+            if name.endswith(".json"):
+                path = os.path.join(failed_dir, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except FileNotFoundError:
+                    pass
+        if len(entries) <= self.failed_max:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.failed_max]:
+            try:
+                os.remove(path)
+                self._failed_pruned += 1
+            except FileNotFoundError:
+                pass
+
+    def _recover(self) -> None:
+        os.makedirs(self.spool_dir, exist_ok=True)
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.spool_dir, name)) as f:
+                    job = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable spool entry {name}: {e}")
+                continue
+            self._push(job)
+            self._recovered += 1
+        if self._recovered:
+            logger.info(f"Recovered {self._recovered} pending uploads from {self.spool_dir}")
+
+    # ---- queue ---------------------------------------------------------
+
+    def _push(self, job: dict) -> None:
+        self._seq += 1
+        heapq.heappush(self._heap, (job["next_attempt_at"], self._seq, job))
+        self._cond.notify()
+
+    def start(self) -> None:
+        with self._cond:
+            if self._threads:
+                return
+            self._recover()
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"s3-upload-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def enqueue(self, local_path: str, key: str, extra_args: Optional[dict] = None) -> Optional[str]:
+        """Journals the upload, then queues it. Returns the job id (None when uploads are not configured)."""
+        if not self.configured():
+            with self._cond:
+                self._not_configured += 1
+            logger.debug(f"Skipping upload of {local_path}: destination not configured")
+            return None
+        self.start()
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "local_path": local_path,
+            "key": key,
+            "extra_args": extra_args,
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now,
+            "last_error": None,
+        }
+        self._write_journal(job)
+        with self._cond:
+            self._push(job)
+        return job["id"]
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    now = time.time()
+                    if self._heap and self._heap[0][0] <= now:
+                        _, _, job = heapq.heappop(self._heap)
+                        self._running[job["id"]] = job
+                        generation = self._generation
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+
+            ok, error = self._attempt(job)
+            if ok:
+                self._notify_uploaded(job)
+
+            with self._cond:
+                self._running.pop(job["id"], None)
+                if generation == self._generation:
+                    try:
+                        self._finish(job, ok, error)
+                    except OSError as e:
+                        # journal I/O failed; the job stays in memory and is retried later
+                        logger.error(f"Upload spool error for {job['id']}: {e}")
+                        job["next_attempt_at"] = time.time() + self.retry_max
+                        self._push(job)
+                self._cond.notify_all()
+
+    def _finish(self, job: dict, ok: bool, error: Optional[str]) -> None:
+        if ok:
+            self._uploaded += 1
+            self._remove_journal(job)
+        elif error == "missing":
+            self._missing += 1
+            self._remove_journal(job)
+        elif error == "not configured":
+            self._not_configured += 1
+            self._remove_journal(job)
+        else:
+            self._failed_attempts += 1
+            job["attempts"] += 1
+            job["last_error"] = error
+            if job["attempts"] >= self.max_attempts:
+                self._dead += 1
+                logger.error(f"Giving up on s3://{job['key']} after {job['attempts']} attempts: {error}")
+                self._dead_letter(job)
+            else:
+                job["next_attempt_at"] = time.time() + self._backoff(job["attempts"])
+                self._write_journal(job)
+                self._push(job)
+
+    def _notify_uploaded(self, job: dict) -> None:
+        if self.on_uploaded is None:
+            return
+        try:
+            self.on_uploaded(job["local_path"], job["key"], job["extra_args"])
+        except Exception as e:
+            logger.error(f"on_uploaded failed for s3://{job['key']}: {e}")
+
+    def _attempt(self, job: dict):
+        if not os.path.isfile(job["local_path"]):
+            # the prediction was deleted before its upload ran
+            logger.warning(f"Dropping upload of {job['local_path']}: file no longer exists")
+            return False, "missing"
+        try:
+            if self.upload(job["local_path"], job["key"], extra_args=job["extra_args"]):
+                return True, None
+            return False, "upload returned False"
+        except UploadNotConfigured as e:
+            logger.warning(f"Dropping upload of {job['local_path']}: {e}")
+            return False, "not configured"
+        except Exception as e:
+            return False, f"{type(e).__name__}: {e}"
+
+    # ---- inspection ----------------------------------------------------
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Waits until nothing is queued or running. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._heap or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def reset(self, spool_dir: Optional[str] = None) -> None:
+        """Forgets queued jobs (their journal entries stay on disk) and optionally switches the spool dir."""
+        with self._cond:
+            self._generation += 1
+            self._heap.clear()
+            self._running.clear()
+            if spool_dir is not None:
+                self.spool_dir = spool_dir
+                os.makedirs(spool_dir, exist_ok=True)
+            self._uploaded = self._failed_attempts = self._dead = self._missing = self._recovered = 0
+            self._not_configured = self._failed_pruned = 0
+            self._cond.notify_all()
+
+    def metrics(self) -> dict:
+        with self._cond:
+            pending = [job for _, _, job in self._heap] + list(self._running.values())
+            oldest = min((job["created_at"] for job in pending), default=None)
+            return {
+                "workers": self.workers,
+                "queue_depth": len(self._heap),
+                "running": len(self._running),
+                "retrying": sum(1 for _, _, job in self._heap if job["attempts"]),
+                "oldest_pending_age_s": round(time.time() - oldest, 3) if oldest is not None else 0.0,
+                "uploaded": self._uploaded,
+                "failed_attempts": self._failed_attempts,
+                "dead_lettered": self._dead,
+                "dropped_missing_file": self._missing,
+                "dropped_not_configured": self._not_configured,
+                "failed_pruned": self._failed_pruned,
+                "recovered_on_start": self._recovered,
+                "spool_dir": self.spool_dir,
+            }